@@ -1,14 +1,30 @@
+import asyncio
 import json
 import logging
-from typing import List, Union
+import time
+from typing import List, Optional, Tuple
 
 import aiohttp
 
-from app.ai.emotion_model import EmotionModel
+from app.ai.context_window import apply_context_window, count_tokens
+from app.ai.conversation_summary import get_conversation_summarizer
+from app.ai.model_registry import get_emotion_batcher
+from app.ai.prepared_turns import get_prepared_turns
+from app.ai.providers import Provider, get_provider_router, request_completion
+from app.ai.response_cache import ResponseCache, collect_completion, get_response_cache, replay_chunks
+from app.ai.semantic_cache import get_semantic_cache
+from app.ai.stage_timings import stage_timings
+from app.ai.stream_coalescer import DeltaCoalescer
+from app.ai.stream_metrics import stream_metrics
+from app.ai.usage_meter import get_usage_meter, parse_usage
 from app.core.config import settings
-from app.exceptions.aimo_exceptions import AIMOException
+from app.core.http_client import get_http_session
+from app.exceptions.aimo_exceptions import AIMOException, UpstreamException
+from app.exceptions.deadline_exceptions import DeadlineException
 from app.models.chat import Message
-from app.utils.prompt_manager import PromptManager
+from app.utils.deadline import bounded_timeout, check_deadline, within_deadline
+from app.utils.prompt_manager import get_prompt_manager
+from app.utils.sse_utils import DONE, encode_data_frame, iter_sse_payloads
 
 """
 Author: Jack Pan, Wesley Xu
@@ -26,19 +42,8 @@ Usage:
 """
 
 
-def decode_response(line) -> Union[dict, None]:
-    """
-    Decode the response from the LLM API
-    """
-    decoded_line = line.decode('utf-8').strip()
-    if decoded_line.startswith("data: "):  # SEE data usually starts with "data: "
-        json_data = decoded_line[6:]  # Remove the "data: " prefix
-        try:
-            event_data = json.loads(json_data)
-            return event_data
-        except json.JSONDecodeError:
-            pass
-    return None
+# Marks the end of the upstream stream in the frame queue
+_END_OF_STREAM = object()
 
 
 class AIMO:
@@ -46,10 +51,10 @@ class AIMO:
     AIMO class for handling chat-based interactions with a language model.
 
     Attributes:
-        emotion_model (EmotionModel): Pre-trained model for emotion analysis.
+        emotion_model (EmotionModel): Pre-trained model for emotion analysis (None with remote inference).
+        emotion_batcher (EmotionBatcher): Runs emotion inference off the event loop (or in the inference server).
         api_key (str): The API key for accessing the LLM API.
-        url (str): The URL for the LLM API endpoint.
-        headers (dict): The headers for the API request.
+        router (ProviderRouter): Routes the requests over the LLM API endpoints.
     """
 
     def __init__(self):
@@ -58,110 +63,430 @@ class AIMO:
         self.api_key = settings.REDPILL_API_KEY
         if not self.api_key:
             raise ValueError("API Key not found, please set the environment variable REDPILL_API_KEY")
-        # LLM API endpoint
-        self.url = "https://api.red-pill.ai/v1/chat/completions"
-        # API headers
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        # Load emotion model
-        self.emotion_model = EmotionModel()
-
-        # Initialize the prompt manager
-        self.prompt_manager = PromptManager()
+        # The LLM API endpoints, requests go to the currently fastest one and fail over to the others
+        self.router = get_provider_router()
+        # Use the process-wide emotion model, loaded only once per worker
+        self.emotion_batcher = get_emotion_batcher()
+        self.emotion_model = self.emotion_batcher.emotion_model
 
-        # Load the current system prompt
-        prompt_data = self.prompt_manager.get_prompt()
-        self._self_cognition = prompt_data["self_cognition"]
-        self._guidelines = prompt_data["guidelines"]
-        self._rules = prompt_data["rules"]
-        self._overall_style = prompt_data["overall_style"]
+        # The process-wide prompt manager, which keeps the current system prompt up to date in every worker
+        self.prompt_manager = get_prompt_manager()
 
-    def get_constructed_api_messages(self, messages: List[Message]) -> List[dict]:
+    async def get_constructed_api_messages(self, messages: List[Message], conversation_id: str = None,
+                                           user: str = None, prepared: bool = False) -> List[dict]:
         last_message = messages.pop()
         # Check if the last message is from the user
         if last_message.role != "user":
             raise AIMOException("The last message must be from the user")
         user_input = last_message.content
+        # Time spent before (authentication, waiting for a worker) may have used up the budget already
+        check_deadline("the preparation of the request")
+        started = time.perf_counter()
+        # Only look for a prepared turn when the client says it prepared one, or this worker did (no lookup cost otherwise)
+        prepared = settings.CHAT_PREPARE_ENABLED and (prepared or get_prepared_turns().prepared_here(user_input))
+
+        # Emotion inference takes longest, the history is prepared and the upstream connection warmed up meanwhile
+        async def timed_emotions():
+            emotions = await self._turn_emotions(user_input) if prepared else await self._predict_emotions(user_input)
+            return emotions, time.perf_counter() - started
+
+        emotion_task = asyncio.create_task(timed_emotions())
+        if settings.LLM_PREWARM_ENABLED:
+            self.router.prewarm()
+        try:
+            api_messages = None
+            if prepared:
+                # Built by POST /chat/prepare while the user was typing
+                api_messages = get_prepared_turns().history(self._history_key(messages, user_input, conversation_id, user))
+            if api_messages is None:
+                api_messages = await self._prepare_history(messages, user_input, conversation_id, user)
+            history_time = time.perf_counter() - started
+            emotions, emotion_time = await emotion_task
+        finally:
+            # The history could not be prepared (or the request was cancelled)
+            emotion_task.cancel()
+        stage_timings.record_preparation(emotion_time, history_time, time.perf_counter() - started)
 
-        # Analyze emotion
-        emotions = self.emotion_model.predict(user_input)
         formatted_input = f"User input: {user_input} | Emotion: {', '.join(emotions) if emotions else 'neutral'}"
         logging.info(f"🧠 Recognized emotions: {emotions}")
+        api_messages[-1] = {"role": "user", "content": formatted_input}
+        # A summary refresh of the history may have used up the rest of the budget
+        check_deadline("the LLM API request")
+        # Keep the system prompt and the newest turns within the token budget
+        return apply_context_window(api_messages)
+
+    async def prepare_turn(self, messages: List[Message], conversation_id: str = None,
+                           user: str = None) -> Tuple[str, Optional[List[str]]]:
+        """
+        Run emotion inference and build the upstream messages of a draft turn before it is sent
+
+        The completion request of the same conversation then reuses both (see prepared_turns).
+
+        :return: The hash of the draft user message and its emotions (None if inference was skipped)
+        """
+        if not messages or messages[-1].role != "user":
+            raise AIMOException("The last message must be from the user", 400)
+        history, user_input = list(messages[:-1]), messages[-1].content
+        prepared = get_prepared_turns()
+        emotion_task = prepared.prepare_emotions(user_input, lambda: self._predict_emotions(user_input))
+        key = self._history_key(history, user_input, conversation_id, user)
+        if prepared.history(key) is None:
+            prepared.set_history(key, await self._prepare_history(history, user_input, conversation_id, user))
+        return prepared.message_hash(user_input), await asyncio.shield(emotion_task)
+
+    async def _turn_emotions(self, user_input: str) -> Optional[List[str]]:
+        """Emotion tags of a user input sent to POST /chat/prepare, inferred now if the prepared ones expired"""
+        try:
+            emotions = await get_prepared_turns().emotions(
+                user_input, bounded_timeout(reserve=settings.EMOTION_DEADLINE_RESERVE))
+        except asyncio.TimeoutError:
+            logging.warning("Emotion inference skipped, the request deadline is too close")
+            return None
+        if emotions is not None:
+            return emotions
+        return await self._predict_emotions(user_input)
+
+    def _history_key(self, history: List[Message], user_input: str, conversation_id: Optional[str],
+                     user: Optional[str]) -> str:
+        return get_prepared_turns().history_key(user, conversation_id, [dict(message) for message in history],
+                                                user_input, self.prompt_manager.snapshot.version)
+
+    async def _prepare_history(self, messages: List[Message], user_input: str, conversation_id: str = None,
+                               user: str = None) -> List[dict]:
+        """
+        The upstream messages before the emotion tags are known, the user input last without its tags
 
-        # Prepare API request data
+        :param messages: The conversation without the current user message
+        :param user_input: The current user message
+        :param conversation_id: Optional conversation id of the summary
+        :param user: The user of the conversation, the summary is kept per user
+        """
         # Add system prompt if the first message is not from the system
         if not messages or messages[0].role != "system":
             api_messages = [{"role": "system", "content": self.system_prompt}] + messages
         else:
             api_messages = messages
-        # Add user input to the messages
-        api_messages.append({"role": "user", "content": formatted_input})
-        return [dict(api_message) for api_message in api_messages]
-
-    async def get_response(self, messages: List[Message], temperature: float = 1.32, max_new_tokens: int = 500):
+        # Add user input to the messages, replaced by the tagged input once the emotions are known
+        api_messages.append({"role": "user", "content": user_input})
+        api_messages = [dict(api_message) for api_message in api_messages]
+        # Replace the old turns of long conversations with their running summary
+        if settings.CHAT_SUMMARY_ENABLED:
+            api_messages = await get_conversation_summarizer().compact(api_messages, conversation_id, user)
+        return api_messages
+
+    async def get_response(self, messages: List[Message], temperature: float = 1.32, max_new_tokens: int = 500,
+                           conversation_id: str = None, user: str = None, cache: bool = False):
         """
         Generate response asynchronously using LLM API
         """
+        content, _ = await self.get_completion(messages, temperature, max_new_tokens, conversation_id, user, cache)
+        return content
+
+    async def get_completion(self, messages: List[Message], temperature: float = 1.32, max_new_tokens: int = 500,
+                             conversation_id: str = None, user: str = None, cache: bool = False,
+                             prepared: bool = False) -> Tuple[str, Optional[dict]]:
+        """
+        Generate a response and return it with the token usage reported by the LLM API (None if not reported)
+
+        Deterministic requests (and requests with cache=True) are served from the response cache, and
+        short first-turn messages from the semantic cache, when enabled. prepared tells that the client
+        sent the turn to POST /chat/prepare before.
+        """
+        params = self._request_params(temperature, max_new_tokens)
+        probe = await self._semantic_probe(messages, params)
+        if probe and probe[2]:
+            return probe[2]["content"], probe[2]["usage"]
+
         # Construct API messages
-        api_messages = self.get_constructed_api_messages(messages)
+        api_messages = await self.get_constructed_api_messages(messages, conversation_id, user, prepared)
 
         data = {
             "messages": api_messages,
-            "model": "deepseek/deepseek-chat",
-            "max_tokens": max_new_tokens,
-            "temperature": temperature,
-            "top_p": 0.9,
+            **params,
             "stream": False
         }
-
-        # Send asynchronous API request
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.url, headers=self.headers, json=data) as response:
-                if response.status != 200:
-                    logging.error(f"Failed to get response from LLM API: {response.status}"
-                                  f"Content: {response.content}")
-                    raise AIMOException(f"Failed to get response from LLM API")
-                result = await response.json()
-                return result["choices"][0]["message"]["content"]
-
-    async def get_response_stream(self, messages: List[Message], temperature: float = 1.32, max_new_tokens: int = 500):
+        cache_key = self._response_cache_key(data, cache)
+        if cache_key:
+            cached = await get_response_cache().get(cache_key)
+            if cached is not None:
+                return cached["content"], cached["usage"]
+
+        # Send asynchronous API request over the pooled keep-alive connections
+        _, result = await within_deadline(
+            self.router.first_response(lambda provider: request_completion(provider, data)),
+            "the LLM API request")
+        usage = parse_usage(result.get("usage"))
+        get_usage_meter().record(user, usage)
+        content = result["choices"][0]["message"]["content"]
+        if cache_key:
+            get_response_cache().set(cache_key, content, usage)
+        if probe:
+            get_semantic_cache().add(probe[0], probe[1], content, usage)
+        return content, usage
+
+    async def get_response_stream(self, messages: List[Message], temperature: float = 1.32, max_new_tokens: int = 500,
+                                  conversation_id: str = None, user: str = None, cache: bool = False,
+                                  prepared: bool = False):
         """Generate raw content stream with original SSE formatting"""
-        api_messages = self.get_constructed_api_messages(messages.copy())
+        params = self._request_params(temperature, max_new_tokens)
+        probe = await self._semantic_probe(messages, params)
+        if probe and probe[2]:
+            for frame in self.replay_frames(probe[2], params["model"]):
+                yield frame
+            return
+
+        api_messages = await self.get_constructed_api_messages(messages.copy(), conversation_id, user, prepared)
 
         data = {
             "messages": api_messages,
+            **params,
+            "stream": True,
+            # The last chunk then carries the token usage of the whole completion
+            "stream_options": {"include_usage": True}
+        }
+        cache_key = self._response_cache_key(data, cache)
+        if cache_key:
+            cached = await get_response_cache().get(cache_key)
+            if cached is not None:
+                for frame in self.replay_frames(cached, data["model"]):
+                    yield frame
+                return
+        collected = [] if cache_key or probe else None
+
+        # The upstream reader runs ahead of the SSE writer by at most CHAT_STREAM_BUFFER_SIZE chunks.
+        # When the client is slow the reader stops reading, which pushes back on the upstream connection
+        frames = asyncio.Queue(maxsize=max(1, settings.CHAT_STREAM_BUFFER_SIZE))
+        reader = asyncio.create_task(self._read_stream(data, frames, user))
+        stream_metrics.stream_started()
+        delivered = []
+        outcome = "aborted"
+        try:
+            while True:
+                frame = await frames.get()
+                if frame is _END_OF_STREAM:
+                    break
+                if isinstance(frame, Exception):
+                    outcome = "failed"
+                    raise frame
+                delivered.append(frame)
+                if collected is not None:
+                    collected.append(frame)
+                yield frame
+            outcome = "completed"
+            if collected is not None:
+                content, usage = collect_completion(collected)
+                if cache_key:
+                    get_response_cache().set(cache_key, content, usage)
+                if probe:
+                    get_semantic_cache().add(probe[0], probe[1], content, usage)
+        finally:
+            # The client disconnected (the generator is cancelled or closed) or the stream ended:
+            # cancelling the reader closes the upstream connection and stops the generation
+            tokens_saved = 0
+            if not reader.done():
+                reader.cancel()
+                if outcome == "aborted":
+                    # The budget left is estimated from the content the client received, not the frame count
+                    content, _ = collect_completion(delivered)
+                    tokens_saved = max(0, max_new_tokens - count_tokens(content))
+                    logging.info(f"Client disconnected after {len(delivered)} chunks, upstream generation cancelled")
+            stream_metrics.stream_finished(outcome, len(delivered), tokens_saved)
+
+    async def _read_stream(self, data: dict, frames: asyncio.Queue, user: str = None):
+        """Read the upstream SSE stream into the bounded frame queue, ending with [DONE] or the error"""
+        try:
+            # The deadline bounds the wait for the first token, a stream that started may run to its end
+            started = time.perf_counter()
+            provider, (response, payloads, first) = await within_deadline(
+                self.router.first_response(lambda provider: self._open_stream(provider, data), stream=True,
+                                           release=lambda opened: opened[0].close()),
+                "the wait for the LLM API")
+            stage_timings.record("first_token", time.perf_counter() - started)
+            try:
+                # Merges the small content deltas into fewer frames, when enabled
+                coalescer = DeltaCoalescer() if settings.CHAT_STREAM_COALESCE_ENABLED else None
+                payload = first
+                while payload is not None and payload != DONE:
+                    for ready in (coalescer.add(payload) if coalescer else (payload,)):
+                        await self._forward_payload(frames, ready, user)
+                    payload = await self._next_payload(payloads, coalescer, frames, user)
+                if coalescer:
+                    for ready in coalescer.flush():
+                        await self._forward_payload(frames, ready, user)
+                    stream_metrics.frames_coalesced(coalescer.merged)
+            finally:
+                response.close()
+                provider.limiter.release()
+            # Add the final [DONE] marker after the last chunk
+            await self._put_frame(frames, self._encode_frame("[DONE]"))
+            await frames.put(_END_OF_STREAM)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Failed to reach the LLM API: {e!r}")
+            await frames.put(AIMOException("Failed to reach the LLM API"))
+        except (AIMOException, DeadlineException) as e:
+            await frames.put(e)
+
+    async def _forward_payload(self, frames: asyncio.Queue, payload: bytes, user: str = None):
+        """Queue an upstream payload as an SSE frame, metering its usage"""
+        if settings.CHAT_STREAM_PASSTHROUGH:
+            # Forward the upstream payload bytes as they are, only [DONE], errors and usage are looked at
+            if payload.startswith(b'{"error"'):
+                logging.error(f"LLM API stream error: {payload.decode('utf-8', 'replace')}")
+            elif b'"usage":{' in payload or b'"usage": {' in payload:
+                self._record_stream_usage(payload, user)
+            await self._put_frame(frames, encode_data_frame(payload))
+        else:
+            try:
+                chunk = json.loads(payload)
+            except json.JSONDecodeError:
+                chunk = None
+            if chunk:
+                # Handle normal response chunks
+                self._record_stream_usage(chunk, user)
+                await self._put_frame(frames, dict(data=json.dumps(chunk)))
+
+    async def _next_payload(self, payloads, coalescer: Optional[DeltaCoalescer], frames: asyncio.Queue,
+                            user: str = None) -> Optional[bytes]:
+        """The next upstream payload, sending the coalesced deltas whose window ends while waiting for it"""
+        if coalescer is None or coalescer.due() is None:
+            return await anext(payloads, None)
+        # The read continues across the flush, cancelling it would end the payload iterator
+        next_payload = asyncio.ensure_future(anext(payloads, None))
+        try:
+            done, _ = await asyncio.wait({next_payload}, timeout=coalescer.due())
+            if not done:
+                for ready in coalescer.flush():
+                    await self._forward_payload(frames, ready, user)
+            return await next_payload
+        except BaseException:
+            next_payload.cancel()
+            raise
+
+    async def _predict_emotions(self, user_input: str) -> Optional[List[str]]:
+        """
+        Emotion tags of the user input, skipped (None) when the request deadline leaves no time for them
+
+        The reply is more useful without emotion tags than not at all, so emotion inference only
+        gets the budget beyond EMOTION_DEADLINE_RESERVE seconds, which is kept for the LLM API.
+        """
+        budget = bounded_timeout(reserve=settings.EMOTION_DEADLINE_RESERVE)
+        try:
+            if budget is None:
+                return await self.emotion_batcher.predict_async(user_input)
+            if budget <= 0:
+                raise asyncio.TimeoutError()
+            return await asyncio.wait_for(self.emotion_batcher.predict_async(user_input), budget)
+        except (asyncio.TimeoutError, DeadlineException):
+            logging.warning("Emotion inference skipped, the request deadline is too close")
+            return None
+
+    @staticmethod
+    async def _open_stream(provider: Provider, data: dict):
+        """
+        Send a streamed request to one endpoint and wait for its first event
+
+        :return: The open response, the iterator of its remaining payloads and the first payload
+        """
+        try:
+            response = await get_http_session().post(provider.url, headers=provider.headers,
+                                                     json=provider.prepare(data))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Failed to reach the LLM API {provider.name}: {e!r}")
+            raise UpstreamException("Failed to reach the LLM API")
+        try:
+            if response.status != 200:
+                raise UpstreamException(f"API Error: {response.status}", response.status)
+            payloads = iter_sse_payloads(response.content)
+            first = await anext(payloads, None)
+            if first is None:
+                raise UpstreamException("The LLM API closed the stream without an answer")
+            return response, payloads, first
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            response.close()
+            logging.error(f"Failed to read the LLM API stream of {provider.name}: {e!r}")
+            raise UpstreamException("Failed to reach the LLM API")
+        except BaseException:
+            # Failed, or cancelled because another endpoint answered first
+            response.close()
+            raise
+
+    @staticmethod
+    def _request_params(temperature: float, max_new_tokens: int) -> dict:
+        """Model and sampling parameters of an upstream request"""
+        return {
             "model": "deepseek/deepseek-chat",
             "max_tokens": max_new_tokens,
             "temperature": temperature,
             "top_p": 0.9,
-            "stream": True
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.url, headers=self.headers, json=data) as response:
-                if response.status != 200:
-                    raise AIMOException(f"API Error: {response.status}")
-
-                async for line in response.content:
-                    if not line:  # Skip empty lines
-                        continue
-
-                    decoded_line = decode_response(line)
-                    if not decoded_line:
-                        continue
-
-                    # Handle normal response chunks
-                    yield dict(data=json.dumps(decoded_line))
+    async def _semantic_probe(self, messages: List[Message], params: dict) -> Optional[tuple]:
+        """
+        Look up a short first-turn message in the semantic cache
 
-                # Add the final [DONE] marker after the last chunk
-                yield dict(data="[DONE]")
+        :param messages: The conversation, not yet constructed
+        :param params: Model and sampling parameters of the request (see _request_params)
+        :return: None if the request is not eligible, else (embedding, scope, cached entry or None)
+        """
+        if not settings.CHAT_SEMANTIC_CACHE_ENABLED or not messages:
+            return None
+        history = messages[1:] if messages[0].role == "system" else messages
+        last_message = history[-1]
+        if len(history) != 1 or last_message.role != "user" \
+                or len(last_message.content) > settings.CHAT_SEMANTIC_CACHE_MAX_CHARS:
+            return None
+        try:
+            embedding = (await self.emotion_batcher.embed_async([last_message.content]))[0]
+        except Exception as e:
+            # The cache is an optimization, the request goes upstream
+            logging.warning(f"Semantic cache lookup skipped, embedding failed: {e!r}")
+            return None
+        # Like the response cache key, a reply is only served to requests with the same model and sampling
+        scope = (self.prompt_manager.snapshot.version, messages[0].content if messages[0].role == "system" else None,
+                 tuple(sorted(params.items())))
+        return embedding, scope, get_semantic_cache().lookup(embedding, scope)
+
+    def replay_frames(self, cached: dict, model: str):
+        """Frames of a cached completion, replayed as a stream without calling upstream"""
+        for chunk in replay_chunks(cached["content"], cached["usage"], model):
+            yield self._encode_frame(json.dumps(chunk, ensure_ascii=False))
+        yield self._encode_frame("[DONE]")
+
+    def _response_cache_key(self, data: dict, force: bool = False) -> Optional[str]:
+        """Cache key of a request that may be served from the response cache, None if it may not"""
+        if not ResponseCache.cacheable(data["temperature"], force):
+            return None
+        return get_response_cache().key(data, self.prompt_manager.snapshot.version)
+
+    @staticmethod
+    def _encode_frame(payload: str):
+        """An SSE frame in the format of the configured stream mode"""
+        if settings.CHAT_STREAM_PASSTHROUGH:
+            return encode_data_frame(payload.encode("utf-8"))
+        return dict(data=payload)
+
+    @staticmethod
+    def _record_stream_usage(chunk, user: str = None):
+        """Meter the usage block of a stream chunk (only the last chunk carries one)"""
+        if isinstance(chunk, bytes):
+            try:
+                chunk = json.loads(chunk)
+            except ValueError:
+                return
+        if isinstance(chunk, dict):
+            get_usage_meter().record(user, parse_usage(chunk.get("usage")))
+
+    @staticmethod
+    async def _put_frame(frames: asyncio.Queue, frame):
+        """Queue a frame for the SSE writer, waiting while the buffer is full"""
+        if frames.full():
+            stream_metrics.buffer_full()
+        await frames.put(frame)
 
     @property
     def system_prompt(self):
-        """Return the complete system prompt"""
-        return f"{self._self_cognition}{self._guidelines}{self._rules}{self._overall_style}"
+        """Return the complete system prompt, compiled once per prompt version"""
+        return self.prompt_manager.snapshot.compiled
 
     # LLM API system prompt (updated since 2025-06-18)
     @property
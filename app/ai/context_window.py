@@ -0,0 +1,129 @@
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+from app.core.config import settings
+
+"""
+Description:
+    Token-budgeted conversation window for the upstream LLM requests.
+
+    The client sends the whole conversation on every turn. Before it goes upstream, the
+    leading system messages and the newest turns that fit into CHAT_HISTORY_TOKEN_BUDGET
+    are kept, older turns are dropped. Token counts are a character-based heuristic (the
+    upstream tokenizer is not available here), so CHAT_HISTORY_TOKEN_MARGIN of the budget
+    is left free for the text the heuristic underestimates.
+"""
+
+# Role, separators and other per-message framing tokens of the chat template
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text
+
+    A heuristic, not the count of the upstream tokenizer: BPE tokenizers produce about one
+    token per 4 characters of English text, and about one token per character for CJK and
+    most other non-ASCII scripts.
+
+    :param text: The text
+    :return: Estimated token count
+    """
+    if text.isascii():
+        return (len(text) + 3) // 4
+    # Non-ASCII characters take 2 to 4 bytes in UTF-8, about 2 extra bytes on average
+    non_ascii = min(len(text), (len(text.encode("utf-8")) - len(text) + 1) // 2)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def message_tokens(message: dict) -> int:
+    """Estimated tokens of a chat message, framing included"""
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def fit_to_budget(api_messages: List[dict], budget: int, margin: float = None) -> Tuple[List[dict], int]:
+    """
+    Keep the leading system messages and the newest messages that fit into the budget
+
+    The last message (the current user turn) is always kept, even if it alone exceeds the budget.
+
+    :param api_messages: The messages about to be sent upstream, oldest first
+    :param budget: Token budget of the whole prompt
+    :param margin: Share of the budget left free for estimation errors (defaults to settings)
+    :return: The kept messages and the number of estimated tokens trimmed
+    """
+    margin = settings.CHAT_HISTORY_TOKEN_MARGIN if margin is None else margin
+    budget = int(budget * (1 - margin))
+    head = 0
+    while head < len(api_messages) - 1 and api_messages[head].get("role") == "system":
+        head += 1
+    system, history = api_messages[:head], api_messages[head:]
+
+    used = sum(message_tokens(message) for message in system)
+    kept = 0
+    for message in reversed(history):
+        tokens = message_tokens(message)
+        if kept and used + tokens > budget:
+            break
+        used += tokens
+        kept += 1
+
+    trimmed = history[:len(history) - kept]
+    if not trimmed:
+        return api_messages, 0
+    return system + history[len(history) - kept:], sum(message_tokens(message) for message in trimmed)
+
+
+class ContextWindowStats:
+    """Prompt size and trimming counters of this worker, reported by GET /chat/stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.trimmed_requests = 0
+        self.prompt_tokens = 0
+        self.trimmed_tokens = 0
+        self.trimmed_messages = 0
+
+    def record(self, prompt_tokens: int, trimmed_tokens: int, trimmed_messages: int):
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            if trimmed_messages:
+                self.trimmed_requests += 1
+                self.trimmed_tokens += trimmed_tokens
+                self.trimmed_messages += trimmed_messages
+
+    def stats(self) -> Dict[str, float]:
+        """Return the average prompt size and the trimming counters"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else 0.0,
+                "trimmed_requests": self.trimmed_requests,
+                "trimmed_messages": self.trimmed_messages,
+                "trimmed_tokens": self.trimmed_tokens,
+            }
+
+
+context_window_stats = ContextWindowStats()
+
+
+def apply_context_window(api_messages: List[dict], budget: int = None) -> List[dict]:
+    """
+    Fit the upstream messages into the token budget, logging and counting what was trimmed
+
+    :param api_messages: The messages about to be sent upstream, oldest first
+    :param budget: Token budget (defaults to settings.CHAT_HISTORY_TOKEN_BUDGET)
+    :return: The messages to send
+    """
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET if budget is None else budget
+    kept, trimmed_tokens = fit_to_budget(api_messages, budget)
+    trimmed_messages = len(api_messages) - len(kept)
+    prompt_tokens = sum(message_tokens(message) for message in kept)
+    if trimmed_messages:
+        logging.info(f"Trimmed {trimmed_messages} messages (~{trimmed_tokens} tokens) from the conversation, "
+                     f"sending ~{prompt_tokens} prompt tokens")
+    context_window_stats.record(prompt_tokens, trimmed_tokens, trimmed_messages)
+    return kept
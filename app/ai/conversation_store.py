@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, List
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.exceptions.conversation_exceptions import ConversationException
+from app.utils.lru_cache import TTLCache
+
+"""
+Description:
+    Server-side conversation history, so clients of a conversation only send the new turn.
+
+    A conversation is a Redis list per user and conversation id. Every entry is one message
+    as a compact JSON pair ["u", "content"] (u = user, a = assistant, s = system). Appending
+    a turn is a single pipelined RPUSH + LTRIM + EXPIRE, so the list is capped at
+    CHAT_CONVERSATION_MAX_MESSAGES and expires CHAT_CONVERSATION_TTL seconds after its last
+    turn. Without Redis (development, tests) the conversations are kept in process.
+"""
+
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_CODE_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+def encode_message(message: dict) -> str:
+    """Encode a message as a compact list entry"""
+    role = message["role"]
+    return json.dumps([_ROLE_CODES.get(role, role), message["content"]], ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_message(entry: str) -> dict:
+    """Decode a list entry back into a message"""
+    role, content = json.loads(entry)
+    return {"role": _CODE_ROLES.get(role, role), "content": content}
+
+
+class ConversationStore:
+    """
+    Per-user conversation histories.
+
+    Attributes:
+        max_messages (int): Number of newest messages kept per conversation.
+        ttl (int): Seconds a conversation is kept after its last turn.
+    """
+
+    def __init__(self, redis_client=None, use_redis: bool = True, prefix: str = "aimo:conversation:"):
+        """
+        Initialize the store
+
+        :param redis_client: Optional asyncio Redis client (defaults to the shared client)
+        :param use_redis: Whether to keep the conversations in Redis
+        :param prefix: Key prefix for Redis keys
+        """
+        self.max_messages = max(2, settings.CHAT_CONVERSATION_MAX_MESSAGES)
+        self.ttl = settings.CHAT_CONVERSATION_TTL
+        self.prefix = prefix
+        self.redis_client = (redis_client or get_redis()) if use_redis else None
+        self.local = TTLCache(settings.CHAT_CONVERSATION_LOCAL_ENTRIES, self.ttl)
+
+        self._lock = threading.Lock()
+        self._background_tasks = set()
+
+        # Statistics
+        self.loads = 0
+        self.appends = 0
+        self.errors = 0
+
+    @staticmethod
+    def scope(subject: str, conversation_id: str) -> str:
+        """Id of a conversation unique across users, the user is hashed so wallet addresses do not appear in keys"""
+        owner = hashlib.sha256(subject.encode("utf-8")).hexdigest()[:16]
+        return f"{owner}:{conversation_id}"
+
+    def key(self, subject: str, conversation_id: str) -> str:
+        """Redis key of a conversation"""
+        return f"{self.prefix}{self.scope(subject, conversation_id)}"
+
+    async def load(self, subject: str, conversation_id: str) -> List[dict]:
+        """
+        Get the stored messages of a conversation, oldest first
+
+        :param subject: The user the conversation belongs to
+        :param conversation_id: The conversation id
+        :return: The messages, empty for a new conversation
+        :raises ConversationException: If the history cannot be read
+        """
+        key = self.key(subject, conversation_id)
+        with self._lock:
+            self.loads += 1
+        if self.redis_client is None:
+            return [decode_message(entry) for entry in self.local.get(key) or []]
+        try:
+            entries = await self.redis_client.lrange(key, 0, -1)
+        except (RedisError, OSError) as e:
+            # Answering without the history would silently lose the context of the conversation
+            self._record_error(e)
+            raise ConversationException()
+        return [decode_message(entry) for entry in entries]
+
+    async def append(self, subject: str, conversation_id: str, messages: List[dict]):
+        """
+        Append messages to a conversation, dropping the oldest beyond max_messages
+
+        :param subject: The user the conversation belongs to
+        :param conversation_id: The conversation id
+        :param messages: The messages to append, oldest first
+        """
+        key = self.key(subject, conversation_id)
+        entries = [encode_message(message) for message in messages]
+        if self.redis_client is None:
+            with self._lock:
+                self.local.set(key, ((self.local.get(key) or []) + entries)[-self.max_messages:])
+                self.appends += 1
+            return
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, *entries)
+                pipe.ltrim(key, -self.max_messages, -1)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            with self._lock:
+                self.appends += 1
+        except (RedisError, OSError) as e:
+            self._record_error(e)
+
+    def record_turn(self, subject: str, conversation_id: str, messages: List[dict]):
+        """Append the messages of a finished turn in the background, the response does not wait for it"""
+        task = asyncio.create_task(self.append(subject, conversation_id, messages))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _record_error(self, error: Exception):
+        with self._lock:
+            self.errors += 1
+        logging.warning(f"Conversation store Redis error: {error}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return the load, append and error counters"""
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "appends": self.appends,
+                "errors": self.errors,
+                "pending_appends": len(self._background_tasks),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Get the process-wide conversation store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore()
+    return _store
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from app.ai.providers import get_provider_router, request_completion
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.utils.lru_cache import TTLCache
+
+SUMMARY_PROMPT = (
+    "You maintain the long-term memory of AIMO, an emotional companion, about one user. "
+    "Update the summary with the new conversation turns. Keep facts about the user, their "
+    "feelings, relationships, plans and anything AIMO promised, drop small talk. Write at most "
+    "{max_words} words in the third person, without any preamble."
+)
+
+# Deletes the refresh lock only if this worker still holds it (it may have expired and been taken over)
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ConversationSummarizer:
+    """
+    Rolling summary compaction of old conversation turns.
+
+    Once a conversation has more than CHAT_SUMMARY_TRIGGER_MESSAGES messages, the turns older
+    than the newest CHAT_SUMMARY_KEEP_RECENT are replaced by a running summary. The summary is
+    refreshed incrementally in the background (previous summary + the turns since) whenever
+    CHAT_SUMMARY_REFRESH_EVERY new messages have aged out of the recent window, so requests
+    never wait for it. Summaries are stored in Redis per user and conversation, with an
+    in-process tier in front, and carry a fingerprint of all summarized messages, so a
+    conversation the client edited or truncated, or another one with the same opening, is
+    never matched with a summary that is not its own.
+
+    Attributes:
+        trigger (int): Number of history messages from which on old turns are compacted.
+        keep_recent (int): Number of newest messages that are always sent verbatim.
+        refresh_every (int): Number of newly aged-out messages that triggers a refresh.
+    """
+
+    def __init__(self, redis_client=None, use_redis: bool = True, prefix: str = "aimo:summary:"):
+        """
+        Initialize the summarizer
+
+        :param redis_client: Optional asyncio Redis client (defaults to the shared client)
+        :param use_redis: Whether to store the summaries in Redis
+        :param prefix: Key prefix for Redis keys
+        """
+        self.trigger = settings.CHAT_SUMMARY_TRIGGER_MESSAGES
+        self.keep_recent = settings.CHAT_SUMMARY_KEEP_RECENT
+        self.refresh_every = max(1, settings.CHAT_SUMMARY_REFRESH_EVERY)
+        self.ttl = settings.CHAT_SUMMARY_TTL
+        self.prefix = prefix
+        # Short-lived, so a worker picks up refreshes made by other workers
+        self.local = TTLCache(settings.CHAT_SUMMARY_LOCAL_ENTRIES, min(self.ttl, 300))
+        self.redis_client = (redis_client or get_redis()) if use_redis else None
+
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._background_tasks = set()
+        self._redis_retry_at = 0.0
+
+        # Statistics
+        self.compacted_requests = 0
+        self.compacted_messages = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    @staticmethod
+    def fingerprint(message: dict) -> str:
+        """Hash of a message, used to check that a conversation still starts the same way"""
+        raw = f"{message.get('role')}|{message.get('content')}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def prefix_fingerprint(self, messages: List[dict]) -> str:
+        """Hash of a whole run of messages, a summary is only applied to a conversation starting with all of them"""
+        raw = "|".join(self.fingerprint(message) for message in messages)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def conversation_key(self, history: List[dict], conversation_id: str = None, user: str = None) -> str:
+        """
+        Key of a conversation: its id if the client sent one, else derived from the user and its opening messages
+
+        :param history: The conversation messages without the system prompt
+        :param conversation_id: Optional conversation id, unique across users
+        :param user: The user of the conversation
+        :return: The Redis key of the conversation summary
+        """
+        if conversation_id:
+            return f"{self.prefix}{conversation_id}"
+        opening = "|".join([user or ""] + [self.fingerprint(message) for message in history[:2]])
+        return f"{self.prefix}{hashlib.sha256(opening.encode('utf-8')).hexdigest()}"
+
+    async def compact(self, api_messages: List[dict], conversation_id: str = None, user: str = None) -> List[dict]:
+        """
+        Replace old turns with the stored summary and schedule a refresh when it is due
+
+        :param api_messages: The messages about to be sent upstream, system prompt first, current user turn last
+        :param conversation_id: Optional conversation id (otherwise derived from the messages)
+        :param user: The user of the conversation
+        :return: The compacted messages
+        """
+        head = 0
+        while head < len(api_messages) - 1 and api_messages[head].get("role") == "system":
+            head += 1
+        system, history, current = api_messages[:head], api_messages[head:-1], api_messages[-1:]
+        if len(history) <= self.trigger:
+            return api_messages
+
+        key = self.conversation_key(history, conversation_id, user)
+        boundary = len(history) - self.keep_recent
+        record = await self._load(key)
+        covered = 0
+        # Conversations sharing an opening may share the key, the summary must cover exactly these messages
+        if record and 0 < record["covered"] <= boundary \
+                and self.prefix_fingerprint(history[:record["covered"]]) == record["fingerprint"]:
+            covered = record["covered"]
+
+        if boundary - covered >= self.refresh_every or (covered == 0 and boundary > 0):
+            self._schedule_refresh(key, record if covered else None, history[covered:boundary], boundary,
+                                   self.prefix_fingerprint(history[:boundary]))
+        if not covered:
+            return api_messages
+
+        with self._lock:
+            self.compacted_requests += 1
+            self.compacted_messages += covered
+        summary = {"role": "system", "content": f"Summary of the earlier conversation with the user: {record['summary']}"}
+        return system + [summary] + history[covered:] + current
+
+    async def _load(self, key: str) -> Optional[dict]:
+        """Get the summary record of a conversation, in-process tier first"""
+        record = self.local.get(key)
+        if record is not None or not self._redis_available():
+            return record
+        try:
+            value = await self.redis_client.get(key)
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+            return None
+        if value is None:
+            return None
+        try:
+            record = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        self.local.set(key, record)
+        return record
+
+    async def _store(self, key: str, record: dict):
+        """Store the summary record of a conversation in both tiers"""
+        self.local.set(key, record)
+        if self._redis_available():
+            try:
+                await self.redis_client.set(key, json.dumps(record), ex=self.ttl)
+            except (RedisError, OSError) as e:
+                self._record_redis_error(e)
+
+    def _schedule_refresh(self, key: str, record: Optional[dict], new_messages: List[dict], covered: int,
+                          fingerprint: str):
+        """Summarize in the background, at most one refresh per conversation at a time"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, record, new_messages, covered, fingerprint))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _refresh(self, key: str, record: Optional[dict], new_messages: List[dict], covered: int,
+                       fingerprint: str):
+        """Fold the new messages into the summary and store it as covering the first `covered` messages"""
+        lock_key = f"{key}:lock"
+        lock_token = uuid4().hex
+        locked = False
+        try:
+            # Other workers may be refreshing the same conversation
+            if self._redis_available():
+                try:
+                    locked = await self.redis_client.set(lock_key, lock_token, nx=True, ex=60)
+                    if not locked:
+                        return
+                except (RedisError, OSError) as e:
+                    self._record_redis_error(e)
+            summary = await self.summarize(record["summary"] if record else None, new_messages)
+            await self._store(key, {"covered": covered, "fingerprint": fingerprint, "summary": summary})
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            with self._lock:
+                self.refresh_errors += 1
+            logging.warning(f"Failed to refresh the conversation summary: {e!r}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            if locked:
+                try:
+                    await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+                except (RedisError, OSError) as e:
+                    self._record_redis_error(e)
+
+    async def summarize(self, previous_summary: Optional[str], new_messages: List[dict]) -> str:
+        """
+        Ask the LLM to fold new conversation turns into the previous summary
+
+        :param previous_summary: The summary so far, None for the first one
+        :param new_messages: The turns to add to the summary
+        :return: The updated summary
+        """
+        transcript = "\n".join(f"{message.get('role')}: {message.get('content')}" for message in new_messages)
+        prompt = f"Summary so far:\n{previous_summary or '(none)'}\n\nNew conversation turns:\n{transcript}"
+        data = {
+            "messages": [
+                {"role": "system", "content": SUMMARY_PROMPT.format(max_words=settings.CHAT_SUMMARY_MAX_TOKENS // 2)},
+                {"role": "user", "content": prompt},
+            ],
+            "model": settings.CHAT_SUMMARY_MODEL,
+            "max_tokens": settings.CHAT_SUMMARY_MAX_TOKENS,
+            "temperature": 0.3,
+            "stream": False
+        }
+        # Over the same endpoints, limiters and circuit breakers as the chat completions
+        _, result = await get_provider_router().first_response(lambda provider: request_completion(provider, data))
+        return result["choices"][0]["message"]["content"].strip()
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and time.monotonic() >= self._redis_retry_at
+
+    def _record_redis_error(self, error: Exception):
+        with self._lock:
+            self._redis_retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+        logging.warning(f"Conversation summary Redis tier unavailable: {error}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return compaction and refresh counters"""
+        with self._lock:
+            return {
+                "compacted_requests": self.compacted_requests,
+                "compacted_messages": self.compacted_messages,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "refreshing": len(self._refreshing),
+            }
+
+
+_summarizer: Optional[ConversationSummarizer] = None
+_summarizer_lock = threading.Lock()
+
+
+def get_conversation_summarizer() -> ConversationSummarizer:
+    """Get the process-wide summarizer, so every AIMO instance shares its in-process tier"""
+    global _summarizer
+    if _summarizer is None:
+        with _summarizer_lock:
+            if _summarizer is None:
+                _summarizer = ConversationSummarizer()
+    return _summarizer
@@ -0,0 +1,236 @@
+import copy
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Dict
+
+import numpy
+import torch
+
+"""
+Description:
+    Inference backends for the EmotionModule classifier. Every backend takes the
+    tokenizer output (input_ids and attention_mask tensors) and returns the logits as a
+    NumPy array, so EmotionModel can switch between them with the EMOTION_BACKEND setting.
+
+    - eager:       fp32 eager PyTorch (reference)
+    - int8:        dynamic int8 quantization of the Linear layers (CPU)
+    - torchscript: traced TorchScript graph
+    - compile:     torch.compile
+    - onnx:        ONNX Runtime on an exported copy of the model (CPU), stored under the
+                   fingerprint of the weights so new weights are exported again
+"""
+
+BACKENDS = ("eager", "int8", "torchscript", "compile", "onnx")
+
+# Short and long probe texts used to check that a backend reproduces the fp32 labels
+PARITY_PROBES = [
+    "hi",
+    "ok",
+    "lol",
+    "i'm tired",
+    "I am feeling very happy today!",
+    "Why do I always feel like I'm not good enough?",
+    "I can't believe you forgot my birthday again, I'm so angry right now.",
+    "Thank you so much for listening to me, it really means a lot.",
+    "I'm nervous about my exam tomorrow and I can't sleep.",
+    "My dog passed away this morning and the house feels so empty without him.",
+    "Wow, I didn't expect that at all!",
+    "What should I cook for dinner tonight?",
+]
+
+
+class EagerBackend:
+    """fp32 eager PyTorch inference"""
+
+    name = "eager"
+
+    def __init__(self, model: torch.nn.Module, device: str):
+        self.model = model
+        self.device = device
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> numpy.ndarray:
+        with torch.inference_mode():
+            return self.model(input_ids=inputs["input_ids"],
+                              attention_mask=inputs["attention_mask"]).logits.float().cpu().numpy()
+
+
+class Int8Backend(EagerBackend):
+    """Dynamic int8 quantization of the Linear layers, weights are quantized once at load time"""
+
+    name = "int8"
+
+    def __init__(self, model: torch.nn.Module, device: str):
+        if device != "cpu":
+            logging.warning("int8 dynamic quantization only runs on CPU, the emotion backend will run on CPU")
+        quantized = torch.ao.quantization.quantize_dynamic(_on_cpu(model, device), {torch.nn.Linear},
+                                                           dtype=torch.qint8)
+        super().__init__(quantized, "cpu")
+
+
+def _on_cpu(model: torch.nn.Module, device: str) -> torch.nn.Module:
+    """The model itself if it is on CPU, otherwise a CPU copy (the fp32 model stays where it is)"""
+    return model if device == "cpu" else copy.deepcopy(model).to("cpu")
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Wrap a Hugging Face classifier so it maps (input_ids, attention_mask) to logits"""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+
+def _example_inputs(device: str):
+    """Dummy batch used for tracing and export"""
+    input_ids = torch.ones((2, 16), dtype=torch.long, device=device)
+    attention_mask = torch.ones((2, 16), dtype=torch.long, device=device)
+    return input_ids, attention_mask
+
+
+class TorchScriptBackend:
+    """Traced TorchScript graph of the classifier"""
+
+    name = "torchscript"
+
+    def __init__(self, model: torch.nn.Module, device: str):
+        self.device = device
+        with torch.no_grad():
+            traced = torch.jit.trace(_LogitsOnly(model).eval(), _example_inputs(device), check_trace=False)
+        self.model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> numpy.ndarray:
+        with torch.inference_mode():
+            return self.model(inputs["input_ids"], inputs["attention_mask"]).float().cpu().numpy()
+
+
+class CompileBackend:
+    """torch.compile graph of the classifier, compiled with dynamic batch and sequence sizes"""
+
+    name = "compile"
+
+    def __init__(self, model: torch.nn.Module, device: str):
+        self.device = device
+        self.model = torch.compile(_LogitsOnly(model).eval(), dynamic=True)
+        # Compile now instead of on the first user request
+        self(dict(zip(("input_ids", "attention_mask"), _example_inputs(device))))
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> numpy.ndarray:
+        with torch.inference_mode():
+            return self.model(inputs["input_ids"], inputs["attention_mask"]).float().cpu().numpy()
+
+
+class OnnxBackend:
+    """ONNX Runtime session on an exported copy of the classifier"""
+
+    name = "onnx"
+
+    def __init__(self, model: torch.nn.Module, device: str, model_path: Path, fingerprint: str = None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx emotion backend requires the onnxruntime package") from e
+
+        if device != "cpu":
+            logging.warning("The onnx emotion backend runs on CPU")
+        self.device = "cpu"
+
+        # An export is only reused for the weights it was made from
+        onnx_file = model_path / "onnx" / f"model-{fingerprint or weights_fingerprint(model)}.onnx"
+        if not onnx_file.exists():
+            export_onnx(_on_cpu(model, device), onnx_file)
+
+        self.onnx_file = onnx_file
+        self._onnxruntime = onnxruntime
+        self._session = None
+        self._session_pid = None
+        self.session  # Load now, so a broken export falls back to eager at startup
+
+    @property
+    def session(self):
+        """
+        The ONNX Runtime session of this process
+
+        The session's thread pools do not survive a fork, so a gunicorn worker forked from a
+        preloading master opens its own session on first use.
+        """
+        if self._session_pid != os.getpid():
+            options = self._onnxruntime.SessionOptions()
+            options.graph_optimization_level = self._onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = torch.get_num_threads()
+            self._session = self._onnxruntime.InferenceSession(str(self.onnx_file), options,
+                                                               providers=["CPUExecutionProvider"])
+            self._session_pid = os.getpid()
+        return self._session
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> numpy.ndarray:
+        return self.session.run(["logits"], {
+            "input_ids": inputs["input_ids"].cpu().numpy().astype(numpy.int64),
+            "attention_mask": inputs["attention_mask"].cpu().numpy().astype(numpy.int64),
+        })[0]
+
+
+def weights_fingerprint(model: torch.nn.Module) -> str:
+    """Hash the parameters and buffers of a model into a short version string"""
+    digest = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def export_onnx(model: torch.nn.Module, onnx_file: Path):
+    """
+    Export the classifier to ONNX with dynamic batch and sequence axes
+
+    :param model: The fp32 classifier
+    :param onnx_file: Destination file
+    """
+    logging.info(f"Exporting emotion model to ONNX: {onnx_file} ...")
+    onnx_file.parent.mkdir(parents=True, exist_ok=True)
+    # Export to a temporary file first, so concurrent workers never load a half-written model
+    tmp_file = onnx_file.with_suffix(f".{os.getpid()}.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            _LogitsOnly(model).eval(),
+            _example_inputs("cpu"),
+            str(tmp_file),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=17,
+            dynamo=False
+        )
+    os.replace(tmp_file, onnx_file)
+
+
+def build_backend(name: str, model: torch.nn.Module, device: str, model_path: Path, fingerprint: str = None):
+    """
+    Build an inference backend for the classifier
+
+    :param name: One of BACKENDS
+    :param model: The loaded fp32 classifier
+    :param device: The device the model is on
+    :param model_path: Directory of the model files (the ONNX export is stored next to them)
+    :param fingerprint: Fingerprint of the model files keying the ONNX export (defaults to a hash of the weights)
+    :return: A callable mapping tokenizer output to NumPy logits
+    """
+    if name == "eager":
+        return EagerBackend(model, device)
+    if name == "int8":
+        return Int8Backend(model, device)
+    if name == "torchscript":
+        return TorchScriptBackend(model, device)
+    if name == "compile":
+        return CompileBackend(model, device)
+    if name == "onnx":
+        return OnnxBackend(model, device, model_path, fingerprint)
+    raise ValueError(f"Unknown emotion backend: {name}, expected one of {', '.join(BACKENDS)}")
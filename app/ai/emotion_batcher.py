@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy
+
+from app.core.config import settings
+from app.exceptions.deadline_exceptions import DeadlineException
+from app.exceptions.emotion_exceptions import EmotionException
+from app.utils.deadline import current_deadline
+
+
+@dataclass
+class _PendingPrediction:
+    """A predict call waiting to be served by the next micro-batch"""
+    user_inputs: List[str]
+    threshold: float
+    single: bool = True  # Resolve to the labels of one text instead of a list of label lists
+    embed: bool = False  # Resolve to the sentence embeddings of the texts instead of their labels
+    future: Future = field(default_factory=Future)
+    deadline: Optional[float] = None  # Monotonic deadline of the request, expired predictions are skipped
+
+
+class EmotionBatcher:
+    """
+    Micro-batching layer in front of the EmotionModel.
+
+    Concurrent predict calls are collected for a short time window (or until the
+    batch is full), encoded together with padding and classified with one forward
+    pass. Every caller receives the labels of its own text through a Future.
+    Bulk requests ride the same queue and are split into length-sorted buckets.
+
+    Inference (tokenization included) runs on a dedicated thread, so async callers
+    awaiting `predict_async` never block the event loop. With an EmotionCache, repeated
+    inputs are answered without reaching the queue at all.
+
+    Attributes:
+        emotion_model (EmotionModel): The model serving the batches.
+        max_batch_size (int): Maximum number of texts per forward pass (and per collected batch).
+        max_wait (float): Maximum time in seconds to wait for a batch to fill up.
+        max_queued (int): Maximum number of predictions waiting for the inference thread.
+        cache (EmotionCache): Optional prediction cache consulted by the async API.
+    """
+
+    def __init__(self, emotion_model, max_batch_size: int = None, max_wait_ms: float = None,
+                 max_queued: int = None, cache=None):
+        """
+        Initialize the batcher
+
+        :param emotion_model: The EmotionModel instance used for inference
+        :param max_batch_size: Maximum number of texts per batch (defaults to settings)
+        :param max_wait_ms: Collection window in milliseconds (defaults to settings)
+        :param max_queued: Cap on queued predictions, 0 for unbounded (defaults to settings)
+        :param cache: Optional EmotionCache for repeated inputs
+        """
+        self.emotion_model = emotion_model
+        self.max_batch_size = max(1, max_batch_size or settings.EMOTION_BATCH_MAX_SIZE)
+        self.max_wait = (settings.EMOTION_BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.max_queued = settings.EMOTION_MAX_QUEUED if max_queued is None else max_queued
+        self.cache = cache
+
+        self._queue: "queue.Queue[_PendingPrediction]" = queue.Queue(maxsize=max(0, self.max_queued))
+        self._lock = threading.Lock()
+        self._worker: threading.Thread = None
+        self._worker_pid: int = None
+
+        # Statistics
+        self._batches = 0
+        self._items = 0
+        self._max_batch = 0
+        self._last_batch = 0
+        self._inference_seconds = 0.0
+        self._rejected = 0
+        self._expired = 0
+
+    def submit(self, user_input: str, threshold: float = 0.5) -> Future:
+        """
+        Queue a text for the next micro-batch
+
+        :param user_input: The input text from the user
+        :param threshold: The probability threshold for prediction
+        :return: A future resolving to the list of predicted sentiment labels
+        :raises EmotionException: If the inference queue is full
+        """
+        return self._enqueue(_PendingPrediction(user_inputs=[user_input], threshold=threshold))
+
+    def submit_many(self, user_inputs: List[str], threshold: float = 0.5) -> Future:
+        """
+        Queue many texts at once, e.g. for bulk analysis
+
+        :param user_inputs: The input texts
+        :param threshold: The probability threshold for prediction
+        :return: A future resolving to one list of predicted sentiment labels per text, in input order
+        :raises EmotionException: If the inference queue is full
+        """
+        if not user_inputs:
+            future = Future()
+            future.set_result([])
+            return future
+        return self._enqueue(_PendingPrediction(user_inputs=list(user_inputs), threshold=threshold, single=False))
+
+    def submit_embedding(self, user_inputs: List[str]) -> Future:
+        """
+        Queue texts for sentence embedding (see EmotionModel.embed_batch)
+
+        :param user_inputs: The input texts
+        :return: A future resolving to an array with one L2-normalized embedding per text
+        :raises EmotionException: If the inference queue is full
+        """
+        return self._enqueue(_PendingPrediction(user_inputs=list(user_inputs), threshold=0.0, single=False, embed=True))
+
+    def _enqueue(self, pending: _PendingPrediction) -> Future:
+        """Put a prediction on the bounded queue"""
+        pending.deadline = current_deadline()
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            logging.warning(f"Emotion inference queue is full ({self.max_queued} pending), rejecting request")
+            raise EmotionException()
+        return pending.future
+
+    async def predict_async(self, user_input: str, threshold: float = 0.5) -> List[str]:
+        """
+        Awaitable predict for the async request handlers
+
+        Cancelling the awaiting task also drops the queued prediction.
+
+        :param user_input: The input text from the user
+        :param threshold: The probability threshold for prediction
+        :return: A list of predicted sentiment labels
+        """
+        if self.cache is None:
+            return await asyncio.wrap_future(self.submit(user_input, threshold))
+        cached = (await self.cache.get_many([user_input], threshold))[0]
+        if cached is not None:
+            return cached
+        labels = await asyncio.wrap_future(self.submit(user_input, threshold))
+        self.cache.set_many([user_input], threshold, [labels])
+        return labels
+
+    async def predict_many_async(self, user_inputs: List[str], threshold: float = 0.5) -> List[List[str]]:
+        """
+        Awaitable bulk predict for the async request handlers
+
+        :param user_inputs: The input texts
+        :param threshold: The probability threshold for prediction
+        :return: One list of predicted sentiment labels per text, in input order
+        """
+        if self.cache is None:
+            return await asyncio.wrap_future(self.submit_many(user_inputs, threshold))
+        results = await self.cache.get_many(user_inputs, threshold)
+        missing = [i for i, labels in enumerate(results) if labels is None]
+        if missing:
+            missing_inputs = [user_inputs[i] for i in missing]
+            predicted = await asyncio.wrap_future(self.submit_many(missing_inputs, threshold))
+            self.cache.set_many(missing_inputs, threshold, predicted)
+            for i, labels in zip(missing, predicted):
+                results[i] = labels
+        return results
+
+    async def embed_async(self, user_inputs: List[str]) -> numpy.ndarray:
+        """
+        Awaitable sentence embeddings for the async request handlers
+
+        :param user_inputs: The input texts
+        :return: Array with one L2-normalized embedding per text
+        """
+        return await asyncio.wrap_future(self.submit_embedding(user_inputs))
+
+    def predict(self, user_input: str, threshold: float = 0.5) -> List[str]:
+        """
+        Blocking predict for callers running outside the event loop
+
+        :param user_input: The input text from the user
+        :param threshold: The probability threshold for prediction
+        :return: A list of predicted sentiment labels
+        """
+        return self.submit(user_input, threshold).result()
+
+    def stats(self) -> Dict[str, float]:
+        """Return queue depth and batch size statistics"""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queued": self.max_queued,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self._max_batch,
+                "last_batch_size": self._last_batch,
+                "avg_inference_ms": round(self._inference_seconds * 1000 / self._batches, 2) if self._batches else 0.0,
+            }
+
+    def _ensure_worker(self):
+        """Start the inference thread on first use (once per process)"""
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+                return
+            self._worker = threading.Thread(target=self._run, name="emotion-batcher", daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _collect_batch(self) -> List[_PendingPrediction]:
+        """Block for the first request, then gather more until the window closes or the batch is full"""
+        batch = [self._queue.get()]
+        size = len(batch[0].user_inputs)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    pending = self._queue.get_nowait()
+                else:
+                    pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.user_inputs)
+        return batch
+
+    def _run(self):
+        """Inference loop of the batcher thread"""
+        while True:
+            batch = self._collect_batch()
+            # Skip callers that gave up while waiting
+            batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+            # and requests whose deadline passed while they were queued
+            now = time.monotonic()
+            expired = [pending for pending in batch if pending.deadline is not None and pending.deadline <= now]
+            if expired:
+                for pending in expired:
+                    pending.future.set_exception(DeadlineException("Request deadline exceeded before emotion inference"))
+                with self._lock:
+                    self._expired += len(expired)
+                batch = [pending for pending in batch if pending.deadline is None or pending.deadline > now]
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: List[_PendingPrediction]):
+        """Run length-bucketed forward passes and hand every caller its own labels"""
+        embeddings = [pending for pending in batch if pending.embed]
+        if embeddings:
+            self._process_embeddings(embeddings)
+            batch = [pending for pending in batch if not pending.embed]
+            if not batch:
+                return
+        user_inputs = [user_input for pending in batch for user_input in pending.user_inputs]
+        started = time.perf_counter()
+        try:
+            probabilities = self.emotion_model.predict_proba_batch(user_inputs, batch_size=self.max_batch_size)
+        except Exception as e:
+            logging.error(f"Emotion batch inference failed: {e}")
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+
+        offset = 0
+        for pending in batch:
+            rows = probabilities[offset:offset + len(pending.user_inputs)]
+            offset += len(pending.user_inputs)
+            labels = self.emotion_model.select_labels_batch(rows, pending.threshold)
+            pending.future.set_result(labels[0] if pending.single else labels)
+
+        with self._lock:
+            self._batches += 1
+            self._items += len(user_inputs)
+            self._max_batch = max(self._max_batch, len(user_inputs))
+            self._last_batch = len(user_inputs)
+            self._inference_seconds += elapsed
+
+    def _process_embeddings(self, batch: List[_PendingPrediction]):
+        """Embed the texts of the embedding requests with one encoder pass per bucket"""
+        user_inputs = [user_input for pending in batch for user_input in pending.user_inputs]
+        try:
+            embeddings = self.emotion_model.embed_batch(user_inputs, batch_size=self.max_batch_size)
+        except Exception as e:
+            logging.error(f"Sentence embedding failed: {e}")
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        offset = 0
+        for pending in batch:
+            pending.future.set_result(embeddings[offset:offset + len(pending.user_inputs)])
+            offset += len(pending.user_inputs)
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.utils.lru_cache import TTLCache
+
+
+class EmotionCache:
+    """
+    Two-tier cache of emotion predictions.
+
+    A bounded in-process LRU sits in front of a Redis tier shared by all workers. Keys are a
+    hash of the normalized text, the threshold and the model version, so a new model never
+    serves labels of the old one. Redis failures only cost a cache miss.
+
+    Attributes:
+        model_version (str): Version of the model whose predictions are cached.
+        lowercase (bool): Whether the model's tokenizer lowercases input (case is then not part of the key).
+        ttl (int): Time-to-live of an entry in seconds, in both tiers.
+        max_text_length (int): Longer texts are not cached, they rarely repeat.
+    """
+
+    def __init__(self, model_version: str, lowercase: bool = False, max_entries: int = None, ttl: int = None,
+                 max_text_length: int = None, redis_client=None, use_redis: bool = None,
+                 prefix: str = "aimo:emotion:"):
+        """
+        Initialize the cache
+
+        :param model_version: Version of the model whose predictions are cached
+        :param lowercase: Whether the text is lowercased during normalization
+        :param max_entries: Size of the in-process LRU (defaults to settings)
+        :param ttl: Time-to-live in seconds (defaults to settings)
+        :param max_text_length: Longest text (in characters) that is cached (defaults to settings)
+        :param redis_client: Optional asyncio Redis client (defaults to the shared client)
+        :param use_redis: Whether to use the Redis tier (defaults to settings)
+        :param prefix: Key prefix for Redis keys
+        """
+        self.model_version = model_version
+        self.lowercase = lowercase
+        self.ttl = settings.EMOTION_CACHE_TTL if ttl is None else ttl
+        self.max_text_length = settings.EMOTION_CACHE_MAX_TEXT_LENGTH if max_text_length is None else max_text_length
+        self.prefix = prefix
+        self.local = TTLCache(max_entries or settings.EMOTION_CACHE_MAX_ENTRIES, self.ttl)
+
+        use_redis = settings.EMOTION_CACHE_REDIS_ENABLED if use_redis is None else use_redis
+        self.redis_client = (redis_client or get_redis()) if use_redis else None
+
+        self._lock = threading.Lock()
+        self._background_tasks = set()
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+        self.skipped = 0
+        # Skip the Redis tier for a while after an error, so an outage costs one timeout, not one per request
+        self._redis_retry_at = 0.0
+
+    def normalize(self, text: str) -> str:
+        """Collapse whitespace (and case, for uncased models) so equivalent inputs share a key"""
+        text = " ".join(text.split())
+        return text.lower() if self.lowercase else text
+
+    def key(self, text: str, threshold: float) -> str:
+        """Build the cache key of a text"""
+        raw = f"{self.model_version}|{threshold:.4f}|{self.normalize(text)}"
+        return f"{self.prefix}{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def cacheable(self, text: str) -> bool:
+        """Whether a text is short enough to be cached"""
+        return len(text) <= self.max_text_length
+
+    async def get_many(self, texts: List[str], threshold: float) -> List[Optional[List[str]]]:
+        """
+        Look up the labels of several texts, local tier first, then Redis
+
+        :param texts: The input texts
+        :param threshold: The probability threshold the labels were computed with
+        :return: The cached labels per text, None for misses
+        """
+        results: List[Optional[List[str]]] = [None] * len(texts)
+        remote = {}
+        for i, text in enumerate(texts):
+            if not self.cacheable(text):
+                with self._lock:
+                    self.skipped += 1
+                continue
+            key = self.key(text, threshold)
+            labels = self.local.get(key)
+            if labels is not None:
+                results[i] = labels
+            else:
+                remote.setdefault(key, []).append(i)
+
+        if remote and self._redis_available():
+            keys = list(remote)
+            try:
+                values = await self.redis_client.mget(keys)
+            except (RedisError, OSError) as e:
+                self._record_redis_error(e)
+                return results
+            hits = 0
+            for key, value in zip(keys, values):
+                if value is None:
+                    continue
+                try:
+                    labels = json.loads(value)
+                except (json.JSONDecodeError, TypeError):
+                    continue
+                hits += 1
+                # Promote to the local tier
+                self.local.set(key, labels)
+                for i in remote[key]:
+                    results[i] = labels
+            with self._lock:
+                self.redis_hits += hits
+                self.redis_misses += len(keys) - hits
+        return results
+
+    def set_many(self, texts: List[str], threshold: float, labels: List[List[str]]):
+        """
+        Store predictions in the local tier and, in the background, in Redis
+
+        :param texts: The input texts
+        :param threshold: The probability threshold the labels were computed with
+        :param labels: The predicted labels per text
+        """
+        entries = {}
+        for text, text_labels in zip(texts, labels):
+            if self.cacheable(text):
+                key = self.key(text, threshold)
+                self.local.set(key, text_labels)
+                entries[key] = text_labels
+        if entries and self._redis_available():
+            task = asyncio.create_task(self._store_remote(entries))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    async def _store_remote(self, entries: Dict[str, List[str]]):
+        """Write entries to Redis with one pipelined round trip"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, text_labels in entries.items():
+                    pipe.set(key, json.dumps(text_labels), ex=self.ttl)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and time.monotonic() >= self._redis_retry_at
+
+    def _record_redis_error(self, error: Exception):
+        with self._lock:
+            self.redis_errors += 1
+            self._redis_retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+        logging.warning(f"Emotion cache Redis tier unavailable: {error}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit-ratio counters of both tiers"""
+        local = self.local.stats()
+        with self._lock:
+            hits = local["hits"] + self.redis_hits
+            lookups = local["hits"] + local["misses"]
+            return {
+                "local_size": local["size"],
+                "local_hits": local["hits"],
+                "local_evictions": local["evictions"],
+                "redis_hits": self.redis_hits,
+                "redis_misses": self.redis_misses,
+                "redis_errors": self.redis_errors,
+                "misses": lookups - hits,
+                "skipped": self.skipped,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,222 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy
+
+from app.core.config import settings
+from app.exceptions.emotion_exceptions import EmotionException
+
+"""
+Description:
+    Client of the out-of-process emotion inference server (app/ai/emotion_server.py).
+
+    Messages are length-prefixed JSON frames over a Unix socket: a 4-byte big-endian length
+    followed by the UTF-8 JSON body. Requests carry an id, so many predictions can be in
+    flight on one connection and responses may come back in any order.
+
+        request:  {"id": 1, "texts": ["..."], "threshold": 0.5}
+        response: {"id": 1, "labels": [["joy"]]} or {"id": 1, "error": "...", "status_code": 503}
+
+    Sentence embeddings use the same framing with "op": "embed":
+
+        request:  {"id": 2, "op": "embed", "texts": ["..."]}
+        response: {"id": 2, "embeddings": [[0.01, ...]]}
+"""
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(message: dict) -> bytes:
+    """Serialize a message to a length-prefixed frame"""
+    body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return len(body).to_bytes(4, "big") + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    """
+    Read one length-prefixed frame
+
+    :raises asyncio.IncompleteReadError: If the peer closed the connection
+    :raises ValueError: If the frame is larger than MAX_FRAME_SIZE
+    """
+    length = int.from_bytes(await reader.readexactly(4), "big")
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds the limit of {MAX_FRAME_SIZE} bytes")
+    return json.loads(await reader.readexactly(length))
+
+
+class _Connection:
+    """One multiplexed connection to the inference server"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.closed = False
+        self.reader_task = asyncio.create_task(self._read_responses())
+
+    async def _read_responses(self):
+        """Hand every response to the request waiting for it"""
+        try:
+            while True:
+                response = await read_frame(self.reader)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (asyncio.IncompleteReadError, OSError, ValueError) as e:
+            self.close(ConnectionError(f"Emotion inference server connection lost: {e!r}"))
+
+    def close(self, error: Exception):
+        """Close the connection and fail the requests still waiting on it"""
+        self.closed = True
+        self.writer.close()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+
+class RemoteEmotionClient:
+    """
+    Drop-in replacement for the EmotionBatcher that sends predictions to the inference server.
+
+    Web workers using it never import torch or transformers. Micro-batching, the prediction
+    cache and the model all live in the inference server processes.
+
+    Attributes:
+        socket_path (str): Unix socket of the inference server.
+        timeout (float): Seconds to wait for a prediction.
+        connections (int): Number of connections, several inference processes can then share the load.
+    """
+
+    # Interface of the EmotionBatcher, the model and the cache live in the inference server
+    emotion_model = None
+    cache = None
+
+    def __init__(self, socket_path: str = None, timeout: float = None, connections: int = None):
+        """
+        Initialize the client, connections are opened on first use
+
+        :param socket_path: Unix socket of the inference server (defaults to settings)
+        :param timeout: Seconds to wait for a prediction (defaults to settings)
+        :param connections: Number of connections per process (defaults to settings)
+        """
+        self.socket_path = socket_path or settings.EMOTION_SOCKET_PATH
+        self.timeout = timeout or settings.EMOTION_REMOTE_TIMEOUT
+        self.connections = max(1, connections or settings.EMOTION_REMOTE_CONNECTIONS)
+
+        self._pool: List[Optional[_Connection]] = [None] * self.connections
+        self._pool_loop: asyncio.AbstractEventLoop = None
+        self._connect_lock: asyncio.Lock = None
+        self._ids = itertools.count(1)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+        # Statistics
+        self._requests = 0
+        self._items = 0
+        self._errors = 0
+        self._reconnects = 0
+        self._roundtrip_seconds = 0.0
+
+    async def _connection(self) -> _Connection:
+        """Pick the next connection of the pool, (re)connecting if needed"""
+        loop = asyncio.get_running_loop()
+        if self._pool_loop is not loop:
+            # Connections belong to the event loop that opened them
+            self._pool = [None] * self.connections
+            self._pool_loop = loop
+            self._connect_lock = asyncio.Lock()
+        slot = next(self._next) % self.connections
+        connection = self._pool[slot]
+        if connection is None or connection.closed:
+            async with self._connect_lock:
+                connection = self._pool[slot]
+                if connection is None or connection.closed:
+                    reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=MAX_FRAME_SIZE)
+                    connection = self._pool[slot] = _Connection(reader, writer)
+                    with self._lock:
+                        self._reconnects += 1
+        return connection
+
+    async def _request(self, texts: List[str], threshold: float, op: str = "predict") -> list:
+        """Send one prediction (or embedding) request and wait for its labels (or embeddings)"""
+        started = time.perf_counter()
+        request_id = next(self._ids)
+        connection = None
+        try:
+            connection = await asyncio.wait_for(self._connection(), self.timeout)
+            future = asyncio.get_running_loop().create_future()
+            connection.pending[request_id] = future
+            request = {"id": request_id, "texts": texts, "threshold": threshold}
+            if op != "predict":
+                request["op"] = op
+            connection.writer.write(encode_frame(request))
+            await connection.writer.drain()
+            response = await asyncio.wait_for(future, self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            with self._lock:
+                self._errors += 1
+            logging.error(f"Emotion inference server unavailable at {self.socket_path}: {e!r}")
+            raise EmotionException("Emotion inference service is unavailable")
+        finally:
+            if connection is not None:
+                connection.pending.pop(request_id, None)
+
+        if "error" in response:
+            with self._lock:
+                self._errors += 1
+            raise EmotionException(response["error"], response.get("status_code", 500))
+        with self._lock:
+            self._requests += 1
+            self._items += len(texts)
+            self._roundtrip_seconds += time.perf_counter() - started
+        return response["embeddings"] if op == "embed" else response["labels"]
+
+    async def predict_async(self, user_input: str, threshold: float = 0.5) -> List[str]:
+        """
+        Predict the emotions of one text in the inference server
+
+        :param user_input: The input text from the user
+        :param threshold: The probability threshold for prediction
+        :return: A list of predicted sentiment labels
+        """
+        return (await self._request([user_input], threshold))[0]
+
+    async def predict_many_async(self, user_inputs: List[str], threshold: float = 0.5) -> List[List[str]]:
+        """
+        Predict the emotions of many texts in the inference server
+
+        :param user_inputs: The input texts
+        :param threshold: The probability threshold for prediction
+        :return: One list of predicted sentiment labels per text, in input order
+        """
+        if not user_inputs:
+            return []
+        return await self._request(list(user_inputs), threshold)
+
+    async def embed_async(self, user_inputs: List[str]) -> numpy.ndarray:
+        """
+        Compute sentence embeddings in the inference server
+
+        :param user_inputs: The input texts
+        :return: Array with one L2-normalized embedding per text
+        """
+        return numpy.asarray(await self._request(list(user_inputs), 0.0, op="embed"), dtype=numpy.float32)
+
+    def stats(self) -> Dict[str, float]:
+        """Return request, error and round-trip statistics of this web worker"""
+        with self._lock:
+            return {
+                "connections": sum(1 for connection in self._pool if connection is not None and not connection.closed),
+                "requests": self._requests,
+                "items": self._items,
+                "errors": self._errors,
+                "reconnects": self._reconnects,
+                "avg_roundtrip_ms": round(self._roundtrip_seconds * 1000 / self._requests, 2) if self._requests else 0.0,
+            }
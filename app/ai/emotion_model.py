@@ -1,3 +1,4 @@
+import hashlib
 import logging
 from pathlib import Path
 from typing import List
@@ -6,6 +7,9 @@ import numpy
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
+from app.ai.emotion_backends import build_backend, PARITY_PROBES
+from app.core.config import settings
+
 
 class EmotionModel:
     """
@@ -14,13 +18,17 @@ class EmotionModel:
     Attributes:
         device (str): The device to run on ('cuda' or 'cpu').
         tokenizer (AutoTokenizer): The tokenizer responsible for text encoding.
-        model (AutoModelForSequenceClassification): The pre-trained sentiment classification model.
+        model (AutoModelForSequenceClassification): The pre-trained sentiment classification model (fp32).
+        backend: The inference backend serving predictions (see app/ai/emotion_backends.py).
         emotion_labels (List[str]): A list of sentiment labels.
+        version (str): Fingerprint of the model files and labels, used to key cached predictions.
     """
 
-    def __init__(self):
+    def __init__(self, backend: str = None):
         """
         Initialize the sentiment analysis model
+
+        :param backend: Inference backend name (defaults to settings.EMOTION_BACKEND)
         """
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -43,6 +51,7 @@ class EmotionModel:
         # Load emotion labels
         with open(mapping_file, "r", encoding="utf-8") as f:
             self.emotion_labels = [line.strip() for line in f.readlines()]
+        self._label_array = numpy.asarray(self.emotion_labels)
 
         # Load tokenizer and model
         logging.info(f"Loading sentiment analysis model: {model_path} to {self.device} ...")
@@ -50,6 +59,75 @@ class EmotionModel:
         self.model = AutoModelForSequenceClassification.from_pretrained(str(model_path)).to(self.device)
         logging.info(f"Sentiment analysis model loaded, running on device: {self.device}")
 
+        # Build the inference backend, keeping the fp32 model as the parity reference
+        fingerprint = self._fingerprint(model_path)
+        self.backend = self._build_backend(backend or settings.EMOTION_BACKEND, model_path, fingerprint)
+        self.device = self.backend.device
+        logging.info(f"Sentiment analysis backend: {self.backend.name} on {self.device}")
+
+        # Backends may differ slightly in their labels, so each one gets its own cache version
+        self.version = f"{settings.EMOTION_MODEL_VERSION or fingerprint}-{self.backend.name}"
+
+    def _build_backend(self, name: str, model_path: Path, fingerprint: str = None):
+        """Build the requested backend, falling back to eager fp32 if it does not reproduce its labels"""
+        reference = build_backend("eager", self.model, self.device, model_path)
+        if name == "eager":
+            return reference
+        try:
+            backend = build_backend(name, self.model, self.device, model_path, fingerprint)
+        except Exception as e:
+            logging.error(f"Failed to build the {name} emotion backend, falling back to eager: {e}")
+            return reference
+
+        if settings.EMOTION_BACKEND_PARITY_CHECK:
+            agreement = self.label_agreement(reference, backend, PARITY_PROBES)
+            if agreement < 1.0:
+                logging.warning(f"The {name} emotion backend only reproduces {agreement:.0%} of the fp32 labels, "
+                                f"falling back to eager")
+                return reference
+        return backend
+
+    def label_agreement(self, reference, candidate, texts: List[str], threshold: float = 0.5) -> float:
+        """
+        Share of texts for which two backends predict exactly the same labels
+
+        :param reference: The reference backend (usually eager fp32)
+        :param candidate: The backend to check
+        :param texts: Probe texts
+        :param threshold: The probability threshold for prediction
+        :return: Agreement ratio between 0 and 1
+        """
+        labels = []
+        for backend in (reference, candidate):
+            inputs = self.encode(texts, backend.device)
+            labels.append(self.select_labels_batch(sigmoid(backend(inputs)), threshold))
+        return sum(a == b for a, b in zip(*labels)) / len(texts)
+
+    def encode(self, user_inputs: List[str], device: str):
+        """Tokenize texts into a padded batch on the given device"""
+        return self.tokenizer(
+            user_inputs,
+            return_tensors="pt",
+            truncation=True,
+            padding=True,
+            max_length=128
+        ).to(device)
+
+    @property
+    def lowercase_inputs(self) -> bool:
+        """Whether the tokenizer lowercases its input"""
+        return bool(getattr(self.tokenizer, "do_lower_case", False))
+
+    def _fingerprint(self, model_path: Path) -> str:
+        """Hash the model config, weights and labels into a short version string"""
+        digest = hashlib.sha256("\n".join(self.emotion_labels).encode("utf-8"))
+        for file in sorted(model_path.iterdir()):
+            if file.suffix in (".json", ".safetensors", ".bin"):
+                with open(file, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+        return digest.hexdigest()[:16]
+
     def predict(self, user_input: str, threshold: float = 0.5) -> List[str]:
         """
         Predict sentiment labels for the input text
@@ -58,23 +136,96 @@ class EmotionModel:
         :param threshold: The probability threshold for prediction (default 0.5)
         :return: A list of predicted sentiment labels
         """
-        # Encode the input
-        inputs = self.tokenizer(
-            user_input,
-            return_tensors="pt",
-            truncation=True,
-            padding=True,
-            max_length=128
-        ).to(self.device)
+        return self.predict_batch([user_input], threshold)[0]
 
-        # Inference
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            probabilities = torch.sigmoid(outputs.logits).cpu().numpy().squeeze()
+    def predict_batch(self, user_inputs: List[str], threshold: float = 0.5) -> List[List[str]]:
+        """
+        Predict sentiment labels for several texts
+
+        :param user_inputs: The input texts
+        :param threshold: The probability threshold for prediction (default 0.5)
+        :return: One list of predicted sentiment labels per input text
+        """
+        return self.select_labels_batch(self.predict_proba_batch(user_inputs), threshold)
+
+    def predict_proba_batch(self, user_inputs: List[str], batch_size: int = None) -> numpy.ndarray:
+        """
+        Compute label probabilities for many texts with length-bucketed padding
+
+        The texts are sorted by token length and split into chunks of `batch_size`, so every
+        forward pass only pads up to the longest text of similar length.
+
+        :param user_inputs: The input texts
+        :param batch_size: Maximum number of texts per forward pass (default: all at once)
+        :return: Array of shape (len(user_inputs), len(emotion_labels)) in input order
+        """
+        # Encode without padding to learn the token length of every text
+        encodings = self.tokenizer(user_inputs, truncation=True, max_length=128)
+        order = numpy.argsort([len(input_ids) for input_ids in encodings["input_ids"]], kind="stable")
+        batch_size = batch_size or len(user_inputs)
+
+        probabilities = numpy.empty((len(user_inputs), len(self.emotion_labels)), dtype=numpy.float32)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            # Pad the bucket to its own longest text
+            inputs = self.tokenizer.pad(
+                {key: [values[i] for i in indices] for key, values in encodings.items()},
+                padding=True,
+                return_tensors="pt"
+            ).to(self.device)
+
+            # Inference
+            probabilities[indices] = sigmoid(self.backend(inputs))
+
+        return probabilities
+
+    def embed_batch(self, user_inputs: List[str], batch_size: int = 64) -> numpy.ndarray:
+        """
+        Compute sentence embeddings with the encoder of the classifier
+
+        The last hidden states of the fp32 encoder are mean-pooled over the tokens of each text
+        and L2-normalized, so the dot product of two embeddings is their cosine similarity.
+
+        :param user_inputs: The input texts
+        :param batch_size: Maximum number of texts per forward pass
+        :return: Array of shape (len(user_inputs), hidden_size)
+        """
+        encoder = self.model.base_model
+        device = next(encoder.parameters()).device
+        embeddings = numpy.empty((len(user_inputs), encoder.config.hidden_size), dtype=numpy.float32)
+        for start in range(0, len(user_inputs), batch_size):
+            inputs = self.encode(user_inputs[start:start + batch_size], device)
+            with torch.inference_mode():
+                hidden = encoder(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                pooled = torch.nn.functional.normalize(pooled.float(), dim=-1)
+            embeddings[start:start + batch_size] = pooled.cpu().numpy()
+        return embeddings
+
+    def select_labels(self, probabilities: numpy.ndarray, threshold: float = 0.5) -> List[str]:
+        """
+        Select sentiment labels above the threshold
+
+        :param probabilities: The label probabilities of one text
+        :param threshold: The probability threshold for prediction
+        :return: A list of predicted sentiment labels
+        """
+        return self.select_labels_batch(probabilities[numpy.newaxis, :], threshold)[0]
+
+    def select_labels_batch(self, probabilities: numpy.ndarray, threshold: float = 0.5) -> List[List[str]]:
+        """
+        Select sentiment labels above the threshold for a whole batch at once
+
+        :param probabilities: Label probabilities of shape (batch, len(emotion_labels))
+        :param threshold: The probability threshold for prediction
+        :return: One list of predicted sentiment labels per row
+        """
+        mask = probabilities > numpy.float32(threshold)
+        selected = self._label_array[numpy.nonzero(mask)[1]]
+        return [labels.tolist() for labels in numpy.split(selected, numpy.cumsum(mask.sum(axis=1))[:-1])]
 
-        # Select sentiment labels above the threshold
-        predicted_labels = [
-            self.emotion_labels[i] for i, p in enumerate(probabilities) if p > numpy.float32(threshold)
-        ]
 
-        return predicted_labels
\ No newline at end of file
+def sigmoid(logits: numpy.ndarray) -> numpy.ndarray:
+    """Numerically stable sigmoid"""
+    return numpy.exp(-numpy.logaddexp(0, -logits)).astype(numpy.float32)
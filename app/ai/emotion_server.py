@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+
+import torch
+
+from app.ai.emotion_client import encode_frame, read_frame, MAX_FRAME_SIZE
+from app.ai.model_registry import get_local_emotion_batcher
+from app.core.config import settings
+from app.exceptions.server_exceptions import ServerException
+
+"""
+Description:
+    Out-of-process emotion inference server.
+
+    The server owns the EmotionModel, its micro-batcher and the prediction cache. Web workers
+    running with EMOTION_INFERENCE_MODE=remote send their predictions over a Unix socket
+    (see app/ai/emotion_client.py for the protocol) and never load torch themselves, so the
+    inference pool and the web worker pool can be sized independently.
+
+    With --workers N the model is loaded once, then N processes are forked that share the
+    weights copy-on-write and accept connections on the same socket.
+
+Usage:
+    python -m app.ai.emotion_server [--socket /tmp/aimo-emotion.sock] [--workers 2]
+"""
+
+
+class EmotionInferenceServer:
+    """Serve prediction requests of the web workers with the local EmotionBatcher"""
+
+    def __init__(self, emotion_batcher):
+        self.emotion_batcher = emotion_batcher
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Read requests from one web worker connection, each one is answered as soon as it is done"""
+        tasks = set()
+        # The answers are written by concurrent tasks, one frame and drain at a time
+        write_lock = asyncio.Lock()
+        try:
+            while True:
+                request = await read_frame(reader)
+                task = asyncio.create_task(self._answer(request, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            logging.error(f"Invalid request from web worker, closing the connection: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, request: dict, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        """Predict the labels (or embeddings) of one request and write the response frame"""
+        response = {"id": request.get("id")}
+        try:
+            if request.get("op") == "embed":
+                response["embeddings"] = (await self.emotion_batcher.embed_async(request["texts"])).tolist()
+            else:
+                response["labels"] = await self.emotion_batcher.predict_many_async(
+                    request["texts"], request.get("threshold", 0.5))
+        except ServerException as e:
+            response.update(error=e.message, status_code=e.status_code)
+        except Exception as e:
+            logging.error(f"Emotion inference request failed: {e!r}")
+            response.update(error="Emotion inference failed", status_code=500)
+        async with write_lock:
+            if not writer.is_closing():
+                writer.write(encode_frame(response))
+                await writer.drain()
+
+    async def serve(self, sock: socket.socket):
+        """Accept web worker connections on a bound and listening Unix socket"""
+        server = await asyncio.start_unix_server(self.handle_connection, sock=sock, limit=MAX_FRAME_SIZE)
+        async with server:
+            await server.serve_forever()
+
+
+def bind_socket(path: str) -> socket.socket:
+    """Bind the Unix socket, replacing a stale socket file of a previous run"""
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1024)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve emotion inference to the web workers over a Unix socket")
+    parser.add_argument("--socket", default=settings.EMOTION_SOCKET_PATH)
+    parser.add_argument("--workers", type=int, default=settings.EMOTION_INFERENCE_WORKERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    # Load the model before forking, the inference processes share its pages copy-on-write
+    server = EmotionInferenceServer(get_local_emotion_batcher())
+    sock = bind_socket(args.socket)
+    gc.freeze()
+
+    workers = max(1, args.workers)
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = []
+            break
+        children.append(pid)
+
+    if "OMP_NUM_THREADS" not in os.environ:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+    def stop(signum, frame):
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logging.info(f"Emotion inference process {os.getpid()} serving on {args.socket}")
+    asyncio.run(server.serve(sock))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+from redis.exceptions import RedisError
+
+from app.ai.response_cache import collect_completion
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.exceptions.idempotency_exceptions import IdempotencyException
+from app.utils.lru_cache import TTLCache
+from app.utils.sse_utils import SSEFrameParser
+
+"""
+Description:
+    Idempotency keys for chat completions, so requests retried by clients on flaky networks
+    do not start a new upstream generation.
+
+    The first request with a key claims it in Redis (SET NX) and its generation runs in a
+    background task, decoupled from the client connection, so the retry of a dropped request
+    still gets its result. Once no request follows the generation any more, it keeps running
+    for CHAT_IDEMPOTENCY_ABANDON_GRACE seconds and is then cancelled, which closes the upstream
+    stream and releases the key. Retries landing on the same worker while the generation runs
+    attach to it and receive every frame from the start (stream fan-out), retries landing on
+    another worker wait for the result to be stored. Completed results are replayed for
+    CHAT_IDEMPOTENCY_TTL seconds. Keys are scoped per user, and a key reused for a different
+    request is rejected.
+"""
+
+
+class InFlightGeneration:
+    """
+    A generation running in this worker, followed by the original request and its retries.
+
+    Attributes:
+        fingerprint (str): Fingerprint of the request that started the generation.
+        frames (list): The SSE frames produced so far (streaming requests).
+        result (tuple): The completion text and usage, once the generation finished.
+        error (Exception): The error the generation failed with.
+        followers (int): Number of requests following the generation.
+        task (asyncio.Task): The background task running the generation.
+    """
+
+    def __init__(self, fingerprint: str, abandon_grace: float = None):
+        self.fingerprint = fingerprint
+        self.frames: List[Any] = []
+        self.result: Optional[Tuple[str, Optional[Dict[str, int]]]] = None
+        self.error: Optional[Exception] = None
+        self.done = False
+        self.followers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.abandon_grace = settings.CHAT_IDEMPOTENCY_ABANDON_GRACE if abandon_grace is None else abandon_grace
+        self._changed = asyncio.Event()
+        self._abandon_handle: Optional[asyncio.TimerHandle] = None
+
+    def publish(self, frame):
+        """Add the next frame and wake up the followers"""
+        self.frames.append(frame)
+        self._notify()
+
+    def finish(self, result: Tuple[str, Optional[Dict[str, int]]] = None, error: Exception = None):
+        """End the generation with its result or its error"""
+        self.result, self.error, self.done = result, error, True
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _attach(self):
+        self.followers += 1
+        if self._abandon_handle is not None:
+            self._abandon_handle.cancel()
+            self._abandon_handle = None
+
+    def _detach(self):
+        """A follower went away, the generation is cancelled after the grace period if no other one follows"""
+        self.followers -= 1
+        if self.followers == 0 and not self.done and self.task is not None:
+            self._abandon_handle = asyncio.get_running_loop().call_later(self.abandon_grace, self._abandon)
+
+    def _abandon(self):
+        self._abandon_handle = None
+        if self.followers == 0 and not self.done:
+            self.task.cancel()
+
+    async def follow(self) -> AsyncIterator:
+        """
+        Iterate over all frames of the generation, from the first one
+
+        :return: Async iterator of the frames, raising the error of a failed generation
+        """
+        position = 0
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                while position < len(self.frames):
+                    yield self.frames[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self._detach()
+
+    async def wait(self) -> Tuple[str, Optional[Dict[str, int]]]:
+        """
+        Wait for the end of the generation
+
+        :return: The completion text and usage
+        """
+        self._attach()
+        try:
+            while not self.done:
+                await self._changed.wait()
+        finally:
+            self._detach()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class IdempotencyStore:
+    """
+    Claims, running generations and results of idempotency keys.
+
+    Attributes:
+        ttl (int): Seconds a completed result is replayed.
+        lock_ttl (int): Seconds a key stays claimed by a running generation.
+        wait_timeout (float): Seconds a retry waits for the generation of another worker.
+        abandon_grace (float): Seconds a generation nobody follows keeps running before it is cancelled.
+    """
+
+    def __init__(self, redis_client=None, use_redis: bool = True, prefix: str = "aimo:idempotency:"):
+        """
+        Initialize the store
+
+        :param redis_client: Optional asyncio Redis client (defaults to the shared client)
+        :param use_redis: Whether to share the keys between workers through Redis
+        :param prefix: Key prefix for Redis keys
+        """
+        self.ttl = settings.CHAT_IDEMPOTENCY_TTL
+        self.lock_ttl = settings.CHAT_IDEMPOTENCY_LOCK_TTL
+        self.wait_timeout = settings.CHAT_IDEMPOTENCY_WAIT_TIMEOUT
+        self.poll_interval = settings.CHAT_IDEMPOTENCY_POLL_INTERVAL
+        self.abandon_grace = settings.CHAT_IDEMPOTENCY_ABANDON_GRACE
+        self.prefix = prefix
+        self.redis_client = (redis_client or get_redis()) if use_redis else None
+        self.local = TTLCache(settings.CHAT_IDEMPOTENCY_LOCAL_ENTRIES, self.ttl)
+
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, InFlightGeneration] = {}
+        self._background_tasks = set()
+
+        # Statistics
+        self.started = 0
+        self.attached = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.abandoned = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def fingerprint(body: dict) -> str:
+        """Hash of a request body, a key must not be reused for a different request"""
+        raw = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def key(self, subject: Optional[str], idempotency_key: str) -> str:
+        """Redis key of an idempotency key, unique across users"""
+        owner = hashlib.sha256((subject or "").encode("utf-8")).hexdigest()[:16]
+        digest = hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()[:32]
+        return f"{self.prefix}{owner}:{digest}"
+
+    async def start(self, key: str, fingerprint: str,
+                    generate: Callable[[], Any]) -> Union[InFlightGeneration, dict]:
+        """
+        Deduplicate a request: return its stored result, attach to its running generation or start it
+
+        :param key: The store key (see key())
+        :param fingerprint: Fingerprint of the request body
+        :param generate: Callable starting the generation, returning an async iterator of SSE frames
+            (streaming requests) or a coroutine of the completion text and usage
+        :return: The generation to follow, or the stored result ({"content": ..., "usage": ...})
+        :raises IdempotencyException: If the key was used for a different request, or its generation
+            runs in another worker and did not finish within the wait timeout
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            outcome = self._find_local(key, fingerprint)
+            if outcome is not None:
+                return outcome
+            claimed = await self._claim(key, fingerprint)
+            # Another request of this worker may have claimed the key meanwhile
+            outcome = self._find_local(key, fingerprint)
+            if outcome is not None:
+                return outcome
+            if claimed:
+                return self._start_generation(key, fingerprint, generate)
+
+            # Claimed by another worker: poll for its result, or claim the key again once it was released
+            record = await self._load(key)
+            if record is not None:
+                self._check_fingerprint(record["fingerprint"], fingerprint)
+                if "content" in record:
+                    self.local.set(key, record)
+                    with self._lock:
+                        self.replayed += 1
+                    return record
+            if time.monotonic() >= deadline:
+                raise IdempotencyException()
+            await asyncio.sleep(self.poll_interval)
+
+    def _find_local(self, key: str, fingerprint: str) -> Union[InFlightGeneration, dict, None]:
+        """The generation running in this worker or the result it stored"""
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self._check_fingerprint(flight.fingerprint, fingerprint)
+            with self._lock:
+                self.attached += 1
+            return flight
+        record = self.local.get(key)
+        if record is not None:
+            self._check_fingerprint(record["fingerprint"], fingerprint)
+            with self._lock:
+                self.replayed += 1
+        return record
+
+    def _check_fingerprint(self, expected: str, fingerprint: str):
+        if expected != fingerprint:
+            with self._lock:
+                self.conflicts += 1
+            raise IdempotencyException("The Idempotency-Key was used for a different request", 422)
+
+    async def _claim(self, key: str, fingerprint: str) -> bool:
+        """Claim a key for this worker, True if no other request holds it"""
+        if self.redis_client is None:
+            return True
+        try:
+            return bool(await self.redis_client.set(key, json.dumps({"fingerprint": fingerprint}),
+                                                    nx=True, ex=self.lock_ttl))
+        except (RedisError, OSError) as e:
+            # Retries are then only deduplicated within this worker
+            self._record_redis_error(e)
+            return True
+
+    async def _load(self, key: str) -> Optional[dict]:
+        try:
+            value = await self.redis_client.get(key)
+            return json.loads(value) if value is not None else None
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+        except (json.JSONDecodeError, TypeError):
+            pass
+        return None
+
+    def _start_generation(self, key: str, fingerprint: str, generate: Callable[[], Any]) -> InFlightGeneration:
+        flight = InFlightGeneration(fingerprint, self.abandon_grace)
+        self._in_flight[key] = flight
+        with self._lock:
+            self.started += 1
+        # Not tied to the request, a client that disconnected gets the result when it retries
+        task = asyncio.create_task(self._generate(key, flight, generate))
+        flight.task = task
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return flight
+
+    async def _generate(self, key: str, flight: InFlightGeneration, generate: Callable[[], Any]):
+        """Run a generation to its end, store its result, or release the key so a retry starts over"""
+        try:
+            produced = generate()
+            if inspect.isawaitable(produced):
+                content, usage = await produced
+            else:
+                async for frame in produced:
+                    flight.publish(frame)
+                content, usage = collect_completion(flight.frames)
+            if not content or self._failed_stream(flight.frames):
+                # Upstream reported an error inside the stream, a retry has to reach the LLM API again
+                raise IdempotencyException("The generation failed, please retry", 502)
+            record = {"fingerprint": flight.fingerprint, "content": content, "usage": usage}
+            self.local.set(key, record)
+            flight.finish(result=(content, usage))
+            await self._store(key, record)
+        except Exception as e:
+            flight.finish(error=e)
+            await self._release(key)
+        except asyncio.CancelledError:
+            # Nobody followed the generation any more: the upstream stream is closed, a later retry starts over
+            with self._lock:
+                self.abandoned += 1
+            flight.finish(error=IdempotencyException("The request was interrupted, please retry", 503))
+            await self._release(key)
+            raise
+        finally:
+            if not flight.done:
+                flight.finish(error=IdempotencyException("The request was interrupted, please retry", 503))
+            self._in_flight.pop(key, None)
+
+    @staticmethod
+    def _failed_stream(frames: List[Any]) -> bool:
+        """Whether a stream forwarded an error payload of the LLM API"""
+        parser = SSEFrameParser()
+        for frame in frames:
+            payloads = parser.feed(frame) if isinstance(frame, bytes) else [frame["data"]]
+            for payload in payloads:
+                if isinstance(payload, str):
+                    payload = payload.encode("utf-8")
+                if payload.lstrip().startswith(b'{"error"'):
+                    return True
+        return False
+
+    async def _store(self, key: str, record: dict):
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.set(key, json.dumps(record, ensure_ascii=False), ex=self.ttl)
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+
+    async def _release(self, key: str):
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.delete(key)
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+
+    def _record_redis_error(self, error: Exception):
+        with self._lock:
+            self.redis_errors += 1
+        logging.warning(f"Idempotency store Redis error: {error}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return the deduplication counters"""
+        with self._lock:
+            return {
+                "in_flight": len(self._in_flight),
+                "started": self.started,
+                "attached": self.attached,
+                "replayed": self.replayed,
+                "conflicts": self.conflicts,
+                "abandoned": self.abandoned,
+                "redis_errors": self.redis_errors,
+            }
+
+
+_store: Optional[IdempotencyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Get the process-wide idempotency store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IdempotencyStore()
+    return _store
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from typing import Optional
+
+from aiohttp import web
+
+from app.ai.response_cache import replay_chunks
+
+"""
+Description:
+    A local OpenAI-compatible chat completions endpoint, for tests and for development
+    without an LLM API key. It answers every request with a fixed reply, streamed in small
+    chunks like the real endpoints do, and can be made slow or failing to exercise the
+    routing, failover and hedging of the providers.
+"""
+
+
+class MockProvider:
+    """
+    Mock LLM endpoint served on a local port.
+
+    Attributes:
+        reply (str): The reply to every request.
+        first_token_delay (float): Seconds before the first chunk (or the response).
+        chunk_delay (float): Seconds between two chunks of a stream.
+        status (int): HTTP status of the responses, an error status fails every request.
+        requests (int): Number of requests received.
+    """
+
+    def __init__(self, reply: str = "Hello from the mock provider", first_token_delay: float = 0.0,
+                 chunk_delay: float = 0.0, status: int = 200):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.status = status
+        self.requests = 0
+        self.usage = {"prompt_tokens": 10, "completion_tokens": len(reply.split()),
+                      "total_tokens": 10 + len(reply.split())}
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+    async def start(self) -> str:
+        """
+        Start serving on a free local port
+
+        :return: The chat completions URL
+        """
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        self.url = f"http://127.0.0.1:{self._runner.addresses[0][1]}/v1/chat/completions"
+        return self.url
+
+    async def stop(self):
+        """Stop serving"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        data = await request.json()
+        await asyncio.sleep(self.first_token_delay)
+        if self.status != 200:
+            return web.json_response({"error": {"message": "Mock provider error"}}, status=self.status)
+        model = data.get("model", "mock")
+        if not data.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply},
+                             "finish_reason": "stop"}],
+                "usage": self.usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        usage = self.usage if (data.get("stream_options") or {}).get("include_usage") else None
+        for chunk in replay_chunks(self.reply, usage, model):
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(self.chunk_delay)
+        await response.write(b"data: [DONE]\n\n")
+        return response
@@ -0,0 +1,75 @@
+import threading
+
+from app.ai.emotion_batcher import EmotionBatcher
+from app.ai.emotion_cache import EmotionCache
+from app.core.config import settings
+
+"""
+Description:
+    Process-wide registry of the loaded models. Every consumer (the emotion routes, AIMO
+    instances, scripts) gets the same EmotionModel and EmotionBatcher, so the weights are
+    loaded once per process no matter how many times AIMO is instantiated.
+
+    With EMOTION_INFERENCE_MODE=remote the consumers get a RemoteEmotionClient instead and
+    the model lives in the inference server (app/ai/emotion_server.py). EmotionModel is
+    imported lazily, so torch is never imported by the web workers in that mode.
+"""
+
+_lock = threading.Lock()
+_emotion_model = None
+_emotion_batcher = None
+_emotion_client = None
+
+
+def get_emotion_model():
+    """
+    Get the shared EmotionModel, loading it on first use
+
+    Returns:
+        EmotionModel: The process-wide emotion model
+    """
+    global _emotion_model
+    if _emotion_model is None:
+        with _lock:
+            if _emotion_model is None:
+                from app.ai.emotion_model import EmotionModel
+                _emotion_model = EmotionModel()
+    return _emotion_model
+
+
+def get_local_emotion_batcher() -> EmotionBatcher:
+    """
+    Get the shared EmotionBatcher (with its prediction cache) in front of the shared model
+
+    Returns:
+        EmotionBatcher: The process-wide emotion batcher
+    """
+    global _emotion_batcher
+    if _emotion_batcher is None:
+        emotion_model = get_emotion_model()
+        with _lock:
+            if _emotion_batcher is None:
+                emotion_cache = EmotionCache(emotion_model.version, emotion_model.lowercase_inputs) \
+                    if settings.EMOTION_CACHE_ENABLED else None
+                _emotion_batcher = EmotionBatcher(emotion_model, cache=emotion_cache)
+    return _emotion_batcher
+
+
+def get_emotion_batcher():
+    """
+    Get the emotion predictor of this process: the local EmotionBatcher, or the client of the
+    inference server when EMOTION_INFERENCE_MODE is remote. Both offer predict_async,
+    predict_many_async and stats.
+
+    Returns:
+        EmotionBatcher | RemoteEmotionClient: The process-wide emotion predictor
+    """
+    global _emotion_client
+    if settings.EMOTION_INFERENCE_MODE != "remote":
+        return get_local_emotion_batcher()
+    if _emotion_client is None:
+        with _lock:
+            if _emotion_client is None:
+                from app.ai.emotion_client import RemoteEmotionClient
+                _emotion_client = RemoteEmotionClient()
+    return _emotion_client
@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.utils.lru_cache import TTLCache
+
+"""
+Description:
+    Turns prepared while the user is still typing.
+
+    POST /chat/prepare is called with the draft conversation shortly before it is sent. Emotion
+    inference of the draft message runs right away and its result is kept for CHAT_PREPARE_TTL
+    seconds under the hash of the message text, in process and in Redis, so whichever worker
+    serves the following /chat/completions request finds it when the client echoes the
+    message_hash. The upstream messages built from the rest of the conversation are kept in
+    process as well. The completion then only waits for the LLM API, and if it arrives while
+    the preparation is still running it waits for that instead of running inference a second
+    time. Completions that were not prepared skip the lookup.
+"""
+
+
+class PreparedTurns:
+    """
+    Two-tier short-lived cache of the emotions and the upstream messages of draft turns.
+
+    Attributes:
+        ttl (int): Seconds a prepared turn is kept.
+    """
+
+    def __init__(self, ttl: int = None, max_entries: int = None, redis_client=None, use_redis: bool = True,
+                 prefix: str = "aimo:prepared:"):
+        """
+        Initialize the cache
+
+        :param ttl: Seconds a prepared turn is kept (defaults to settings)
+        :param max_entries: Size of the in-process tiers (defaults to settings)
+        :param redis_client: Optional asyncio Redis client (defaults to the shared client)
+        :param use_redis: Whether to share the emotions between workers through Redis
+        :param prefix: Key prefix for Redis keys
+        """
+        self.ttl = settings.CHAT_PREPARE_TTL if ttl is None else ttl
+        self.prefix = prefix
+        max_entries = max_entries or settings.CHAT_PREPARE_LOCAL_ENTRIES
+        self.emotions_local = TTLCache(max_entries, self.ttl)
+        self.histories = TTLCache(max_entries, self.ttl)
+        self.redis_client = (redis_client or get_redis()) if use_redis else None
+
+        self._lock = threading.Lock()
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._background_tasks = set()
+        self._redis_retry_at = 0.0
+
+        # Statistics
+        self.prepared = 0
+        self.emotion_hits = 0
+        self.pending_hits = 0
+        self.history_hits = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def message_hash(text: str) -> str:
+        """Hash of a user message, the SHA-256 hex digest of its UTF-8 text"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def history_key(user: Optional[str], conversation_id: Optional[str], history: List[dict], user_input: str,
+                    prompt_version: int) -> str:
+        """
+        Key of the upstream messages of a turn, scoped per user
+
+        :param user: The user sending the turn
+        :param conversation_id: Optional conversation id of the summary
+        :param history: The conversation before the user message
+        :param user_input: The user message
+        :param prompt_version: Version of the system prompt the messages are built with
+        """
+        messages = [(message.get("role"), message.get("content")) for message in history]
+        raw = json.dumps([user, conversation_id, prompt_version, messages, user_input], ensure_ascii=False,
+                         separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def prepare_emotions(self, text: str, predict: Callable[[], Awaitable[Optional[List[str]]]]) -> asyncio.Task:
+        """
+        Start emotion inference of a draft message, or join the one already running for it
+
+        :param text: The user message
+        :param predict: Runs the inference, returns None if it was skipped
+        :return: The task of the inference, resolving to the emotions
+        """
+        key = self.message_hash(text)
+        with self._lock:
+            task = self._pending.get(key)
+            if task is not None:
+                return task
+            task = asyncio.create_task(self._predict(key, predict))
+            self._pending[key] = task
+            self.prepared += 1
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return task
+
+    async def _predict(self, key: str, predict: Callable[[], Awaitable[Optional[List[str]]]]) -> Optional[List[str]]:
+        emotions = await predict()
+        if emotions is not None:
+            self.emotions_local.set(key, emotions)
+            if self._redis_available():
+                task = asyncio.create_task(self._store_remote(key, emotions))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+        return emotions
+
+    def prepared_here(self, text: str) -> bool:
+        """Whether a user message was prepared (or is being prepared) in this worker"""
+        key = self.message_hash(text)
+        return key in self._pending or self.emotions_local.get(key) is not None
+
+    async def emotions(self, text: str, timeout: float = None) -> Optional[List[str]]:
+        """
+        The prepared emotions of a user message, waiting for a preparation still running in this worker
+
+        :param text: The user message
+        :param timeout: Seconds to wait for a running preparation, None for no limit
+        :return: The emotions, None if the message was not prepared
+        :raises asyncio.TimeoutError: If the running preparation did not finish in time
+        """
+        key = self.message_hash(text)
+        emotions = self.emotions_local.get(key)
+        if emotions is not None:
+            with self._lock:
+                self.emotion_hits += 1
+            return emotions
+        task = self._pending.get(key)
+        if task is not None:
+            emotions = await asyncio.wait_for(asyncio.shield(task), timeout)
+            if emotions is not None:
+                with self._lock:
+                    self.pending_hits += 1
+            return emotions
+        if not self._redis_available():
+            return None
+        try:
+            value = await self.redis_client.get(f"{self.prefix}{key}")
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+            return None
+        if value is None:
+            return None
+        try:
+            emotions = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        self.emotions_local.set(key, emotions)
+        with self._lock:
+            self.emotion_hits += 1
+        return emotions
+
+    def set_history(self, key: str, api_messages: List[dict]):
+        """Keep the upstream messages built for a draft turn"""
+        self.histories.set(key, [dict(message) for message in api_messages])
+
+    def history(self, key: str) -> Optional[List[dict]]:
+        """The upstream messages prepared for a turn (a copy), None if it was not prepared in this worker"""
+        api_messages = self.histories.get(key)
+        if api_messages is None:
+            return None
+        with self._lock:
+            self.history_hits += 1
+        return [dict(message) for message in api_messages]
+
+    async def _store_remote(self, key: str, emotions: List[str]):
+        try:
+            await self.redis_client.set(f"{self.prefix}{key}", json.dumps(emotions), ex=self.ttl)
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and time.monotonic() >= self._redis_retry_at
+
+    def _record_redis_error(self, error: Exception):
+        with self._lock:
+            self.redis_errors += 1
+            self._redis_retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+        logging.warning(f"Prepared turns Redis tier unavailable: {error}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return the prepared turns and how often completions found them"""
+        with self._lock:
+            return {
+                "prepared": self.prepared,
+                "pending": len(self._pending),
+                "emotion_hits": self.emotion_hits,
+                "pending_hits": self.pending_hits,
+                "history_hits": self.history_hits,
+                "redis_errors": self.redis_errors,
+            }
+
+
+_prepared_turns: Optional[PreparedTurns] = None
+_prepared_turns_lock = threading.Lock()
+
+
+def get_prepared_turns() -> PreparedTurns:
+    """Get the process-wide prepared turns"""
+    global _prepared_turns
+    if _prepared_turns is None:
+        with _prepared_turns_lock:
+            if _prepared_turns is None:
+                _prepared_turns = PreparedTurns()
+    return _prepared_turns
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import aiohttp
+
+from app.ai.stage_timings import stage_timings
+from app.ai.upstream_limiter import AdaptiveLimiter, CircuitBreaker
+from app.core.config import settings
+from app.core.http_client import get_http_session, warm_up_http_session
+from app.exceptions.aimo_exceptions import AIMOException, UpstreamException
+
+"""
+Description:
+    Routing of chat completions over several OpenAI-compatible LLM endpoints.
+
+    Every endpoint keeps an exponentially weighted moving average (EWMA) of its latency and
+    of its error rate, and requests go to the endpoint with the lowest expected latency,
+    where every recent error adds LLM_ROUTING_ERROR_PENALTY seconds. Errors are forgotten
+    with a half-life of LLM_ROUTING_ERROR_HALF_LIFE seconds, so a recovered endpoint gets
+    traffic again. A failed request fails over to the next endpoint. With hedging enabled,
+    a stream that has no first token within the recent p95 first-token latency gets a
+    second request on the next endpoint, and whichever answers first is used. Every endpoint
+    has its own adaptive concurrency limiter and circuit breaker (see upstream_limiter).
+    While a request is being prepared, the endpoint it will most likely go to gets a fresh
+    connection if it has been idle longer than the pool keeps connections open.
+"""
+
+T = TypeVar("T")
+
+
+class Provider:
+    """
+    An OpenAI-compatible chat completions endpoint and its latency and error statistics.
+
+    Attributes:
+        name (str): Name of the endpoint in logs and metrics.
+        url (str): The chat completions URL.
+        headers (dict): The headers of its requests.
+        model (str): Model name replacing the requested one, None to keep it.
+    """
+
+    def __init__(self, name: str, url: str, api_key: str, model: str = None):
+        self.name = name
+        self.url = url
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self.model = model
+        # Bounds the concurrent requests to the endpoint and stops sending while it is unhealthy
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker()
+
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self._error_updated_at = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        # When a request was last sent to the endpoint (or a connection opened to it)
+        self.last_used = 0.0
+
+    def prepare(self, data: dict) -> dict:
+        """The request body for this endpoint"""
+        return {**data, "model": self.model} if self.model else data
+
+    def error_rate(self, now: float = None) -> float:
+        """The error rate EWMA, decayed by the time since the last request"""
+        elapsed = (now or time.monotonic()) - self._error_updated_at
+        return self.error_ewma * 0.5 ** (elapsed / max(settings.LLM_ROUTING_ERROR_HALF_LIFE, 1e-3))
+
+    def score(self, now: float = None) -> float:
+        """Expected latency in seconds, lower is better (0 for an endpoint that was never used)"""
+        return (self.latency_ewma or 0.0) + self.error_rate(now) * settings.LLM_ROUTING_ERROR_PENALTY
+
+    def record(self, latency: Optional[float], failed: bool):
+        """
+        Add the outcome of a request to the averages
+
+        :param latency: Seconds until the first token (or the whole response), None for a failure
+        :param failed: Whether the request failed
+        """
+        alpha = settings.LLM_ROUTING_EWMA_ALPHA
+        now = time.monotonic()
+        self.requests += 1
+        self.errors += failed
+        self.error_ewma = (1 - alpha) * self.error_rate(now) + alpha * float(failed)
+        self._error_updated_at = now
+        if latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else (1 - alpha) * self.latency_ewma + alpha * latency
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ewma_ms": round((self.latency_ewma or 0.0) * 1000, 2),
+            "error_rate": round(self.error_rate(), 4),
+            "limiter": self.limiter.stats(),
+            "breaker": self.breaker.stats(),
+        }
+
+
+class ProviderRouter:
+    """
+    Latency-aware failover and hedging over the configured LLM endpoints.
+
+    Attributes:
+        providers (List[Provider]): The endpoints, the primary one first.
+        hedging (bool): Whether slow streams get a hedged second request.
+    """
+
+    def __init__(self, providers: List[Provider], hedging: bool = None):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.hedging = settings.LLM_HEDGING_ENABLED if hedging is None else hedging
+        self.max_attempts = max(1, settings.LLM_FAILOVER_ATTEMPTS)
+
+        self._lock = threading.Lock()
+        self._first_token_latencies = deque(maxlen=max(1, settings.LLM_LATENCY_WINDOW))
+        self._background_tasks = set()
+
+        # Statistics
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+
+    def ranked(self) -> List[Provider]:
+        """The endpoints, currently fastest first (the primary one first on a tie)"""
+        now = time.monotonic()
+        with self._lock:
+            return sorted(self.providers, key=lambda provider: provider.score(now))
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for a first token before hedging, the recent percentile of first-token latencies"""
+        with self._lock:
+            latencies = sorted(self._first_token_latencies)
+        if not latencies:
+            return max(settings.LLM_HEDGE_MIN_DELAY, settings.LLM_CONNECT_TIMEOUT)
+        index = min(len(latencies) - 1, math.ceil(settings.LLM_HEDGE_PERCENTILE * len(latencies)) - 1)
+        return max(settings.LLM_HEDGE_MIN_DELAY, latencies[index])
+
+    def prewarm(self) -> bool:
+        """
+        Open a connection in the background to the endpoint the next request will most likely go to
+
+        Only done if the endpoint has been idle so long that its pooled connections were closed, the
+        request then finds an open connection (DNS, TCP and TLS done) instead of connecting itself.
+
+        :return: Whether a connection is being opened
+        """
+        candidates = [provider for provider in self.ranked() if provider.breaker.allows()]
+        if not candidates:
+            return False
+        provider = candidates[0]
+        now = time.monotonic()
+        with self._lock:
+            # Idle connections are closed after LLM_KEEPALIVE_TIMEOUT, warm up a little before
+            if now - provider.last_used < settings.LLM_KEEPALIVE_TIMEOUT * 0.9:
+                return False
+            provider.last_used = now
+        task = asyncio.create_task(self._warm_up(provider))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return True
+
+    @staticmethod
+    async def _warm_up(provider: Provider):
+        started = time.perf_counter()
+        try:
+            if await warm_up_http_session(provider.url, 1):
+                stage_timings.record("warm_up", time.perf_counter() - started)
+        except Exception as e:
+            # The request connects on demand
+            logging.warning(f"Failed to warm up the LLM API {provider.name}: {e!r}")
+
+    async def first_response(self, attempt: Callable[[Provider], Awaitable[T]], stream: bool = False,
+                             release: Callable[[T], None] = None) -> Tuple[Provider, T]:
+        """
+        Run a request on the fastest endpoint, failing over (and hedging) to the next ones
+
+        Every attempt takes a slot of the concurrency limiter of its endpoint and is only sent
+        while the circuit breaker of the endpoint lets it through.
+
+        :param attempt: Sends the request to an endpoint, returns once it produced its first token
+            (or its whole response) and raises UpstreamException on failure. It must clean up
+            when cancelled.
+        :param stream: Whether the attempt opens a stream. Streams may be hedged, and the winning
+            stream keeps its limiter slot until the caller calls provider.limiter.release()
+        :param release: Frees the result of an attempt that finished but lost the race
+        :return: The endpoint that answered and the result of its attempt
+        :raises AIMOException: If every attempted endpoint failed, or fast (503) while no endpoint is healthy
+        """
+        candidates = [provider for provider in self.ranked() if provider.breaker.allows()][:self.max_attempts]
+        if not candidates:
+            with self._lock:
+                self.rejected += 1
+            raise AIMOException("The LLM API is temporarily unavailable, please retry later", 503)
+        pending: Dict[asyncio.Task, Provider] = {}
+        launched = 0
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        def launch():
+            nonlocal launched
+            provider = candidates[launched]
+            launched += 1
+            pending[asyncio.create_task(self._guarded(provider, attempt, stream))] = provider
+
+        launch()
+        try:
+            while pending:
+                can_hedge = stream and self.hedging and launched < len(candidates)
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay() if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # No first token within the hedging delay: ask the next endpoint as well
+                    hedged = True
+                    with self._lock:
+                        self.hedges += 1
+                    launch()
+                    continue
+                winner = None
+                for task in done:
+                    provider = pending.pop(task)
+                    error = task.exception()
+                    if error is not None:
+                        last_error = error
+                        logging.warning(f"LLM provider {provider.name} failed: {error!r}")
+                    elif winner is None:
+                        if hedged and provider is not candidates[0]:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        winner = (provider, task.result())
+                    else:
+                        if release is not None:
+                            release(task.result())
+                        if stream:
+                            provider.limiter.release()
+                if winner is not None:
+                    return winner
+                if not pending and launched < len(candidates):
+                    with self._lock:
+                        self.failovers += 1
+                    launch()
+        finally:
+            # Cancel the attempts that lost the race
+            for task in pending:
+                task.cancel()
+        if isinstance(last_error, AIMOException):
+            raise last_error
+        raise AIMOException("Failed to reach the LLM API")
+
+    async def _guarded(self, provider: Provider, attempt: Callable[[Provider], Awaitable[T]], stream: bool) -> T:
+        """Run an attempt within the limiter and the circuit breaker of its endpoint and record its outcome"""
+        await provider.limiter.acquire()
+        if not provider.breaker.start_request():
+            provider.limiter.release()
+            raise AIMOException("The LLM API is temporarily unavailable, please retry later", 503)
+        started = time.perf_counter()
+        with self._lock:
+            provider.last_used = time.monotonic()
+        try:
+            result = await attempt(provider)
+        except UpstreamException as e:
+            provider.limiter.release()
+            with self._lock:
+                provider.record(None, failed=True)
+            # A rejected request (4xx) says nothing about the health of the endpoint
+            provider.breaker.record(not e.overloaded)
+            if e.overloaded:
+                provider.limiter.on_overload()
+            raise
+        except BaseException:
+            # Cancelled because another endpoint answered first
+            provider.limiter.release()
+            provider.breaker.cancel_request()
+            raise
+        latency = time.perf_counter() - started
+        with self._lock:
+            provider.record(latency, failed=False)
+            if stream:
+                self._first_token_latencies.append(latency)
+        provider.breaker.record(True)
+        provider.limiter.on_success(latency if stream else None)
+        if not stream:
+            provider.limiter.release()
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        """Return the routing counters and the statistics of every endpoint"""
+        hedge_delay = self.hedge_delay() if self.hedging else 0.0
+        with self._lock:
+            return {
+                "failovers": self.failovers,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "rejected": self.rejected,
+                "hedge_delay_ms": round(hedge_delay * 1000, 2),
+                "providers": {provider.name: provider.stats() for provider in self.providers},
+            }
+
+
+async def request_completion(provider: Provider, data: dict) -> dict:
+    """Send a non-streamed chat completion request to one endpoint and return its JSON response"""
+    try:
+        async with get_http_session().post(provider.url, headers=provider.headers,
+                                           json=provider.prepare(data)) as response:
+            if response.status != 200:
+                logging.error(f"Failed to get response from LLM API {provider.name}: {response.status}")
+                raise UpstreamException(f"Failed to get response from LLM API", response.status)
+            return await response.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"Failed to reach the LLM API {provider.name}: {e!r}")
+        raise UpstreamException("Failed to reach the LLM API")
+
+
+def configured_providers() -> List[Provider]:
+    """The primary endpoint (LLM_API_URL) followed by the endpoints of LLM_PROVIDERS"""
+    providers = [Provider("primary", settings.LLM_API_URL, settings.REDPILL_API_KEY)]
+    for index, config in enumerate(settings.LLM_PROVIDERS):
+        providers.append(Provider(config.get("name") or f"provider-{index + 1}", config["url"],
+                                  config.get("api_key") or settings.REDPILL_API_KEY, config.get("model")))
+    return providers
+
+
+_router: Optional[ProviderRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_provider_router() -> ProviderRouter:
+    """Get the process-wide provider router"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ProviderRouter(configured_providers())
+    return _router
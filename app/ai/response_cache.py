@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from app.ai.usage_meter import parse_usage
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.utils.lru_cache import TTLCache
+from app.utils.sse_utils import SSEFrameParser, delta_content
+
+# Characters per chunk when a cached completion is replayed as a stream
+REPLAY_CHUNK_CHARS = 32
+
+
+class ResponseCache:
+    """
+    Two-tier exact-match cache of chat completions.
+
+    Only deterministic requests are cached: temperature at most CHAT_RESPONSE_CACHE_MAX_TEMPERATURE,
+    or requests that opt in explicitly (evaluation and regression traffic). The key is a hash of
+    the system prompt version, the normalized upstream messages, the model and the sampling
+    parameters, so a prompt update never serves completions of the old prompt. A bounded
+    in-process LRU sits in front of a Redis tier shared by all workers, Redis failures only cost
+    a cache miss.
+
+    Attributes:
+        ttl (int): Time-to-live of an entry in seconds, in both tiers.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: int = None, redis_client=None, use_redis: bool = None,
+                 prefix: str = "aimo:response:"):
+        """
+        Initialize the cache
+
+        :param max_entries: Size of the in-process LRU (defaults to settings)
+        :param ttl: Time-to-live in seconds (defaults to settings)
+        :param redis_client: Optional asyncio Redis client (defaults to the shared client)
+        :param use_redis: Whether to use the Redis tier (defaults to settings)
+        :param prefix: Key prefix for Redis keys
+        """
+        self.ttl = settings.CHAT_RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.prefix = prefix
+        self.local = TTLCache(max_entries or settings.CHAT_RESPONSE_CACHE_MAX_ENTRIES, self.ttl)
+
+        use_redis = settings.CHAT_RESPONSE_CACHE_REDIS_ENABLED if use_redis is None else use_redis
+        self.redis_client = (redis_client or get_redis()) if use_redis else None
+
+        self._lock = threading.Lock()
+        self._background_tasks = set()
+        self.redis_hits = 0
+        self.redis_errors = 0
+        self.stores = 0
+        self.tokens_saved = 0
+        self._redis_retry_at = 0.0
+
+    @staticmethod
+    def cacheable(temperature: float, force: bool = False) -> bool:
+        """Whether a request is deterministic enough (or explicitly opted in) to be served from the cache"""
+        if not settings.CHAT_RESPONSE_CACHE_ENABLED:
+            return False
+        return force or (temperature is not None and temperature <= settings.CHAT_RESPONSE_CACHE_MAX_TEMPERATURE)
+
+    def key(self, data: dict, prompt_version: int) -> str:
+        """
+        Build the cache key of an upstream request
+
+        :param data: The upstream request body
+        :param prompt_version: Version of the system prompt the messages were built with
+        :return: The cache key
+        """
+        messages = [(message.get("role"), " ".join((message.get("content") or "").split()))
+                    for message in data["messages"]]
+        params = {name: data.get(name) for name in ("model", "max_tokens", "temperature", "top_p")}
+        raw = json.dumps([prompt_version, params, messages], ensure_ascii=False, separators=(",", ":"))
+        return f"{self.prefix}{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    async def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a completion, local tier first, then Redis
+
+        :param key: The cache key
+        :return: The cached completion ({"content": ..., "usage": ...}), None on a miss
+        """
+        entry = self.local.get(key)
+        if entry is None and self._redis_available():
+            try:
+                value = await self.redis_client.get(key)
+            except (RedisError, OSError) as e:
+                self._record_redis_error(e)
+                return None
+            if value is not None:
+                try:
+                    entry = json.loads(value)
+                except (json.JSONDecodeError, TypeError):
+                    entry = None
+            if entry is not None:
+                # Promote to the local tier
+                self.local.set(key, entry)
+                with self._lock:
+                    self.redis_hits += 1
+        if entry is not None:
+            with self._lock:
+                self.tokens_saved += (entry.get("usage") or {}).get("total_tokens", 0)
+        return entry
+
+    def set(self, key: str, content: str, usage: Optional[Dict[str, int]]):
+        """
+        Store a completion in the local tier and, in the background, in Redis
+
+        :param key: The cache key
+        :param content: The completion text
+        :param usage: The token usage of the completion
+        """
+        if not content:
+            return
+        entry = {"content": content, "usage": usage}
+        self.local.set(key, entry)
+        with self._lock:
+            self.stores += 1
+        if self._redis_available():
+            task = asyncio.create_task(self._store_remote(key, entry))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    async def _store_remote(self, key: str, entry: dict):
+        try:
+            await self.redis_client.set(key, json.dumps(entry, ensure_ascii=False), ex=self.ttl)
+        except (RedisError, OSError) as e:
+            self._record_redis_error(e)
+
+    def _redis_available(self) -> bool:
+        return self.redis_client is not None and time.monotonic() >= self._redis_retry_at
+
+    def _record_redis_error(self, error: Exception):
+        with self._lock:
+            self.redis_errors += 1
+            self._redis_retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+        logging.warning(f"Response cache Redis tier unavailable: {error}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit-ratio counters of both tiers"""
+        local = self.local.stats()
+        with self._lock:
+            hits = local["hits"] + self.redis_hits
+            lookups = local["hits"] + local["misses"]
+            return {
+                "local_size": local["size"],
+                "local_hits": local["hits"],
+                "redis_hits": self.redis_hits,
+                "redis_errors": self.redis_errors,
+                "misses": lookups - hits,
+                "stores": self.stores,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+def replay_chunks(content: str, usage: Optional[Dict[str, int]], model: str) -> Iterator[dict]:
+    """
+    Turn a cached completion back into the chunks of an OpenAI chat completion stream
+
+    :param content: The completion text
+    :param usage: The token usage of the completion, sent in a last chunk like upstream does
+    :param model: The model name of the chunks
+    :return: The chunks, without the final [DONE]
+    """
+    base = {"id": f"chatcmpl-{uuid4()}", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": model}
+    for start in range(0, len(content), REPLAY_CHUNK_CHARS):
+        delta = {"content": content[start:start + REPLAY_CHUNK_CHARS]}
+        if start == 0:
+            delta["role"] = "assistant"
+        yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    if usage:
+        yield {**base, "choices": [], "usage": usage}
+
+
+def collect_completion(frames: List) -> Tuple[str, Optional[Dict[str, int]]]:
+    """
+    Reassemble the text and the usage of a completed stream from its SSE frames
+
+    :param frames: The frames delivered to the client, bytes (passthrough) or dicts with the data payload
+    :return: The completion text and its usage (None if upstream did not report it)
+    """
+    parser = SSEFrameParser()
+    content = []
+    usage = None
+    for frame in frames:
+        payloads = parser.feed(frame) if isinstance(frame, bytes) else [frame["data"]]
+        for payload in payloads:
+            content.append(delta_content(payload))
+            if (b'"usage"' if isinstance(payload, bytes) else '"usage"') in payload:
+                try:
+                    usage = parse_usage(json.loads(payload).get("usage")) or usage
+                except (ValueError, AttributeError):
+                    pass
+    return "".join(content), usage
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
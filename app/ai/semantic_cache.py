@@ -0,0 +1,138 @@
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+import numpy
+
+from app.core.config import settings
+
+
+class SemanticCache:
+    """
+    In-memory vector index of replies to short first-turn messages.
+
+    Every entry is the sentence embedding of a user message (from the emotion model's encoder)
+    and the reply it got. A lookup is one matrix-vector product over the preallocated embedding
+    matrix: the most similar entry of the same scope is a hit if its cosine similarity reaches
+    the threshold, so near-duplicate openers ("hey aimo", "hi aimo!") share one reply. The scope
+    (system prompt version, model, sampling parameters) keeps replies from being served across
+    prompt updates. When full, the least recently used entry is replaced, and entries expire
+    after their TTL.
+
+    Attributes:
+        threshold (float): Minimum cosine similarity of a hit.
+        max_entries (int): Capacity of the index.
+        ttl (float): Seconds an entry is served.
+    """
+
+    def __init__(self, threshold: float = None, max_entries: int = None, ttl: float = None):
+        """
+        Initialize the cache, the embedding matrix is allocated with the first entry
+
+        :param threshold: Minimum cosine similarity of a hit (defaults to settings)
+        :param max_entries: Capacity of the index (defaults to settings)
+        :param ttl: Seconds an entry is served (defaults to settings)
+        """
+        self.threshold = settings.CHAT_SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = max(1, max_entries or settings.CHAT_SEMANTIC_CACHE_MAX_ENTRIES)
+        self.ttl = settings.CHAT_SEMANTIC_CACHE_TTL if ttl is None else ttl
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[numpy.ndarray] = None
+        self._scopes = numpy.full(self.max_entries, -1, dtype=numpy.int64)  # -1 marks a free slot
+        self._expires = numpy.zeros(self.max_entries, dtype=numpy.float64)
+        self._last_used = numpy.zeros(self.max_entries, dtype=numpy.int64)
+        self._entries = [None] * self.max_entries
+        self._scope_ids: Dict[Hashable, int] = {}
+        self._clock = 0
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_saved = 0
+
+    def _scope_id(self, scope: Hashable) -> int:
+        return self._scope_ids.setdefault(scope, len(self._scope_ids))
+
+    def lookup(self, embedding: numpy.ndarray, scope: Hashable) -> Optional[dict]:
+        """
+        Find the reply to the most similar message of the same scope
+
+        :param embedding: L2-normalized embedding of the user message
+        :param scope: Hashable description of everything else the reply depends on
+        :return: The cached entry ({"content": ..., "usage": ..., "similarity": ...}), None on a miss
+        """
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if self._vectors is None or scope_id is None:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ embedding.astype(numpy.float32, copy=False)
+            similarities[(self._scopes != scope_id) | (self._expires <= time.monotonic())] = -1.0
+            best = int(numpy.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            self.hits += 1
+            entry = self._entries[best]
+            self.tokens_saved += (entry.get("usage") or {}).get("total_tokens", 0)
+            return {**entry, "similarity": round(similarity, 4)}
+
+    def add(self, embedding: numpy.ndarray, scope: Hashable, content: str, usage: Optional[Dict[str, int]] = None):
+        """
+        Store the reply to a message, replacing a free, expired or least recently used slot
+
+        :param embedding: L2-normalized embedding of the user message
+        :param scope: Hashable description of everything else the reply depends on
+        :param content: The reply
+        :param usage: The token usage of the reply
+        """
+        if not content:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = numpy.zeros((self.max_entries, embedding.shape[-1]), dtype=numpy.float32)
+            free = numpy.flatnonzero((self._scopes < 0) | (self._expires <= time.monotonic()))
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(numpy.argmin(self._last_used))
+                self.evictions += 1
+            self._clock += 1
+            self._vectors[slot] = embedding
+            self._scopes[slot] = self._scope_id(scope)
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._last_used[slot] = self._clock
+            self._entries[slot] = {"content": content, "usage": usage}
+
+    def stats(self) -> Dict[str, float]:
+        """Return size, hit ratio and eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(((self._scopes >= 0) & (self._expires > time.monotonic())).sum()),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Get the process-wide semantic cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
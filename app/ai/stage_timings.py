@@ -0,0 +1,72 @@
+import threading
+from typing import Dict
+
+"""
+Description:
+    Latency of the stages of a chat request in this worker, reported by GET /chat/stats.
+
+    Emotion inference and the preparation of the conversation history run concurrently, and
+    the upstream connection is warmed up meanwhile. Next to the duration of every stage, the
+    time the overlap saved compared with running the stages one after the other is recorded.
+"""
+
+
+class StageTimings:
+    """
+    Duration counters per request stage.
+
+    Stages:
+        emotion: Emotion inference of the user input.
+        history: System prompt, summary compaction and the rest of the conversation history.
+        prepare: Everything before the request goes upstream, emotion and history overlapped.
+        warm_up: Opening a connection to an LLM endpoint whose pooled connections had expired.
+        first_token: From sending the request to the first token of the LLM API.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count: Dict[str, int] = {}
+        self._total: Dict[str, float] = {}
+        self._max: Dict[str, float] = {}
+        self.overlapped = 0
+        self.saved = 0.0
+
+    def record(self, stage: str, seconds: float):
+        """Record the duration of a stage"""
+        with self._lock:
+            self._count[stage] = self._count.get(stage, 0) + 1
+            self._total[stage] = self._total.get(stage, 0.0) + seconds
+            self._max[stage] = max(self._max.get(stage, 0.0), seconds)
+
+    def record_preparation(self, emotion: float, history: float, total: float):
+        """
+        Record the overlapped preparation of a request
+
+        :param emotion: Seconds of emotion inference
+        :param history: Seconds of the history preparation
+        :param total: Seconds until both were done
+        """
+        self.record("emotion", emotion)
+        self.record("history", history)
+        self.record("prepare", total)
+        with self._lock:
+            self.overlapped += 1
+            self.saved += max(0.0, emotion + history - total)
+
+    def stats(self) -> Dict[str, object]:
+        """Return the average and maximum duration of every stage and the average time saved by the overlap"""
+        with self._lock:
+            stats = {
+                stage: {
+                    "count": count,
+                    "avg_ms": round(self._total[stage] / count * 1000, 2),
+                    "max_ms": round(self._max[stage] * 1000, 2),
+                }
+                for stage, count in self._count.items()
+            }
+            stats["overlap_saved_avg_ms"] = round(self.saved / self.overlapped * 1000, 2) if self.overlapped else 0.0
+            return stats
+
+
+# Shared by every AIMO instance of the worker
+stage_timings = StageTimings()
@@ -0,0 +1,106 @@
+import json
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+
+"""
+Description:
+    Coalescing of the small content deltas of an upstream chat completion stream.
+
+    The LLM API sends a chunk every few characters, and every chunk costs a write, a flush
+    and an event parse on the client. With CHAT_STREAM_COALESCE_ENABLED, consecutive chunks
+    that only carry content are merged into one chunk of the same stream (same id, model
+    and choice, the contents concatenated) once CHAT_STREAM_COALESCE_WINDOW_MS passed since
+    the first of them or CHAT_STREAM_COALESCE_MAX_BYTES of content piled up. The first
+    content of a stream is sent right away, and chunks with a finish reason, usage, tool
+    calls or errors end the pending group and are forwarded unchanged, so clients that
+    concatenate the deltas of an OpenAI stream see the same reply.
+"""
+
+
+class DeltaCoalescer:
+    """
+    Merges consecutive content-only chunks of one stream.
+
+    Attributes:
+        window (float): Seconds a content delta may wait for the next ones.
+        max_bytes (int): Content bytes of a group that flush it right away.
+        merged (int): Number of chunks merged into an earlier one (frames saved).
+    """
+
+    def __init__(self, window: float = None, max_bytes: int = None):
+        self.window = settings.CHAT_STREAM_COALESCE_WINDOW_MS / 1000 if window is None else window
+        self.max_bytes = settings.CHAT_STREAM_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+        self.merged = 0
+        self._pending: List[tuple] = []  # (payload, chunk)
+        self._pending_bytes = 0
+        self._started_at = 0.0
+        self._sent_content = False
+
+    def add(self, payload: bytes) -> List[bytes]:
+        """
+        Add the next payload of the stream
+
+        :param payload: The data payload of an upstream event
+        :return: The payloads to send now
+        """
+        chunk = self._content_chunk(payload)
+        if chunk is None:
+            # Not a plain content delta: ends the pending group and is forwarded as it is
+            return self.flush() + [payload]
+        if not self._sent_content:
+            # The first token is not delayed (an empty opening chunk carrying only the role is not a token)
+            self._sent_content = bool(chunk["choices"][0]["delta"]["content"])
+            return self.flush() + [payload]
+        ready = self.flush() if chunk["choices"][0]["delta"].get("role") else []
+        if not self._pending:
+            self._started_at = time.monotonic()
+        self._pending.append((payload, chunk))
+        self._pending_bytes += len(chunk["choices"][0]["delta"]["content"].encode("utf-8"))
+        if self._pending_bytes >= self.max_bytes or self.due() == 0.0:
+            ready += self.flush()
+        return ready
+
+    def due(self) -> Optional[float]:
+        """Seconds until the pending group must be sent, None if nothing is pending"""
+        if not self._pending:
+            return None
+        return max(0.0, self._started_at + self.window - time.monotonic())
+
+    def flush(self) -> List[bytes]:
+        """
+        Merge the pending group into one payload
+
+        :return: The merged payload, empty if nothing is pending
+        """
+        if not self._pending:
+            return []
+        pending, self._pending, self._pending_bytes = self._pending, [], 0
+        if len(pending) == 1:
+            return [pending[0][0]]
+        self.merged += len(pending) - 1
+        chunk = pending[0][1]
+        chunk["choices"][0]["delta"]["content"] = "".join(item[1]["choices"][0]["delta"]["content"]
+                                                          for item in pending)
+        return [json.dumps(chunk, ensure_ascii=False, separators=(",", ":")).encode("utf-8")]
+
+    @staticmethod
+    def _content_chunk(payload: bytes) -> Optional[dict]:
+        """The parsed chunk if it only carries content for a single choice, else None"""
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            return None
+        if not isinstance(chunk, dict) or chunk.get("usage") or chunk.get("error"):
+            return None
+        choices = chunk.get("choices")
+        if not isinstance(choices, list) or len(choices) != 1 or not isinstance(choices[0], dict):
+            return None
+        choice = choices[0]
+        delta = choice.get("delta")
+        if choice.get("finish_reason") is not None or choice.get("logprobs") is not None \
+                or not isinstance(delta, dict) or not isinstance(delta.get("content"), str) \
+                or set(delta) - {"content", "role"}:
+            return None
+        return chunk
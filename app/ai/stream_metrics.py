@@ -0,0 +1,79 @@
+import threading
+from typing import Dict
+
+"""
+Description:
+    Counters of the streaming chat completions of this worker, reported by GET /chat/stats
+"""
+
+
+class StreamMetrics:
+    """
+    Outcome counters of streamed generations.
+
+    A stream is completed when the client received everything up to [DONE], aborted when the
+    client went away first (the upstream request is then cancelled), and failed when the LLM
+    API returned an error. The tokens saved by an abort are estimated as max_tokens less the
+    estimated tokens of the content the client received (an upper bound, the reply may have
+    ended sooner).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.aborted = 0
+        self.failed = 0
+        self.chunks = 0
+        self.tokens_saved = 0
+        self.backpressure_waits = 0
+        self.coalesced = 0
+
+    def stream_started(self):
+        with self._lock:
+            self.started += 1
+
+    def buffer_full(self):
+        """The upstream reader had to wait for the client to catch up"""
+        with self._lock:
+            self.backpressure_waits += 1
+
+    def frames_coalesced(self, count: int):
+        """Upstream chunks merged into an earlier frame of their stream"""
+        with self._lock:
+            self.coalesced += count
+
+    def stream_finished(self, outcome: str, chunks: int, tokens_saved: int = 0):
+        """
+        Record the end of a stream
+
+        :param outcome: completed, aborted or failed
+        :param chunks: Number of chunks delivered to the client
+        :param tokens_saved: Estimated tokens not generated because the upstream request was cancelled
+            (max_tokens less the estimated tokens of the content delivered)
+        """
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.chunks += chunks
+            self.tokens_saved += tokens_saved
+
+    def stats(self) -> Dict[str, float]:
+        """Return the stream outcome counters"""
+        with self._lock:
+            finished = self.completed + self.aborted + self.failed
+            return {
+                "started": self.started,
+                "active": self.started - finished,
+                "completed": self.completed,
+                "aborted": self.aborted,
+                "failed": self.failed,
+                "abort_ratio": round(self.aborted / finished, 4) if finished else 0.0,
+                "chunks": self.chunks,
+                "tokens_saved_estimate": self.tokens_saved,
+                "backpressure_waits": self.backpressure_waits,
+                "coalesced_chunks": self.coalesced,
+            }
+
+
+# Shared by every AIMO instance of the worker
+stream_metrics = StreamMetrics()
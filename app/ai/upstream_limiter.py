@@ -0,0 +1,223 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.core.config import settings
+from app.exceptions.aimo_exceptions import AIMOException
+
+"""
+Description:
+    Protection of the workers against a slow or failing LLM endpoint.
+
+    AdaptiveLimiter bounds the concurrent upstream requests of an endpoint with an AIMD
+    (additive increase, multiplicative decrease) limit: every successful request while the
+    limit is in use raises it by 1/limit, a 429/5xx, a timeout or a first-token latency
+    far above the baseline multiplies it by LLM_LIMITER_BACKOFF_RATIO. Requests beyond the
+    limit wait up to LLM_LIMITER_QUEUE_TIMEOUT seconds for a free slot and then fail, so a
+    slow upstream cannot pile up open connections. CircuitBreaker stops sending requests to
+    an endpoint that failed most of its recent requests and lets a single probe through
+    after LLM_BREAKER_OPEN_SECONDS.
+"""
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit of the requests to one LLM endpoint.
+
+    Attributes:
+        limit (float): The current concurrency limit.
+        in_flight (int): Number of requests holding a slot.
+    """
+
+    def __init__(self, initial: int = None, min_limit: int = None, max_limit: int = None):
+        self.min_limit = max(1, settings.LLM_LIMITER_MIN_LIMIT if min_limit is None else min_limit)
+        self.max_limit = max(self.min_limit, settings.LLM_LIMITER_MAX_LIMIT if max_limit is None else max_limit)
+        initial = settings.LLM_LIMITER_INITIAL_LIMIT if initial is None else initial
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+        # Statistics
+        self.rejected = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        """
+        Take a slot, waiting up to LLM_LIMITER_QUEUE_TIMEOUT seconds for one
+
+        Raises:
+            AIMOException: If no slot became free in time
+        """
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        try:
+            # The slot is handed over by release()
+            await asyncio.wait_for(asyncio.shield(waiter), settings.LLM_LIMITER_QUEUE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot arrived together with the timeout, pass it on
+                    self.in_flight -= 1
+                    self._wake_next()
+                else:
+                    waiter.cancel()
+                    self._waiters.remove(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejected += 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise AIMOException("The LLM API is overloaded, please retry later", 503)
+
+    def release(self):
+        """Free a slot, handing it to the oldest waiting request if the limit allows"""
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_next()
+
+    def _wake_next(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def on_success(self, latency: Optional[float] = None):
+        """
+        Additive increase after a successful request, or a decrease if its first token came far too late
+
+        :param latency: Seconds until the first token of a stream, None if not measured
+        """
+        with self._lock:
+            if latency is not None:
+                # The baseline follows the fastest recent latencies and drifts up slowly
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency
+                else:
+                    self.baseline += (latency - self.baseline) * 0.01
+                if latency > self.baseline * settings.LLM_LIMITER_LATENCY_TOLERANCE:
+                    self._decrease()
+                    return
+            # Only grow while the limit is actually in use
+            if self.in_flight * 2 >= self.limit:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._wake_next()
+
+    def on_overload(self):
+        """Multiplicative decrease after a 429/5xx or a timeout of the endpoint"""
+        with self._lock:
+            self._decrease()
+
+    def _decrease(self):
+        # Failures of requests sent together are one overload signal, decrease at most once per baseline latency
+        now = time.monotonic()
+        if now - self._last_decrease < max(self.baseline or 0.0, 0.1):
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * settings.LLM_LIMITER_BACKOFF_RATIO)
+        self.decreases += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "rejected": self.rejected,
+                "decreases": self.decreases,
+                "baseline_latency_ms": round((self.baseline or 0.0) * 1000, 2),
+            }
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one LLM endpoint.
+
+    Closed, requests pass and their outcomes are recorded. Once at least LLM_BREAKER_MIN_REQUESTS
+    of the last LLM_BREAKER_WINDOW requests were made and LLM_BREAKER_FAILURE_RATIO of them
+    failed, the breaker opens and the endpoint gets no requests for LLM_BREAKER_OPEN_SECONDS.
+    Then it is half-open: a single probe request passes, its success closes the breaker and
+    its failure opens it again.
+
+    Attributes:
+        state (str): closed, open or half_open.
+    """
+
+    def __init__(self):
+        self.state = "closed"
+        self._outcomes: Deque[bool] = deque(maxlen=max(1, settings.LLM_BREAKER_WINDOW))
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.opened = 0
+
+    def allows(self) -> bool:
+        """Whether the endpoint may get a request now (the probe of a half-open breaker included)"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= settings.LLM_BREAKER_OPEN_SECONDS:
+                self.state = "half_open"
+            return self.state == "closed" or (self.state == "half_open" and not self._probing)
+
+    def start_request(self) -> bool:
+        """
+        Register a request about to be sent
+
+        :return: False if the breaker does not let it through
+        """
+        if not self.allows():
+            return False
+        with self._lock:
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+        return True
+
+    def cancel_request(self):
+        """A registered request was not sent or was cancelled, it has no outcome"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, success: bool):
+        """Record the outcome of a request"""
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+                if success:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if self.state == "closed" and len(self._outcomes) >= settings.LLM_BREAKER_MIN_REQUESTS \
+                    and failures >= settings.LLM_BREAKER_FAILURE_RATIO * len(self._outcomes):
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self) -> Dict[str, object]:
+        self.allows()
+        with self._lock:
+            return {
+                "state": self.state,
+                "opened": self.opened,
+                "recent_failures": self._outcomes.count(False),
+            }
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+"""
+Description:
+    Per-user token usage metering.
+
+    The usage reported by the LLM API is added to in-memory counters per JWT identity, and a
+    background task of every worker flushes them to Redis every USAGE_FLUSH_INTERVAL seconds,
+    one pipelined HINCRBY batch for all users instead of a write per request. The totals are
+    kept per user and UTC day in the hash aimo:usage:<day>:<identity>.
+"""
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+ANONYMOUS = "anonymous"
+
+
+def parse_usage(usage) -> Optional[Dict[str, int]]:
+    """
+    Normalize the usage block of an LLM API response
+
+    :param usage: The usage object of a (streamed) completion
+    :return: The token counts, None if the response carries no usage
+    """
+    if not isinstance(usage, dict):
+        return None
+    try:
+        counts = {field: int(usage.get(field) or 0) for field in USAGE_FIELDS}
+    except (TypeError, ValueError):
+        return None
+    if not counts["total_tokens"]:
+        counts["total_tokens"] = counts["prompt_tokens"] + counts["completion_tokens"]
+    return counts
+
+
+class UsageMeter:
+    """
+    Token usage counters of this worker, flushed to Redis in batches.
+
+    Attributes:
+        flush_interval (float): Seconds between two flushes.
+        ttl (int): Seconds the daily usage hashes are kept in Redis.
+    """
+
+    def __init__(self, redis_client=None, use_redis: bool = True, prefix: str = "aimo:usage:"):
+        """
+        Initialize the meter
+
+        :param redis_client: Optional asyncio Redis client (defaults to the shared client)
+        :param use_redis: Whether to flush the usage to Redis
+        :param prefix: Key prefix for Redis keys
+        """
+        self.flush_interval = settings.USAGE_FLUSH_INTERVAL
+        self.ttl = settings.USAGE_TTL
+        self.prefix = prefix
+        self.redis_client = (redis_client or get_redis()) if use_redis else None
+
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(("requests",) + USAGE_FIELDS, 0))
+        self._flusher: Optional[asyncio.Task] = None
+
+        # Statistics
+        self.requests = 0
+        self.totals = dict.fromkeys(USAGE_FIELDS, 0)
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+
+    def record(self, identity: Optional[str], usage: Optional[Dict[str, int]]):
+        """
+        Add the usage of one completion to the counters of a user
+
+        :param identity: The JWT identity of the user (wallet address or invitation code)
+        :param usage: The token counts, as returned by parse_usage
+        """
+        if not usage:
+            return
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        with self._lock:
+            self.requests += 1
+            for field in USAGE_FIELDS:
+                self.totals[field] += usage[field]
+            if self.redis_client is None:
+                # Nothing to flush to, only the worker totals are kept
+                return
+            pending = self._pending[(day, identity or ANONYMOUS)]
+            pending["requests"] += 1
+            for field in USAGE_FIELDS:
+                pending[field] += usage[field]
+
+    async def flush(self) -> int:
+        """
+        Write the pending counters to Redis in one pipeline
+
+        :return: The number of user-day counters written
+        """
+        if self.redis_client is None:
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(self._pending.default_factory)
+        if not pending:
+            return 0
+        start = time.perf_counter()
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for (day, identity), counts in pending.items():
+                    key = f"{self.prefix}{day}:{identity}"
+                    for field, value in counts.items():
+                        if value:
+                            pipe.hincrby(key, field, value)
+                    pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            # Keep the counters for the next flush instead of losing them
+            self._merge(pending)
+            with self._lock:
+                self.flush_errors += 1
+            logging.warning(f"Failed to flush the token usage: {e}")
+            return 0
+        with self._lock:
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+        return len(pending)
+
+    def _merge(self, pending: Dict[tuple, Dict[str, int]]):
+        with self._lock:
+            for key, counts in pending.items():
+                for field, value in counts.items():
+                    self._pending[key][field] += value
+
+    def start(self):
+        """Start the periodic flush of this worker"""
+        if self.redis_client is not None and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the periodic flush and write what is left"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        """Return the token totals of this worker and the flush counters"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                **self.totals,
+                "pending_users": len(self._pending),
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+            }
+
+
+_meter: Optional[UsageMeter] = None
+_meter_lock = threading.Lock()
+
+
+def get_usage_meter() -> UsageMeter:
+    """Get the process-wide usage meter"""
+    global _meter
+    if _meter is None:
+        with _meter_lock:
+            if _meter is None:
+                _meter = UsageMeter()
+    return _meter
@@ -1,9 +1,26 @@
 import logging
-from typing import Union
-from fastapi import APIRouter
+from typing import AsyncIterator, List, Optional, Tuple, Union
+from fastapi import APIRouter, Request
 from sse_starlette.sse import EventSourceResponse
 
 from app.ai.aimo import AIMO
+from app.core.config import settings
+from app.ai.context_window import context_window_stats
+from app.ai.conversation_store import get_conversation_store
+from app.ai.conversation_summary import get_conversation_summarizer
+from app.ai.idempotency import get_idempotency_store
+from app.ai.prepared_turns import get_prepared_turns
+from app.ai.response_cache import get_response_cache
+from app.ai.semantic_cache import get_semantic_cache
+from app.exceptions.aimo_exceptions import AIMOException
+from app.exceptions.conversation_exceptions import ConversationException
+from app.exceptions.idempotency_exceptions import IdempotencyException
+from app.utils.jwt_utils import JWTUtils
+from app.utils.sse_utils import SSEFrameParser, delta_content
+from app.ai.stage_timings import stage_timings
+from app.ai.stream_metrics import stream_metrics
+from app.ai.usage_meter import get_usage_meter
+from app.models.chat import ChatPrepareRequest, ChatPrepareResponse, ChatStatsResponse
 
 logger = logging.getLogger(__name__)
 from app.models.openai import (
@@ -25,30 +42,144 @@ router = APIRouter(prefix="", tags=["chat"])
 aimo = AIMO()
 
 @router.post("/completions", response_model=ChatCompletionResponse)
-async def create_chat_completion(request: ChatCompletionRequest) -> Union[ChatCompletionResponse, EventSourceResponse]:
+async def create_chat_completion(request: ChatCompletionRequest, http_request: Request) -> Union[ChatCompletionResponse, EventSourceResponse]:
     """OpenAI-compatible chat completion endpoint"""
-    if not request.stream:
-        response = await aimo.get_response(
-            messages=request.messages,
-            temperature=request.temperature,
-            max_new_tokens=request.max_tokens
-        )
-        
-        return ChatCompletionResponse(
-            model=request.model,
-            choices=[
-                ChatChoice(
-                    index=0,
-                    message=Message(role="assistant", content=response),
-                    finish_reason="stop"
-                )
-            ]
-        )
-
-    return EventSourceResponse(
-        aimo.get_response_stream(
-            messages=request.messages,
-            temperature=request.temperature,
-            max_new_tokens=request.max_tokens
-        )
+    messages = request.messages
+    # The JWT identity, usage is metered and conversations are stored per user
+    subject = JWTUtils.get_subject(getattr(http_request.state, "jwt_payload", None))
+    # Evaluation and regression traffic opts into the response cache whatever its temperature
+    cache = http_request.headers.get(settings.CHAT_RESPONSE_CACHE_HEADER, "").lower() in ("1", "true")
+    messages, scope = await _conversation_messages(messages, request.conversation_id, subject)
+    new_turn = [{"role": message.role, "content": message.content} for message in request.messages]
+
+    def generate():
+        """Start the generation: a stream of SSE frames, or a coroutine of the completion and its usage"""
+        if request.stream:
+            stream = aimo.get_response_stream(
+                messages=messages,
+                temperature=request.temperature,
+                max_new_tokens=request.max_tokens,
+                conversation_id=scope,
+                user=subject,
+                cache=cache,
+                prepared=bool(request.message_hash)
+            )
+            if request.conversation_id:
+                stream = _record_streamed_turn(stream, subject, request.conversation_id, new_turn)
+            return stream
+        return _complete(messages, request, scope, subject, cache, new_turn)
+
+    idempotency_key = http_request.headers.get(settings.CHAT_IDEMPOTENCY_HEADER)
+    if idempotency_key and settings.CHAT_IDEMPOTENCY_ENABLED:
+        # Retries of a running request follow its generation, retries of a completed one get its result
+        if len(idempotency_key) > 255:
+            raise IdempotencyException("The Idempotency-Key must not exceed 255 characters", 400)
+        idempotency_store = get_idempotency_store()
+        outcome = await idempotency_store.start(idempotency_store.key(subject, idempotency_key),
+                                                idempotency_store.fingerprint(request.model_dump(mode="json")),
+                                                generate)
+        if isinstance(outcome, dict):
+            if request.stream:
+                return EventSourceResponse(aimo.replay_frames(outcome, request.model))
+            response, usage = outcome["content"], outcome["usage"]
+        elif request.stream:
+            return EventSourceResponse(outcome.follow())
+        else:
+            response, usage = await outcome.wait()
+    elif request.stream:
+        return EventSourceResponse(generate())
+    else:
+        response, usage = await generate()
+
+    return ChatCompletionResponse(
+        model=request.model,
+        choices=[
+            ChatChoice(
+                index=0,
+                message=Message(role="assistant", content=response),
+                finish_reason="stop"
+            )
+        ],
+        conversation_id=request.conversation_id,
+        **({"usage": usage} if usage else {})
+    )
+
+
+@router.post("/prepare", response_model=ChatPrepareResponse)
+async def prepare_chat_completion(request: ChatPrepareRequest, http_request: Request) -> ChatPrepareResponse:
+    """Run emotion inference and build the upstream messages of a draft turn before its completion request"""
+    if not settings.CHAT_PREPARE_ENABLED:
+        raise AIMOException("Preparing turns is disabled", 404)
+    subject = JWTUtils.get_subject(getattr(http_request.state, "jwt_payload", None))
+    messages, scope = await _conversation_messages(request.messages, request.conversation_id, subject)
+    if request.message_hash and messages[-1].role == "user" \
+            and request.message_hash != get_prepared_turns().message_hash(messages[-1].content):
+        raise AIMOException("The message_hash does not match the message", 422)
+    message_hash, emotions = await aimo.prepare_turn(messages, scope, subject)
+    return ChatPrepareResponse(message_hash=message_hash, emotions=emotions or [],
+                               expires_in=get_prepared_turns().ttl)
+
+
+async def _conversation_messages(messages: List[Message], conversation_id: Optional[str],
+                                 subject: Optional[str]) -> Tuple[List[Message], Optional[str]]:
+    """The messages to send upstream and the summary scope, the stored history prepended for a server-side conversation"""
+    if not conversation_id:
+        return messages, None
+    # Server-side conversation: prepend the stored history to the new turn sent by the client
+    if not subject:
+        raise ConversationException("Conversations require a user token", 401)
+    store = get_conversation_store()
+    history = await store.load(subject, conversation_id)
+    return [Message(**message) for message in history] + list(messages), store.scope(subject, conversation_id)
+
+
+async def _complete(messages: List[Message], request: ChatCompletionRequest, scope: Optional[str],
+                    subject: Optional[str], cache: bool, new_turn: List[dict]) -> Tuple[str, Optional[dict]]:
+    """Generate a non-streamed completion and store the turn of a server-side conversation"""
+    response, usage = await aimo.get_completion(
+        messages=messages,
+        temperature=request.temperature,
+        max_new_tokens=request.max_tokens,
+        conversation_id=scope,
+        user=subject,
+        cache=cache,
+        prepared=bool(request.message_hash)
+    )
+    if request.conversation_id:
+        get_conversation_store().record_turn(subject, request.conversation_id,
+                                             new_turn + [{"role": "assistant", "content": response}])
+    return response, usage
+
+
+async def _record_streamed_turn(stream: AsyncIterator, subject: str, conversation_id: str,
+                                new_turn: List[dict]) -> AsyncIterator:
+    """Forward the stream and store the turn once it completed, nothing is stored when the client disconnected"""
+    parser = SSEFrameParser()
+    reply = []
+    async for frame in stream:
+        if isinstance(frame, bytes):
+            reply.extend(delta_content(payload) for payload in parser.feed(frame))
+        else:
+            reply.append(delta_content(frame["data"]))
+        yield frame
+    reply = "".join(reply)
+    if reply:
+        get_conversation_store().record_turn(subject, conversation_id,
+                                             new_turn + [{"role": "assistant", "content": reply}])
+
+@router.get("/stats", response_model=ChatStatsResponse)
+async def get_chat_stats() -> ChatStatsResponse:
+    """Report stream outcomes, conversation trimming, summary compaction, stored conversations, token usage, the response caches, idempotency keys, prepared turns, the LLM endpoints and the request stage timings in this worker"""
+    return ChatStatsResponse(
+        streams=stream_metrics.stats(),
+        context=context_window_stats.stats(),
+        summary=get_conversation_summarizer().stats() if settings.CHAT_SUMMARY_ENABLED else {},
+        conversations=get_conversation_store().stats(),
+        usage=get_usage_meter().stats(),
+        response_cache=get_response_cache().stats() if settings.CHAT_RESPONSE_CACHE_ENABLED else {},
+        semantic_cache=get_semantic_cache().stats() if settings.CHAT_SEMANTIC_CACHE_ENABLED else {},
+        idempotency=get_idempotency_store().stats() if settings.CHAT_IDEMPOTENCY_ENABLED else {},
+        providers=aimo.router.stats(),
+        prepare=get_prepared_turns().stats() if settings.CHAT_PREPARE_ENABLED else {},
+        stages=stage_timings.stats()
     )
@@ -1,7 +1,15 @@
 import logging
+import os
 from fastapi import APIRouter
-from app.models.emotion import EmotionRequest, EmotionResponse
-from app.ai.emotion_model import EmotionModel
+from app.models.emotion import (
+    EmotionRequest,
+    EmotionResponse,
+    EmotionBatchRequest,
+    EmotionBatchResponse,
+    EmotionStatsResponse
+)
+from app.ai.model_registry import get_emotion_batcher
+from app.utils.memory_utils import process_memory
 
 """
 Author: Wesley Xu
@@ -13,8 +21,8 @@ Description:
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="", tags=["emotion"])
 
-# Initialize emotion model
-emotion_model = EmotionModel()
+# Get the shared emotion model and the micro-batcher (with its prediction cache) in front of it
+emotion_batcher = get_emotion_batcher()
 
 @router.post("/analyze", response_model=EmotionResponse)
 async def analyze_emotion(request: EmotionRequest) -> EmotionResponse:
@@ -27,7 +35,40 @@ async def analyze_emotion(request: EmotionRequest) -> EmotionResponse:
     Returns:
         EmotionResponse: Contains original text and detected emotions
     """
-    emotions = emotion_model.predict(request.message)
+    emotions = await emotion_batcher.predict_async(request.message)
     logger.info(f"🎭 Analyzed emotions for text: {request.message[:50]}...")
     
     return EmotionResponse(emotions=emotions)
+
+@router.post("/analyze-batch", response_model=EmotionBatchResponse)
+async def analyze_emotion_batch(request: EmotionBatchRequest) -> EmotionBatchResponse:
+    """
+    Analyze the emotional content of many texts in one call.
+
+    The texts are bucketed by token length before inference, so padding stays small.
+
+    Args:
+        request (EmotionBatchRequest): The messages to analyze
+
+    Returns:
+        EmotionBatchResponse: Detected emotions per message, in request order
+    """
+    results = await emotion_batcher.predict_many_async(request.messages)
+    logger.info(f"🎭 Analyzed emotions for {len(request.messages)} texts")
+
+    return EmotionBatchResponse(results=[EmotionResponse(emotions=emotions) for emotions in results])
+
+@router.get("/stats", response_model=EmotionStatsResponse)
+async def get_emotion_stats() -> EmotionStatsResponse:
+    """
+    Report the micro-batching, cache and memory statistics of the emotion model in this worker.
+
+    Returns:
+        EmotionStatsResponse: Queue depth, batch size, cache hit-ratio and worker memory statistics
+    """
+    return EmotionStatsResponse(
+        batcher=emotion_batcher.stats(),
+        cache=emotion_batcher.cache.stats() if emotion_batcher.cache else {},
+        pid=os.getpid(),
+        memory=process_memory()
+    )
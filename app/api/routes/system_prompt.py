@@ -1,14 +1,13 @@
 from typing import Optional
 from fastapi import APIRouter
 
-from app.utils.prompt_manager import PromptManager
-from app.ai.aimo import AIMO
+from app.utils.prompt_manager import get_prompt_manager
 from app.exceptions.server_exceptions import ServerException
 
 from app.models.system_prompt import SystemPromptUpdate
 
-# Create a singleton PromptManager
-prompt_manager = PromptManager()
+# The process-wide PromptManager, shared with the chat service
+prompt_manager = get_prompt_manager()
 
 router = APIRouter(
     prefix="",
@@ -27,7 +26,8 @@ async def get_system_prompt(section: Optional[str] = None):
 async def change_system_prompt(update_data: SystemPromptUpdate):
     """Change the system prompt and record its history"""
     try:
-        # Update the prompt
+        # Update the prompt. The new version is used by the next request of this worker,
+        # the other workers reload it when the update is announced over Redis pub/sub
         prompt_manager.update_prompt(
             update_data.section, 
             update_data.content, 
@@ -35,14 +35,6 @@ async def change_system_prompt(update_data: SystemPromptUpdate):
             update_data.purpose
         )
         
-        # Update the system prompt in the AIMO instance (in practice, this requires a way to update all active AIMO instances)
-        # Here we assume AIMO is a singleton or there is a way to get the current active instance
-        aimo = AIMO()  # Get the AIMO instance
-        prompt_data = prompt_manager.get_prompt()
-        aimo._self_cognition = prompt_data["self_cognition"]
-        aimo._guidelines = prompt_data["guidelines"]
-        aimo._rules = prompt_data["rules"]
-        aimo._overall_style = prompt_data["overall_style"]
         # Return HTTP Response 200 directly
         return {"status": "success", "code": 200}
     except ValueError as e:
@@ -1,7 +1,7 @@
 import os
 import socket
 from dataclasses import field
-from typing import Literal, List
+from typing import Dict, Literal, List, Optional
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -30,6 +30,110 @@ class Settings(BaseSettings):
     # LLM API KEY
     REDPILL_API_KEY: str = os.environ.get("REDPILL_API_KEY")
 
+    # Request Deadlines
+    REQUEST_DEADLINE_DEFAULT: Optional[float] = 60.0  # seconds a request may take, None for no deadline
+    REQUEST_DEADLINE_MAX: float = 300.0  # Upper bound of the time budget a client may ask for
+    REQUEST_DEADLINE_HEADER: str = "X-Request-Timeout"  # Request header with the time budget of the client in seconds
+    EMOTION_DEADLINE_RESERVE: float = 2.0  # seconds of the budget kept for the LLM API, emotion inference is skipped beyond
+
+    # LLM API Connection Pool
+    LLM_API_URL: str = "https://api.red-pill.ai/v1/chat/completions"  # OpenAI-compatible chat completions endpoint
+    LLM_POOL_LIMIT: int = 200  # Maximum number of open upstream connections per worker
+    LLM_POOL_LIMIT_PER_HOST: int = 100  # Maximum number of open connections to the LLM API host
+    LLM_DNS_CACHE_TTL: int = 300  # seconds to cache resolved upstream addresses
+    LLM_KEEPALIVE_TIMEOUT: float = 60.0  # seconds an idle upstream connection is kept open
+    LLM_CONNECT_TIMEOUT: float = 5.0  # seconds to establish an upstream connection (TCP and TLS)
+    LLM_READ_TIMEOUT: float = 60.0  # seconds to wait for the next chunk of an upstream response
+    LLM_TOTAL_TIMEOUT: Optional[float] = None  # seconds for a whole upstream request, None for no limit
+    LLM_WARMUP_CONNECTIONS: int = 2  # Connections opened to the LLM API at startup
+    LLM_PREWARM_ENABLED: bool = True  # Reconnect to an idle LLM endpoint while emotion inference runs
+
+    # LLM Provider Routing
+    LLM_PROVIDERS: List[Dict[str, str]] = field(default_factory=list)  # Fallback endpoints after LLM_API_URL, JSON list of {"name", "url", "api_key", "model"}
+    LLM_FAILOVER_ATTEMPTS: int = 2  # Endpoints tried for one request before giving up
+    LLM_ROUTING_EWMA_ALPHA: float = 0.2  # Weight of the newest request in the latency and error rate averages
+    LLM_ROUTING_ERROR_PENALTY: float = 10.0  # seconds of expected latency added by an error rate of 1
+    LLM_ROUTING_ERROR_HALF_LIFE: float = 60.0  # seconds after which half of the error rate of an endpoint is forgotten
+    LLM_HEDGING_ENABLED: bool = False  # Send a stream to a second endpoint when the first has no first token in time
+    LLM_HEDGE_PERCENTILE: float = 0.95  # Percentile of the recent first-token latencies after which a stream is hedged
+    LLM_HEDGE_MIN_DELAY: float = 0.5  # seconds, lower bound of the hedging delay
+    LLM_LATENCY_WINDOW: int = 200  # Recent first-token latencies the hedging percentile is computed from
+
+    # LLM Upstream Protection
+    LLM_LIMITER_INITIAL_LIMIT: int = 32  # Concurrent requests per endpoint and worker before the limit adapts
+    LLM_LIMITER_MIN_LIMIT: int = 4  # Lower bound of the adaptive concurrency limit
+    LLM_LIMITER_MAX_LIMIT: int = 100  # Upper bound of the adaptive concurrency limit (at most LLM_POOL_LIMIT_PER_HOST is useful)
+    LLM_LIMITER_BACKOFF_RATIO: float = 0.8  # Factor applied to the limit on a 429/5xx, a timeout or a slow first token
+    LLM_LIMITER_LATENCY_TOLERANCE: float = 3.0  # First-token latency above this multiple of the baseline counts as overload
+    LLM_LIMITER_QUEUE_TIMEOUT: float = 2.0  # seconds a request waits for a free slot before failing with 503
+    LLM_BREAKER_WINDOW: int = 20  # Recent requests per endpoint the failure ratio is computed from
+    LLM_BREAKER_MIN_REQUESTS: int = 10  # Requests in the window before the breaker may open
+    LLM_BREAKER_FAILURE_RATIO: float = 0.5  # Failure ratio that opens the breaker
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0  # seconds an open breaker rejects requests before letting a probe through
+
+    # Chat Streaming
+    CHAT_STREAM_PASSTHROUGH: bool = True  # Forward upstream SSE payloads without re-parsing the JSON
+    CHAT_STREAM_BUFFER_SIZE: int = 64  # Chunks buffered between the upstream reader and a slow client
+    CHAT_STREAM_COALESCE_ENABLED: bool = False  # Merge consecutive content deltas into fewer SSE frames
+    CHAT_STREAM_COALESCE_WINDOW_MS: float = 30.0  # milliseconds a delta waits for the next ones before it is sent
+    CHAT_STREAM_COALESCE_MAX_BYTES: int = 512  # Content bytes that send the merged deltas before the window ends
+
+    # Chat Context Window
+    CHAT_HISTORY_TOKEN_BUDGET: int = 6000  # Estimated prompt tokens sent upstream, older turns beyond it are dropped
+    CHAT_HISTORY_TOKEN_MARGIN: float = 0.1  # Share of the budget left free, token counts are a heuristic estimate
+    CHAT_MAX_MESSAGES: int = 500  # Maximum number of messages in a chat request
+    CHAT_MAX_MESSAGE_CHARS: int = 20000  # Maximum length of one message in characters
+    CHAT_MAX_REQUEST_CHARS: int = 200000  # Maximum length of all messages of a chat request in characters
+
+    # Chat Rolling Summary
+    CHAT_SUMMARY_ENABLED: bool = False  # Replace old turns of long conversations with a running summary
+    CHAT_SUMMARY_TRIGGER_MESSAGES: int = 24  # History length from which old turns are summarized
+    CHAT_SUMMARY_KEEP_RECENT: int = 12  # Newest messages always sent verbatim
+    CHAT_SUMMARY_REFRESH_EVERY: int = 8  # Refresh the summary once this many messages aged out of the recent window
+    CHAT_SUMMARY_MAX_TOKENS: int = 400  # Maximum length of a summary
+    CHAT_SUMMARY_MODEL: str = "deepseek/deepseek-chat"  # Model writing the summaries
+    CHAT_SUMMARY_TTL: int = 30 * 86400  # seconds a summary is kept after its last refresh
+    CHAT_SUMMARY_LOCAL_ENTRIES: int = 10000  # Size of the in-process summary tier
+
+    # Server-side Conversations
+    CHAT_CONVERSATION_MAX_MESSAGES: int = 200  # Newest messages kept per conversation, older ones are dropped
+    CHAT_CONVERSATION_TTL: int = 30 * 86400  # seconds a conversation is kept after its last turn
+    CHAT_CONVERSATION_LOCAL_ENTRIES: int = 1000  # Conversations kept in process when Redis is not configured
+
+    # Token Usage Metering
+    USAGE_FLUSH_INTERVAL: float = 10.0  # seconds between two batched writes of the per-user token usage to Redis
+    USAGE_TTL: int = 400 * 86400  # seconds the daily per-user usage is kept
+
+    # Chat Response Cache
+    CHAT_RESPONSE_CACHE_ENABLED: bool = False  # Serve repeated deterministic requests from the cache
+    CHAT_RESPONSE_CACHE_MAX_TEMPERATURE: float = 0.0  # Requests up to this temperature are cached
+    CHAT_RESPONSE_CACHE_HEADER: str = "X-AIMO-Response-Cache"  # Request header ("1") caching any request, for eval traffic
+    CHAT_RESPONSE_CACHE_REDIS_ENABLED: bool = True  # Share cached completions between workers through Redis
+    CHAT_RESPONSE_CACHE_MAX_ENTRIES: int = 10000  # Size of the in-process LRU tier
+    CHAT_RESPONSE_CACHE_TTL: int = 3600  # seconds
+
+    # Chat Semantic Cache
+    CHAT_SEMANTIC_CACHE_ENABLED: bool = False  # Serve short first-turn messages similar to an earlier one from the cache
+    CHAT_SEMANTIC_CACHE_THRESHOLD: float = 0.92  # Minimum cosine similarity of the sentence embeddings for a hit
+    CHAT_SEMANTIC_CACHE_MAX_ENTRIES: int = 5000  # Capacity of the in-memory vector index
+    CHAT_SEMANTIC_CACHE_TTL: int = 3600  # seconds a cached reply is served
+    CHAT_SEMANTIC_CACHE_MAX_CHARS: int = 200  # Longer first messages are too specific to share a reply
+
+    # Chat Idempotency Keys
+    CHAT_IDEMPOTENCY_ENABLED: bool = True  # Deduplicate retried requests carrying an idempotency key header
+    CHAT_IDEMPOTENCY_HEADER: str = "Idempotency-Key"  # Request header with the client-chosen key
+    CHAT_IDEMPOTENCY_TTL: int = 3600  # seconds the result of a completed request is replayed to retries
+    CHAT_IDEMPOTENCY_LOCK_TTL: int = 300  # seconds a key stays claimed by a running generation (frees keys of crashed workers)
+    CHAT_IDEMPOTENCY_WAIT_TIMEOUT: float = 30.0  # seconds a retry waits for the generation running in another worker
+    CHAT_IDEMPOTENCY_POLL_INTERVAL: float = 0.25  # seconds between two checks for the result of another worker
+    CHAT_IDEMPOTENCY_ABANDON_GRACE: float = 10.0  # seconds a generation nobody follows keeps running for a retry to attach
+    CHAT_IDEMPOTENCY_LOCAL_ENTRIES: int = 10000  # Completed results kept in process
+
+    # Chat Prepared Turns
+    CHAT_PREPARE_ENABLED: bool = True  # Precompute the emotions of a draft message with POST /chat/prepare
+    CHAT_PREPARE_TTL: int = 60  # seconds a prepared turn waits for its completion request
+    CHAT_PREPARE_LOCAL_ENTRIES: int = 10000  # Prepared turns kept in process
+
     # JWT Secret Key
     SECRET_KEY: str = os.environ.get("SECRET_KEY")
 
@@ -70,10 +174,35 @@ class Settings(BaseSettings):
     # Redis
     REDIS_HOST: str = os.environ.get("REDIS_HOST")
     REDIS_PORT: int = int(os.environ.get("REDIS_PORT"))
+    REDIS_SOCKET_TIMEOUT: float = 0.5  # seconds, keeps cache lookups from stalling requests
+    REDIS_RETRY_INTERVAL: float = 30.0  # seconds to skip an optional Redis tier after an error
 
     # Privy API Key
     PRIVY_APP_ID: str = os.environ.get("PRIVY_APP_ID")
     PRIVY_APP_SECRET: str = os.environ.get("PRIVY_APP_SECRET")
 
+    # Emotion Model Micro-batching
+    EMOTION_BATCH_MAX_SIZE: int = 32  # Maximum number of texts classified in one forward pass
+    EMOTION_BATCH_MAX_WAIT_MS: float = 5.0  # milliseconds to wait for a micro-batch to fill up
+    EMOTION_MAX_QUEUED: int = 256  # Maximum number of predictions waiting for the inference thread
+    EMOTION_ANALYZE_BATCH_MAX_MESSAGES: int = 1000  # Maximum number of messages per /emotion/analyze-batch call
+    EMOTION_BACKEND: Literal["eager", "int8", "torchscript", "compile", "onnx"] = "eager"  # Inference backend
+    EMOTION_BACKEND_PARITY_CHECK: bool = True  # Fall back to eager if the backend changes any fp32 label
+
+    # Emotion Prediction Cache
+    EMOTION_CACHE_ENABLED: bool = True  # Cache predictions of repeated inputs
+    EMOTION_CACHE_REDIS_ENABLED: bool = True  # Share cached predictions between workers through Redis
+    EMOTION_CACHE_MAX_ENTRIES: int = 50000  # Size of the in-process LRU tier
+    EMOTION_CACHE_TTL: int = 86400  # seconds
+    EMOTION_CACHE_MAX_TEXT_LENGTH: int = 256  # characters, longer inputs rarely repeat and are not cached
+    EMOTION_MODEL_VERSION: Optional[str] = None  # Overrides the version derived from the model files
+
+    # Out-of-process Emotion Inference (python -m app.ai.emotion_server)
+    EMOTION_INFERENCE_MODE: Literal["local", "remote"] = "local"  # remote: web workers call the inference server
+    EMOTION_SOCKET_PATH: str = "/tmp/aimo-emotion.sock"  # Unix socket of the inference server
+    EMOTION_INFERENCE_WORKERS: int = 1  # Number of inference server processes sharing the socket
+    EMOTION_REMOTE_CONNECTIONS: int = 2  # Connections per web worker, spread over the inference processes
+    EMOTION_REMOTE_TIMEOUT: float = 10.0  # seconds to wait for the inference server
+
 
 settings = Settings()
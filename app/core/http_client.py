@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from app.core.config import settings
+
+"""
+Description:
+    Application-lifetime pooled HTTP client for the upstream LLM API. Connections (and their
+    TLS sessions) are kept alive and reused across chat turns, resolved addresses are cached,
+    and a few connections are opened at startup, so the first request of a worker does not
+    pay the DNS, TCP and TLS setup either.
+"""
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Get the pooled client session of this worker, creating it on first use
+
+    Must be called from the event loop, the session belongs to the loop it was created on.
+
+    Returns:
+        The shared aiohttp client session
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=settings.LLM_POOL_LIMIT,
+            limit_per_host=settings.LLM_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=settings.LLM_DNS_CACHE_TTL,
+            keepalive_timeout=settings.LLM_KEEPALIVE_TIMEOUT,
+            enable_cleanup_closed=True
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=settings.LLM_TOTAL_TIMEOUT,
+            sock_connect=settings.LLM_CONNECT_TIMEOUT,
+            sock_read=settings.LLM_READ_TIMEOUT
+        )
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _session_loop = loop
+    return _session
+
+
+async def warm_up_http_session(url: str = None, connections: int = None) -> int:
+    """
+    Open connections to the LLM API host ahead of the first chat request
+
+    Failures are only logged, the pool then connects on demand.
+
+    Args:
+        url: Any URL on the upstream host (defaults to settings.LLM_API_URL)
+        connections: Number of connections to open (defaults to settings)
+
+    Returns:
+        The number of connections that were opened
+    """
+    test_mode = os.getenv("TESTING")
+    if test_mode is not None and test_mode != "False" and url is None:
+        return 0
+    parts = urlsplit(url or settings.LLM_API_URL)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+    connections = settings.LLM_WARMUP_CONNECTIONS if connections is None else connections
+    session = get_http_session()
+
+    async def open_connection() -> bool:
+        try:
+            # Any answer will do, the connection goes back to the pool once the response is read
+            async with session.head(origin, allow_redirects=False) as response:
+                await response.read()
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"Failed to warm up a connection to {origin}: {e!r}")
+            return False
+
+    opened = sum(await asyncio.gather(*(open_connection() for _ in range(connections))))
+    logging.info(f"Opened {opened} connections to {origin}")
+    return opened
+
+
+async def close_http_session():
+    """Close the pooled client session (on application shutdown)"""
+    global _session, _session_loop
+    if _session is not None:
+        await _session.close()
+        _session = None
+        _session_loop = None
@@ -0,0 +1,48 @@
+import os
+from typing import Optional
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+"""
+Description:
+    Shared asyncio Redis client used by the caches and stores of the application
+"""
+
+_redis_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """
+    Get the process-wide asyncio Redis client
+
+    The client connects lazily on first use. In test mode (TESTING env variable set) no
+    client is created and None is returned, so callers fall back to their in-process tier.
+
+    Returns:
+        The shared Redis client, or None when Redis is not available
+    """
+    global _redis_client
+    test_mode = os.getenv("TESTING")
+    if test_mode is not None and test_mode != "False":
+        return None
+    if not settings.REDIS_HOST:
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+        )
+    return _redis_client
+
+
+async def close_redis():
+    """Close the shared Redis client (on application shutdown)"""
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.close()
+        _redis_client = None
@@ -1,8 +1,23 @@
+from typing import Optional
+
 from app.exceptions.server_exceptions import ServerException
 
 
 class AIMOException(ServerException):
     """Base class for exceptions for AIMO Model."""
 
-    def __init__(self, message: str = "Model error during processing"):
-        super().__init__(message, 500)
+    def __init__(self, message: str = "Model error during processing", status_code: int = 500):
+        super().__init__(message, status_code)
+
+
+class UpstreamException(AIMOException):
+    """The LLM API failed a request."""
+
+    def __init__(self, message: str = "Failed to reach the LLM API", upstream_status: Optional[int] = None):
+        super().__init__(message)
+        self.upstream_status = upstream_status
+
+    @property
+    def overloaded(self) -> bool:
+        """Whether the failure means the endpoint is overloaded or unhealthy (429, 5xx, timeout, connection error)"""
+        return self.upstream_status is None or self.upstream_status == 429 or self.upstream_status >= 500
@@ -0,0 +1,10 @@
+from app.exceptions.server_exceptions import ServerException
+
+
+class ConversationException(ServerException):
+    """
+    Exception class for server-side conversation errors
+    """
+
+    def __init__(self, message: str = "Conversation history is unavailable", status_code: int = 503):
+        super().__init__(message, status_code)
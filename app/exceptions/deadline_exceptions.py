@@ -0,0 +1,10 @@
+from app.exceptions.server_exceptions import ServerException
+
+
+class DeadlineException(ServerException):
+    """
+    Exception class for requests that ran out of their time budget
+    """
+
+    def __init__(self, message: str = "Request deadline exceeded", status_code: int = 504):
+        super().__init__(message, status_code)
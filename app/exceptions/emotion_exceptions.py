@@ -0,0 +1,10 @@
+from app.exceptions.server_exceptions import ServerException
+
+
+class EmotionException(ServerException):
+    """
+    Exception class for emotion inference errors
+    """
+
+    def __init__(self, message: str = "Emotion inference is overloaded", status_code: int = 503):
+        super().__init__(message, status_code)
@@ -0,0 +1,10 @@
+from app.exceptions.server_exceptions import ServerException
+
+
+class IdempotencyException(ServerException):
+    """
+    Exception class for requests that cannot be deduplicated by their Idempotency-Key
+    """
+
+    def __init__(self, message: str = "A request with this Idempotency-Key is still in progress", status_code: int = 409):
+        super().__init__(message, status_code)
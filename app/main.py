@@ -6,6 +6,10 @@ from fastapi.routing import APIRoute
 from app.api.main import api_router
 from app.core.config import settings
 from app.core.db import create_db_and_tables
+from app.core.http_client import close_http_session, warm_up_http_session
+from app.core.redis_client import close_redis
+from app.utils.prompt_manager import get_prompt_manager
+from app.ai.usage_meter import get_usage_meter
 from app.exception_handler.exception_handler import register_exception_handlers
 from app.middleware.jwt_middleware import JWTMiddleware
 from fastapi.middleware.cors import CORSMiddleware
@@ -63,7 +67,8 @@ async def allow_options_middleware(request: Request, call_next):
         headers = {
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
+            "Access-Control-Allow-Headers": f"Content-Type, Authorization, Idempotency-Key, "
+                                            f"{settings.REQUEST_DEADLINE_HEADER}, {settings.CHAT_RESPONSE_CACHE_HEADER}",
             "Access-Control-Max-Age": "3600"
         }
         return JSONResponse(content={}, status_code=200, headers=headers)
@@ -78,4 +83,29 @@ app.include_router(api_router, prefix=settings.BASE_URL)
 # Import the database initialization function
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
\ No newline at end of file
+    create_db_and_tables()
+
+# Open the pooled connections to the LLM API before the first chat request
+@app.on_event("startup")
+async def warm_up_upstream():
+    await warm_up_http_session()
+    for provider in settings.LLM_PROVIDERS:
+        await warm_up_http_session(provider["url"])
+
+# Apply system prompt updates made by other workers (started per worker, threads do not survive the fork)
+@app.on_event("startup")
+def start_prompt_listener():
+    get_prompt_manager().start_listener()
+
+# Flush the per-user token usage to Redis in batches
+@app.on_event("startup")
+async def start_usage_meter():
+    get_usage_meter().start()
+
+# Close the pooled clients of this worker
+@app.on_event("shutdown")
+async def on_shutdown():
+    get_prompt_manager().stop_listener()
+    await get_usage_meter().stop()
+    await close_http_session()
+    await close_redis()
@@ -1,11 +1,18 @@
 import datetime
+from typing import Optional
+
 from fastapi import Request, FastAPI
 from fastapi.security.utils import get_authorization_scheme_param
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.exceptions.deadline_exceptions import DeadlineException
 from app.exceptions.jwt_exceptions import JWTException
+from app.utils.deadline import remaining, request_budget, reset_deadline, set_deadline, within_deadline
 from app.utils.jwt_utils import JWTUtils
 from app.entity.WalletAccount import WalletAccount
 from app.entity.invitation_code import InvitationCode
@@ -20,6 +27,14 @@ class JWTMiddleware(BaseHTTPMiddleware):
         self.base_url = base_url
 
     async def dispatch(self, request: Request, call_next):
+        # Every stage of the request bounds its work by this deadline
+        token = set_deadline(request_budget(request.headers.get(settings.REQUEST_DEADLINE_HEADER)))
+        try:
+            return await self._dispatch(request, call_next)
+        finally:
+            reset_deadline(token)
+
+    async def _dispatch(self, request: Request, call_next):
             
         # Allow OPTIONS requests to pass through without authentication (for CORS preflight)
         if request.method == "OPTIONS":
@@ -48,39 +63,20 @@ class JWTMiddleware(BaseHTTPMiddleware):
         try:
             # Attempt to decode and validate the JWT token
             payload = self.jwt_utils.decode_token(token)
-            
-            # Check if the token contains a wallet address
-            wallet_address = payload.get("wallet_address")
-            if wallet_address:
-                # Verify if the wallet is registered with a valid invitation code
-                with Session(engine) as session:
-                    wallet_account = session.get(WalletAccount, wallet_address)
-                    if not wallet_account:
-                        return JSONResponse(
-                            status_code=401,
-                            content={"message": "Wallet not registered"}
-                        )
-                    
-                    # Check if the bound invitation code is expired
-                    invitation_code = session.get(InvitationCode, wallet_account.invitation_code)
-                    if not invitation_code or invitation_code.expiration_time < datetime.datetime.now():
-                        return JSONResponse(
-                            status_code=401,
-                            content={"message": "Bound invitation code has expired"}
-                        )
-            
-            # Compatibility check for old invitation code tokens
-            elif "InvitationCode" in payload:
-                invitation_code = payload.get("InvitationCode")
-                with Session(engine) as session:
-                    code = session.get(InvitationCode, invitation_code)
-                    if not code or code.expiration_time < datetime.datetime.now():
-                        return JSONResponse(
-                            status_code=401,
-                            content={"message": "Invalid invitation code"}
-                        )
+            # Made available to the route handlers, e.g. to scope server-side conversations
+            request.state.jwt_payload = payload
+
+            # The account lookups run on the thread pool, so a slow database neither blocks the
+            # event loop nor holds the request past its deadline
+            error = await within_deadline(run_in_threadpool(self._check_account, payload, remaining()),
+                                          "authentication")
+            if error:
+                return JSONResponse(
+                    status_code=401,
+                    content={"message": error}
+                )
                 
-        except JWTException as e:
+        except (JWTException, DeadlineException) as e:
             # If token validation fails, return an error response with details
             return JSONResponse(
                 status_code=e.status_code,
@@ -89,4 +85,50 @@ class JWTMiddleware(BaseHTTPMiddleware):
 
         # Proceed to the next middleware or route handler if validation succeeds
         response = await call_next(request)
-        return response
\ No newline at end of file
+        return response
+
+    @staticmethod
+    def _check_account(payload: dict, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Check that the account of a token is still valid
+
+        Runs on the thread pool. When the request deadline passes, dispatch stops waiting, but the
+        thread keeps its pool slot until the queries return, so on PostgreSQL the queries get a
+        statement timeout of the remaining budget as well. Other databases are not bounded.
+
+        :param payload: The decoded JWT payload
+        :param timeout: Seconds left until the request deadline, None without a deadline
+        :return: The reason the account is rejected, None if it is valid
+        """
+        # Check if the token contains a wallet address
+        wallet_address = payload.get("wallet_address")
+        if wallet_address:
+            # Verify if the wallet is registered with a valid invitation code
+            with Session(engine) as session:
+                JWTMiddleware._limit_statements(session, timeout)
+                wallet_account = session.get(WalletAccount, wallet_address)
+                if not wallet_account:
+                    return "Wallet not registered"
+
+                # Check if the bound invitation code is expired
+                invitation_code = session.get(InvitationCode, wallet_account.invitation_code)
+                if not invitation_code or invitation_code.expiration_time < datetime.datetime.now():
+                    return "Bound invitation code has expired"
+
+        # Compatibility check for old invitation code tokens
+        elif "InvitationCode" in payload:
+            invitation_code = payload.get("InvitationCode")
+            with Session(engine) as session:
+                JWTMiddleware._limit_statements(session, timeout)
+                code = session.get(InvitationCode, invitation_code)
+                if not code or code.expiration_time < datetime.datetime.now():
+                    return "Invalid invitation code"
+        return None
+
+    @staticmethod
+    def _limit_statements(session: Session, timeout: Optional[float]):
+        """Cancel the queries of the session's transaction that run past the timeout (PostgreSQL only)"""
+        if timeout is None or session.get_bind().dialect.name != "postgresql":
+            return
+        # SET LOCAL only lasts until the end of the transaction the lookups run in
+        session.execute(text(f"SET LOCAL statement_timeout = {max(1, int(timeout * 1000))}"))
@@ -1,6 +1,6 @@
-from typing import List, Union
+from typing import Any, Dict, List, Optional, Union
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 
 """
 Author: Jack Pan
@@ -43,3 +43,65 @@ class ChatDto(BaseModel):
         if len(v) < 1:
             raise ValueError('messages must contain at least one message')
         return v
+
+class ChatPrepareRequest(BaseModel):
+    """
+    A draft turn sent to POST /chat/prepare shortly before its completion request.
+
+    Attributes:
+        messages (List[Message]): The conversation as it will be sent, the draft user message last.
+        conversation_id (str): The server-side conversation the turn belongs to, if any.
+        message_hash (str): Optional SHA-256 hex digest of the draft message computed by the client, checked by the server.
+    """
+    messages: List[Message]
+    conversation_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    message_hash: Optional[str] = None
+
+    @field_validator('messages')
+    @classmethod
+    def check_messages(cls, v):
+        if len(v) < 1:
+            raise ValueError('messages must contain at least one message')
+        return v
+
+class ChatPrepareResponse(BaseModel):
+    """
+    The result of preparing a draft turn.
+
+    Attributes:
+        message_hash (str): SHA-256 hex digest of the draft user message.
+        emotions (List[str]): Emotions recognized in the draft message.
+        expires_in (int): Seconds the prepared turn is kept for its completion request.
+    """
+    message_hash: str
+    emotions: List[str] = Field(default_factory=list)
+    expires_in: int
+
+class ChatStatsResponse(BaseModel):
+    """
+    Statistics of the chat service in the worker serving the request.
+
+    Attributes:
+        streams (Dict[str, float]): Outcomes of streamed completions, including aborted generations and saved tokens.
+        context (Dict[str, float]): Prompt size and conversation trimming counters.
+        summary (Dict[str, float]): Rolling summary compaction counters.
+        conversations (Dict[str, float]): Server-side conversation store counters.
+        usage (Dict[str, float]): Token usage reported by the LLM API and the batched flushes to Redis.
+        response_cache (Dict[str, float]): Response cache hit ratio and the tokens it saved.
+        semantic_cache (Dict[str, float]): Semantic cache hit ratio and the tokens it saved.
+        idempotency (Dict[str, float]): Retried requests attached to a running generation or replayed.
+        providers (Dict[str, Any]): Failovers, hedged requests and the latency and error rate of every LLM endpoint.
+        prepare (Dict[str, float]): Turns prepared with POST /chat/prepare and how often completions reused them.
+        stages (Dict[str, Any]): Duration of the request stages and the time saved by overlapping them.
+    """
+    streams: Dict[str, float] = Field(default_factory=dict)
+    context: Dict[str, float] = Field(default_factory=dict)
+    summary: Dict[str, float] = Field(default_factory=dict)
+    conversations: Dict[str, float] = Field(default_factory=dict)
+    usage: Dict[str, float] = Field(default_factory=dict)
+    response_cache: Dict[str, float] = Field(default_factory=dict)
+    semantic_cache: Dict[str, float] = Field(default_factory=dict)
+    idempotency: Dict[str, float] = Field(default_factory=dict)
+    providers: Dict[str, Any] = Field(default_factory=dict)
+    prepare: Dict[str, float] = Field(default_factory=dict)
+    stages: Dict[str, Any] = Field(default_factory=dict)
@@ -1,6 +1,8 @@
-from typing import List
+from typing import Dict, List
 from pydantic import BaseModel, Field, field_validator
 
+from app.core.config import settings
+
 class EmotionRequest(BaseModel):
     """Request format for emotion analysis"""
     message: str = Field(..., description="The text message to analyze")
@@ -14,3 +16,29 @@ class EmotionRequest(BaseModel):
 class EmotionResponse(BaseModel):
     """Response format for emotion analysis"""
     emotions: List[str] = Field(default_factory=list, description="List of detected emotions")
+
+class EmotionBatchRequest(BaseModel):
+    """Request format for bulk emotion analysis"""
+    messages: List[str] = Field(..., description="The text messages to analyze")
+
+    @field_validator('messages')
+    def validate_messages(cls, v):
+        if not v:
+            raise ValueError("No messages provided")
+        if len(v) > settings.EMOTION_ANALYZE_BATCH_MAX_MESSAGES:
+            raise ValueError(f"Too many messages, at most {settings.EMOTION_ANALYZE_BATCH_MAX_MESSAGES} are allowed")
+        messages = [message.strip() for message in v]
+        if not all(messages):
+            raise ValueError("Empty message provided")
+        return messages
+
+class EmotionBatchResponse(BaseModel):
+    """Response format for bulk emotion analysis"""
+    results: List[EmotionResponse] = Field(default_factory=list, description="Detected emotions per message, in request order")
+
+class EmotionStatsResponse(BaseModel):
+    """Response format for emotion inference statistics"""
+    batcher: Dict[str, float] = Field(default_factory=dict, description="Micro-batching queue depth and batch size statistics")
+    cache: Dict[str, float] = Field(default_factory=dict, description="Prediction cache hit-ratio statistics")
+    pid: int = Field(..., description="Process id of the worker that served the request")
+    memory: Dict[str, float] = Field(default_factory=dict, description="RSS, PSS, USS and shared memory of the worker in MB")
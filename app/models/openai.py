@@ -1,8 +1,10 @@
 from typing import List, Optional, Dict
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from time import time
 from uuid import uuid4
 
+from app.core.config import settings
+
 class Message(BaseModel):
     """Message in a chat conversation"""
     role: str
@@ -20,6 +22,26 @@ class ChatCompletionRequest(BaseModel):
     presence_penalty: Optional[float] = 0.0
     frequency_penalty: Optional[float] = 0.0
     user: Optional[str] = None
+    # Server-side conversation: the server keeps the history, the client only sends the new turn
+    conversation_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    # The message_hash returned by POST /chat/prepare, if the turn was prepared
+    message_hash: Optional[str] = None
+
+    @field_validator('messages')
+    def validate_messages(cls, v):
+        # Reject oversized bodies before any inference or upstream call
+        if not v:
+            raise ValueError("No messages provided")
+        if len(v) > settings.CHAT_MAX_MESSAGES:
+            raise ValueError(f"Too many messages, at most {settings.CHAT_MAX_MESSAGES} are allowed")
+        total_chars = 0
+        for message in v:
+            if len(message.content) > settings.CHAT_MAX_MESSAGE_CHARS:
+                raise ValueError(f"Message too long, at most {settings.CHAT_MAX_MESSAGE_CHARS} characters are allowed")
+            total_chars += len(message.content)
+        if total_chars > settings.CHAT_MAX_REQUEST_CHARS:
+            raise ValueError(f"Conversation too long, at most {settings.CHAT_MAX_REQUEST_CHARS} characters are allowed")
+        return v
 
 class ChatChoice(BaseModel):
     """A choice in a chat completion response"""
@@ -35,6 +57,7 @@ class ChatCompletionResponse(BaseModel):
     created: int = Field(default_factory=lambda: int(time()))
     model: str
     choices: List[ChatChoice]
+    conversation_id: Optional[str] = None
     usage: Optional[Dict] = Field(default_factory=lambda: {
         "prompt_tokens": 0,
         "completion_tokens": 0,
@@ -0,0 +1,81 @@
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from app.ai.emotion_backends import BACKENDS, PARITY_PROBES, build_backend
+from app.ai.emotion_model import EmotionModel, sigmoid
+
+"""
+Description:
+    Compare the emotion inference backends against the fp32 eager model.
+
+    For every backend the script reports the label agreement with fp32, the largest
+    probability difference and the latency of single-text and batched forward passes,
+    then recommends the fastest backend that keeps the labels.
+
+Usage:
+    python -m app.scripts.benchmark_emotion_backends [--texts chat_lines.txt] [--backends int8 onnx]
+"""
+
+
+def measure_latency(model: EmotionModel, backend, texts, batch_size: int, repeats: int):
+    """Return p50 and p95 latency in milliseconds of one forward pass over `batch_size` texts"""
+    batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    inputs = model.encode(batch, backend.device)
+    backend(inputs)  # Warm-up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        backend(inputs)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the emotion inference backends")
+    parser.add_argument("--texts", type=Path, help="File with one probe text per line (defaults to built-in probes)")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    texts = PARITY_PROBES
+    if args.texts:
+        texts = [line.strip() for line in args.texts.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+    model = EmotionModel(backend="eager")
+    reference = model.backend
+    model_path = Path(__file__).parent.parent / "ai" / "static" / "models" / "EmotionModule"
+    reference_probabilities = sigmoid(reference(model.encode(texts, reference.device)))
+
+    results = []
+    for name in args.backends:
+        try:
+            backend = reference if name == "eager" else build_backend(name, model.model, reference.device, model_path)
+        except Exception as e:
+            print(f"{name:<12} unavailable: {e}")
+            continue
+        probabilities = sigmoid(backend(model.encode(texts, backend.device)))
+        agreement = model.label_agreement(reference, backend, texts, args.threshold)
+        max_diff = float(abs(probabilities - reference_probabilities).max())
+        single = measure_latency(model, backend, texts, 1, args.repeats)
+        batched = measure_latency(model, backend, texts, args.batch_size, args.repeats)
+        results.append((name, agreement, max_diff, single, batched))
+
+    print(f"\n{'backend':<12} {'labels':>8} {'max |dp|':>10} {'1 p50/p95 ms':>16} "
+          f"{f'{args.batch_size} p50/p95 ms':>18}")
+    for name, agreement, max_diff, single, batched in results:
+        print(f"{name:<12} {agreement:>8.1%} {max_diff:>10.2e} {single[0]:>7.2f}/{single[1]:<8.2f} "
+              f"{batched[0]:>8.2f}/{batched[1]:<8.2f}")
+
+    keeping_labels = [result for result in results if result[1] == 1.0]
+    if keeping_labels:
+        best = min(keeping_labels, key=lambda result: result[4][0])
+        print(f"\nFastest backend that keeps every fp32 label: {best[0]} (set EMOTION_BACKEND={best[0]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import argparse
+from pathlib import Path
+
+from app.utils.memory_utils import memory_report
+
+"""
+Description:
+    Report the memory of the gunicorn master and each worker.
+
+    USS is what every additional worker costs, PSS splits the shared pages (the preloaded
+    model weights) between the processes, so the PSS column adds up to the real total.
+
+Usage:
+    python -m app.scripts.memory_report [--pid <gunicorn master pid>]
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-worker unique (USS) and proportional (PSS) memory")
+    parser.add_argument("--pid", type=int, help="Gunicorn master pid (defaults to the pid in --pidfile)")
+    parser.add_argument("--pidfile", type=Path, default=Path("/tmp/gunicorn.pid"))
+    args = parser.parse_args()
+
+    master_pid = args.pid or int(args.pidfile.read_text().strip())
+    rows = memory_report(master_pid)
+
+    print(f"{'pid':>8} {'role':<8} {'rss MB':>10} {'pss MB':>10} {'uss MB':>10} {'shared MB':>10}")
+    for row in rows:
+        print(f"{row['pid']:>8} {row['role']:<8} {row.get('rss_mb', 0):>10.1f} {row.get('pss_mb', 0):>10.1f} "
+              f"{row.get('uss_mb', 0):>10.1f} {row.get('shared_mb', 0):>10.1f}")
+
+    workers = [row for row in rows if row["role"] == "worker"]
+    if workers:
+        total_pss = sum(row.get("pss_mb", 0) for row in rows)
+        worker_uss = sum(row.get("uss_mb", 0) for row in workers) / len(workers)
+        print(f"\nTotal (PSS): {total_pss:.1f} MB, each additional worker costs about {worker_uss:.1f} MB (USS)")
+
+
+if __name__ == "__main__":
+    main()
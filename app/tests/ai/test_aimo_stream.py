@@ -0,0 +1,472 @@
+import asyncio
+import json
+
+import numpy
+import pytest
+from aiohttp import web
+
+from app.ai.aimo import AIMO
+from app.ai import semantic_cache
+from app.ai.mock_provider import MockProvider
+from app.ai.conversation_summary import get_conversation_summarizer
+from app.ai.prepared_turns import get_prepared_turns
+from app.ai.response_cache import collect_completion
+from app.ai.providers import Provider, ProviderRouter
+from app.ai.semantic_cache import SemanticCache
+from app.ai.stage_timings import stage_timings
+from app.ai.stream_coalescer import DeltaCoalescer
+from app.ai.stream_metrics import stream_metrics
+from app.ai.usage_meter import get_usage_meter
+from app.core.config import settings
+from app.core.http_client import close_http_session
+from app.exceptions.deadline_exceptions import DeadlineException
+from app.models.chat import Message
+from app.utils.deadline import reset_deadline, set_deadline
+
+UPSTREAM_EVENTS = [
+    b'data: {"id":"1","choices":[{"delta":{"role":"assistant","content":"Hi"}}]}\n\n',
+    b': OPENROUTER PROCESSING\n\n',
+    b'data: {"id":"1","choices":[{"delta":{"content":" there \\u00e9"}}]}\n\n',
+    b'data: {"id":"1","choices":[],"usage":{"prompt_tokens":9,"completion_tokens":3,"total_tokens":12}}\n\n',
+    b'data: [DONE]\n\n',
+]
+
+
+async def start_upstream(calls: list = None):
+    """Local stand-in for the LLM API streaming UPSTREAM_EVENTS in uneven chunks"""
+    async def handler(request):
+        if calls is not None:
+            calls.append(await request.json())
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        body = b"".join(UPSTREAM_EVENTS)
+        for i in range(0, len(body), 13):
+            await response.write(body[i:i + 13])
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/v1/chat/completions"
+
+
+def route_to(aimo: AIMO, url: str):
+    aimo.router = ProviderRouter([Provider("upstream", url, "test-key")])
+
+
+def collect_stream(passthrough: bool, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_STREAM_PASSTHROUGH", passthrough)
+    aimo = AIMO()
+
+    async def main():
+        runner, url = await start_upstream()
+        route_to(aimo, url)
+        try:
+            return [frame async for frame in aimo.get_response_stream([Message(role="user", content="hi")])]
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_passthrough_forwards_payload_bytes(monkeypatch):
+    """Passthrough forwards the upstream data payloads unchanged, ending with a single [DONE]"""
+    frames = collect_stream(True, monkeypatch)
+
+    assert frames == [event for event in UPSTREAM_EVENTS if event.startswith(b"data:")]
+
+
+def test_passthrough_matches_reencoded_stream(monkeypatch):
+    """Both modes deliver the same chunks to the client"""
+    passthrough = collect_stream(True, monkeypatch)
+    reencoded = collect_stream(False, monkeypatch)
+
+    assert [json.loads(frame[6:]) for frame in passthrough[:-1]] == [json.loads(frame["data"]) for frame in reencoded[:-1]]
+    assert reencoded[-1] == {"data": "[DONE]"}
+
+
+def test_stream_usage_is_metered(monkeypatch):
+    """The usage of the last chunk is counted in both modes and still forwarded to the client"""
+    before = get_usage_meter().stats()
+    frames = collect_stream(True, monkeypatch) + collect_stream(False, monkeypatch)
+    after = get_usage_meter().stats()
+
+    assert after["requests"] == before["requests"] + 2
+    assert after["total_tokens"] == before["total_tokens"] + 24
+    assert after["completion_tokens"] == before["completion_tokens"] + 6
+    assert sum(b'"usage"' in frame if isinstance(frame, bytes) else '"usage"' in frame["data"] for frame in frames) == 2
+
+
+def test_client_disconnect_cancels_upstream(monkeypatch):
+    """Closing the stream early stops reading upstream and counts the generation as aborted"""
+    upstream_finished = asyncio.Event()
+    upstream_disconnected = asyncio.Event()
+
+    async def handler(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for i in range(200):
+                await response.write(b'data: {"choices":[{"delta":{"content":"Hello there "}}]}\n\n')
+                await asyncio.sleep(0.01)
+            upstream_finished.set()
+        except (ConnectionResetError, asyncio.CancelledError):
+            upstream_disconnected.set()
+            raise
+        return response
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        aimo = AIMO()
+        route_to(aimo, f"http://127.0.0.1:{runner.addresses[0][1]}/v1/chat/completions")
+        before = stream_metrics.stats()
+        try:
+            stream = aimo.get_response_stream([Message(role="user", content="hi")], max_new_tokens=200)
+            for _ in range(3):
+                await stream.__anext__()
+            await stream.aclose()  # What the SSE response does when the client goes away
+            await asyncio.wait_for(upstream_disconnected.wait(), 2)
+            return before, stream_metrics.stats(), upstream_finished.is_set()
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    before, after, finished = asyncio.run(main())
+    assert not finished
+    assert after["aborted"] == before["aborted"] + 1
+    # 3 chunks of "Hello there " were delivered, about 9 tokens of the budget of 200
+    assert after["tokens_saved_estimate"] - before["tokens_saved_estimate"] == 191
+
+
+def test_slow_client_is_buffered(monkeypatch):
+    """The upstream reader waits once the buffer between it and a slow client is full"""
+    monkeypatch.setattr(settings, "CHAT_STREAM_BUFFER_SIZE", 1)
+    before = stream_metrics.stats()
+
+    async def slow_consumer():
+        aimo = AIMO()
+        runner, url = await start_upstream()
+        route_to(aimo, url)
+        try:
+            frames = []
+            async for frame in aimo.get_response_stream([Message(role="user", content="hi")]):
+                await asyncio.sleep(0.02)
+                frames.append(frame)
+            return frames
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    monkeypatch.setattr(settings, "CHAT_STREAM_PASSTHROUGH", True)
+    frames = asyncio.run(slow_consumer())
+    after = stream_metrics.stats()
+
+    assert frames[-1] == b"data: [DONE]\n\n"
+    assert after["completed"] == before["completed"] + 1
+    assert after["backpressure_waits"] > before["backpressure_waits"]
+
+
+def test_deterministic_stream_is_replayed_from_cache(monkeypatch):
+    """A repeated temperature 0 request is replayed from the response cache without calling upstream"""
+    monkeypatch.setattr(settings, "CHAT_RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "CHAT_STREAM_PASSTHROUGH", True)
+    calls = []
+
+    async def main():
+        aimo = AIMO()
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        try:
+            streams = []
+            for _ in range(2):
+                stream = aimo.get_response_stream([Message(role="user", content="cache me")], temperature=0.0)
+                streams.append([frame async for frame in stream])
+            return streams
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    upstream, replayed = asyncio.run(main())
+    assert len(calls) == 1
+    assert collect_completion(replayed) == collect_completion(upstream)
+    assert collect_completion(replayed)[0] == "Hi there \u00e9"
+    assert replayed[-1] == b"data: [DONE]\n\n"
+
+
+def test_similar_opener_is_served_from_semantic_cache(monkeypatch):
+    """A first-turn message close to an earlier one gets the earlier reply without calling upstream"""
+    monkeypatch.setattr(settings, "CHAT_SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "CHAT_STREAM_PASSTHROUGH", True)
+    monkeypatch.setattr(semantic_cache, "_cache", SemanticCache(threshold=0.9, max_entries=8, ttl=60))
+    calls = []
+
+    async def embed_async(texts):
+        # "hey aimo" and "hey aimo!" share a direction, anything else is orthogonal
+        return numpy.array([[1.0, 0.0] if text.startswith("hey aimo") else [0.0, 1.0] for text in texts],
+                           dtype=numpy.float32)
+
+    async def main():
+        aimo = AIMO()
+        monkeypatch.setattr(aimo.emotion_batcher, "embed_async", embed_async)
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        try:
+            streams = []
+            for content in ("hey aimo", "hey aimo!", "what is the weather"):
+                stream = aimo.get_response_stream([Message(role="user", content=content)])
+                streams.append([frame async for frame in stream])
+            return streams
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    first, similar, different = asyncio.run(main())
+    assert len(calls) == 2
+    assert collect_completion(similar)[0] == collect_completion(first)[0] == "Hi there é"
+    assert semantic_cache.get_semantic_cache().stats()["hits"] == 1
+
+
+def test_semantic_cache_is_scoped_by_sampling_parameters(monkeypatch):
+    """A reply cached for one temperature is not served to a request with another one"""
+    monkeypatch.setattr(settings, "CHAT_SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "CHAT_STREAM_PASSTHROUGH", True)
+    monkeypatch.setattr(semantic_cache, "_cache", SemanticCache(threshold=0.9, max_entries=8, ttl=60))
+    calls = []
+
+    async def embed_async(texts):
+        return numpy.array([[1.0, 0.0] for _ in texts], dtype=numpy.float32)
+
+    async def main():
+        aimo = AIMO()
+        monkeypatch.setattr(aimo.emotion_batcher, "embed_async", embed_async)
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        try:
+            for temperature in (1.32, 0.2, 1.32):
+                stream = aimo.get_response_stream([Message(role="user", content="hey aimo")], temperature=temperature)
+                [frame async for frame in stream]
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    asyncio.run(main())
+    assert len(calls) == 2
+    assert semantic_cache.get_semantic_cache().stats()["hits"] == 1
+
+
+def test_emotion_inference_is_skipped_close_to_the_deadline(monkeypatch):
+    """With less budget left than the LLM API reserve, the request goes upstream without emotion tags"""
+    monkeypatch.setattr(settings, "EMOTION_DEADLINE_RESERVE", 2.0)
+    calls = []
+
+    async def predict_async(user_input, threshold=0.5):
+        await asyncio.sleep(5)
+
+    async def main():
+        aimo = AIMO()
+        monkeypatch.setattr(aimo.emotion_batcher, "predict_async", predict_async)
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        token = set_deadline(1.0)
+        try:
+            return [frame async for frame in aimo.get_response_stream([Message(role="user", content="hi")])]
+        finally:
+            reset_deadline(token)
+            await close_http_session()
+            await runner.cleanup()
+
+    frames = asyncio.run(main())
+    assert collect_completion(frames)[0] == "Hi there é"
+    assert calls[0]["messages"][-1]["content"] == "User input: hi | Emotion: neutral"
+
+
+def test_expired_deadline_skips_the_pipeline(monkeypatch):
+    """A request whose budget was used up before it reached AIMO neither runs inference nor goes upstream"""
+    calls, predicted = [], []
+
+    async def predict_async(user_input, threshold=0.5):
+        predicted.append(user_input)
+        return ["joy"]
+
+    async def main():
+        aimo = AIMO()
+        monkeypatch.setattr(aimo.emotion_batcher, "predict_async", predict_async)
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        token = set_deadline(0.0)
+        try:
+            return [frame async for frame in aimo.get_response_stream([Message(role="user", content="hi")])]
+        finally:
+            reset_deadline(token)
+            await close_http_session()
+            await runner.cleanup()
+
+    with pytest.raises(DeadlineException):
+        asyncio.run(main())
+    assert predicted == [] and calls == []
+
+
+def test_history_is_prepared_during_emotion_inference(monkeypatch):
+    """Emotion inference and the summary lookup of the history overlap instead of adding up"""
+    monkeypatch.setattr(settings, "CHAT_SUMMARY_ENABLED", True)
+    calls = []
+
+    async def predict_async(user_input, threshold=0.5):
+        await asyncio.sleep(0.2)
+        return ["joy"]
+
+    async def compact(api_messages, conversation_id=None, user=None):
+        await asyncio.sleep(0.2)
+        return api_messages
+
+    async def main():
+        aimo = AIMO()
+        monkeypatch.setattr(aimo.emotion_batcher, "predict_async", predict_async)
+        monkeypatch.setattr(get_conversation_summarizer(), "compact", compact)
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        try:
+            return [frame async for frame in aimo.get_response_stream([Message(role="user", content="hi")])]
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    before = stage_timings.stats()
+    frames = asyncio.run(main())
+    stats = stage_timings.stats()
+    assert collect_completion(frames)[0] == "Hi there é"
+    assert calls[0]["messages"][-1]["content"] == "User input: hi | Emotion: joy"
+    assert stats["prepare"]["count"] == before.get("prepare", {}).get("count", 0) + 1
+    assert stats["prepare"]["max_ms"] < 350
+    assert stats["overlap_saved_avg_ms"] > 0
+
+
+def test_prepared_turn_skips_emotion_inference(monkeypatch):
+    """The completion of a prepared draft reuses its emotions and upstream messages"""
+    calls = []
+    predictions = []
+
+    async def predict_async(user_input, threshold=0.5):
+        predictions.append(user_input)
+        return ["gratitude"]
+
+    async def main():
+        aimo = AIMO()
+        monkeypatch.setattr(aimo.emotion_batcher, "predict_async", predict_async)
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        conversation = [Message(role="user", content="hi"), Message(role="assistant", content="hey"),
+                        Message(role="user", content="thanks for yesterday")]
+        try:
+            prepared = await aimo.prepare_turn(conversation, user="alice")
+            frames = [frame async for frame in aimo.get_response_stream(conversation, user="alice")]
+            return prepared, frames
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    before = get_prepared_turns().stats()
+    (message_hash, emotions), frames = asyncio.run(main())
+    after = get_prepared_turns().stats()
+    assert emotions == ["gratitude"] and len(message_hash) == 64
+    assert predictions == ["thanks for yesterday"]
+    assert collect_completion(frames)[0] == "Hi there é"
+    assert [message["content"] for message in calls[0]["messages"][1:]] == \
+        ["hi", "hey", "User input: thanks for yesterday | Emotion: gratitude"]
+    assert after["history_hits"] == before["history_hits"] + 1
+
+
+def test_coalesced_stream_delivers_the_same_reply(monkeypatch):
+    """Coalescing sends fewer frames with the same content, finish reason and usage"""
+    reply = "A fairly long reply that the mock provider streams in many small chunks. " * 4
+
+    def stream(coalesce: bool):
+        monkeypatch.setattr(settings, "CHAT_STREAM_COALESCE_ENABLED", coalesce)
+        monkeypatch.setattr(settings, "CHAT_STREAM_COALESCE_WINDOW_MS", 1000.0)
+        mock = MockProvider(reply=reply)
+
+        async def main():
+            aimo = AIMO()
+            route_to(aimo, await mock.start())
+            try:
+                return [frame async for frame in aimo.get_response_stream([Message(role="user", content="hi")])]
+            finally:
+                await close_http_session()
+                await mock.stop()
+
+        return asyncio.run(main())
+
+    plain, coalesced = stream(False), stream(True)
+    assert collect_completion(coalesced) == collect_completion(plain)
+    assert collect_completion(coalesced)[0] == reply
+    # The first delta, one merged frame, the finish and usage chunks and [DONE]
+    assert len(coalesced) == 5 < len(plain)
+    assert b'"finish_reason":"stop"' in coalesced[-3].replace(b" ", b"")
+
+
+def test_coalesced_deltas_are_sent_when_the_window_ends(monkeypatch):
+    """Pending deltas do not wait for the next upstream chunk beyond the coalescing window"""
+    monkeypatch.setattr(settings, "CHAT_STREAM_PASSTHROUGH", True)
+    aimo = AIMO()
+
+    async def main():
+        coalescer = DeltaCoalescer(window=0.02, max_bytes=1000)
+        frames = asyncio.Queue()
+        coalescer.add(b'{"choices":[{"index":0,"delta":{"content":"Hi"},"finish_reason":null}]}')
+        coalescer.add(b'{"choices":[{"index":0,"delta":{"content":" there"},"finish_reason":null}]}')
+
+        async def slow_upstream():
+            await asyncio.sleep(0.3)
+            yield b"[DONE]"
+
+        next_payload = asyncio.create_task(aimo._next_payload(slow_upstream(), coalescer, frames))
+        flushed = await asyncio.wait_for(frames.get(), 0.2)
+        return flushed, await next_payload
+
+    flushed, payload = asyncio.run(main())
+    assert b'" there"' in flushed
+    assert payload == b"[DONE]"
+
+
+def test_unprepared_turn_does_not_look_up_prepared_emotions(monkeypatch):
+    """Without a message_hash, a turn not prepared in this worker goes straight to emotion inference"""
+    calls = []
+    lookups = []
+
+    async def predict_async(user_input, threshold=0.5):
+        return ["joy"]
+
+    async def emotions(text, timeout=None):
+        lookups.append(text)
+        return ["fear"]
+
+    async def main(prepared: bool):
+        aimo = AIMO()
+        monkeypatch.setattr(aimo.emotion_batcher, "predict_async", predict_async)
+        runner, url = await start_upstream(calls)
+        route_to(aimo, url)
+        try:
+            return [frame async for frame in aimo.get_response_stream([Message(role="user", content="never prepared")],
+                                                                      prepared=prepared)]
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    monkeypatch.setattr(get_prepared_turns(), "emotions", emotions)
+    asyncio.run(main(prepared=False))
+    assert lookups == []
+    assert calls[0]["messages"][-1]["content"] == "User input: never prepared | Emotion: joy"
+
+    # The client echoed the message_hash: the turn was prepared by another worker
+    asyncio.run(main(prepared=True))
+    assert lookups == ["never prepared"]
+    assert calls[1]["messages"][-1]["content"] == "User input: never prepared | Emotion: fear"
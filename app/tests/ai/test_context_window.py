@@ -0,0 +1,87 @@
+import pytest
+from pydantic import ValidationError
+
+from app.ai.context_window import apply_context_window, context_window_stats, count_tokens, fit_to_budget, \
+    message_tokens
+from app.core.config import settings
+from app.models.openai import ChatCompletionRequest
+
+
+def conversation(turns: int, words: int = 50):
+    messages = [{"role": "system", "content": "You are AIMO."}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"turn {i} " + "word " * words})
+    return messages
+
+
+def test_count_tokens():
+    """English is about 4 characters per token, CJK about one token per character"""
+    assert count_tokens("") == 0
+    assert count_tokens("hello world, how are you?") == 7
+    assert count_tokens("你好，今天过得怎么样？") == 11
+    assert count_tokens("hello 你好") == 4
+
+
+def test_short_conversation_is_untouched():
+    messages = conversation(4)
+
+    assert fit_to_budget(messages, 10000) == (messages, 0)
+
+
+def test_oldest_turns_are_trimmed_first():
+    """The system prompt and the newest turns are kept within the budget"""
+    messages = conversation(20)
+    budget = sum(message_tokens(message) for message in messages[:1] + messages[-5:])
+
+    kept, trimmed_tokens = fit_to_budget(messages, budget, margin=0.0)
+
+    assert kept == messages[:1] + messages[-5:]
+    assert trimmed_tokens == sum(message_tokens(message) for message in messages[1:-5])
+
+
+def test_safety_margin_is_left_free():
+    """Token counts are estimates, so part of the budget is not filled"""
+    messages = conversation(20)
+    budget = sum(message_tokens(message) for message in messages[:1] + messages[-5:])
+
+    kept, _ = fit_to_budget(messages, budget, margin=0.25)
+
+    assert kept == messages[:1] + messages[-3:]
+
+
+def test_current_turn_is_always_kept():
+    """Even a user turn larger than the budget is sent"""
+    messages = conversation(5, words=1000)
+
+    kept, _ = fit_to_budget(messages, 10)
+
+    assert kept == [messages[0], messages[-1]]
+
+
+def test_trimming_is_counted():
+    before = context_window_stats.stats()
+
+    apply_context_window(conversation(20), budget=300)
+
+    after = context_window_stats.stats()
+    assert after["requests"] == before["requests"] + 1
+    assert after["trimmed_requests"] == before["trimmed_requests"] + 1
+    assert after["trimmed_tokens"] > before["trimmed_tokens"]
+
+
+def test_oversized_requests_are_rejected(monkeypatch):
+    """Absurdly large bodies fail validation before any inference"""
+    monkeypatch.setattr(settings, "CHAT_MAX_MESSAGES", 3)
+    monkeypatch.setattr(settings, "CHAT_MAX_MESSAGE_CHARS", 100)
+    monkeypatch.setattr(settings, "CHAT_MAX_REQUEST_CHARS", 150)
+
+    with pytest.raises(ValidationError):
+        ChatCompletionRequest(messages=[{"role": "user", "content": "hi"}] * 4)
+    with pytest.raises(ValidationError):
+        ChatCompletionRequest(messages=[{"role": "user", "content": "x" * 101}])
+    with pytest.raises(ValidationError):
+        ChatCompletionRequest(messages=[{"role": "user", "content": "x" * 80}] * 2)
+    with pytest.raises(ValidationError):
+        ChatCompletionRequest(messages=[])
+    assert ChatCompletionRequest(messages=[{"role": "user", "content": "x" * 70}] * 2)
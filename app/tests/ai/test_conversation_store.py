@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.ai.conversation_store import ConversationStore, decode_message, encode_message
+from app.core.config import settings
+from app.exceptions.conversation_exceptions import ConversationException
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def rpush(self, key, *values):
+        self.commands.append(lambda: self.redis_client.lists.setdefault(key, []).extend(values))
+
+    def ltrim(self, key, start, end):
+        self.commands.append(lambda: self.redis_client.lists.__setitem__(key, self.redis_client.lists[key][start:]))
+
+    def expire(self, key, ttl):
+        self.commands.append(lambda: self.redis_client.ttls.__setitem__(key, ttl))
+
+    async def execute(self):
+        for command in self.commands:
+            command()
+
+
+class FakeRedis:
+    def __init__(self, fail=False):
+        self.lists = {}
+        self.ttls = {}
+        self.fail = fail
+
+    async def lrange(self, key, start, end):
+        if self.fail:
+            raise ConnectionError("down")
+        return list(self.lists.get(key, []))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def test_message_encoding_is_compact_and_reversible():
+    message = {"role": "assistant", "content": "Hi, \"friend\" 🌙"}
+    entry = encode_message(message)
+    assert entry.startswith('["a","Hi')
+    assert decode_message(entry) == message
+
+
+def test_append_and_load_in_redis(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONVERSATION_MAX_MESSAGES", 4)
+    redis_client = FakeRedis()
+    store = ConversationStore(redis_client=redis_client)
+
+    async def run():
+        for turn in range(3):
+            await store.append("wallet", "c1", [{"role": "user", "content": f"q{turn}"},
+                                                {"role": "assistant", "content": f"a{turn}"}])
+        return await store.load("wallet", "c1"), await store.load("other-wallet", "c1")
+
+    history, other = asyncio.run(run())
+    assert [message["content"] for message in history] == ["q1", "a1", "q2", "a2"]
+    assert other == []
+    assert redis_client.ttls[store.key("wallet", "c1")] == settings.CHAT_CONVERSATION_TTL
+    assert "wallet" not in store.key("wallet", "c1")
+
+
+def test_local_fallback_without_redis():
+    store = ConversationStore(use_redis=False)
+
+    async def run():
+        store.record_turn("code", "c1", [{"role": "user", "content": "hello"},
+                                         {"role": "assistant", "content": "hi"}])
+        await asyncio.sleep(0)
+        return await store.load("code", "c1")
+
+    assert asyncio.run(run()) == [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi"}]
+    assert store.stats()["appends"] == 1
+
+
+def test_load_fails_loudly_when_redis_is_down():
+    store = ConversationStore(redis_client=FakeRedis(fail=True))
+    with pytest.raises(ConversationException):
+        asyncio.run(store.load("wallet", "c1"))
+    assert store.stats()["errors"] == 1
@@ -0,0 +1,187 @@
+import asyncio
+
+from app.ai.conversation_summary import ConversationSummarizer
+from app.ai.mock_provider import MockProvider
+from app.ai.providers import Provider, ProviderRouter
+from app.core.config import settings
+from app.core.http_client import close_http_session
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def eval(self, script, numkeys, key, token):
+        # RELEASE_LOCK_SCRIPT
+        if self.data.get(key) == token:
+            self.data.pop(key)
+            return 1
+        return 0
+
+
+def make_summarizer(monkeypatch, redis_client=None):
+    monkeypatch.setattr(settings, "CHAT_SUMMARY_TRIGGER_MESSAGES", 10)
+    monkeypatch.setattr(settings, "CHAT_SUMMARY_KEEP_RECENT", 4)
+    monkeypatch.setattr(settings, "CHAT_SUMMARY_REFRESH_EVERY", 4)
+    summarizer = ConversationSummarizer(redis_client=redis_client, use_redis=redis_client is not None)
+    summarizer.calls = []
+
+    async def summarize(previous_summary, new_messages):
+        summarizer.calls.append((previous_summary, [message["content"] for message in new_messages]))
+        return f"summary of {new_messages[-1]['content']}"
+
+    summarizer.summarize = summarize
+    return summarizer
+
+
+def conversation(turns: int):
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(turns)]
+    return [{"role": "system", "content": "You are AIMO."}] + history + [{"role": "user", "content": "now"}]
+
+
+async def compact_and_settle(summarizer, messages):
+    compacted = await summarizer.compact(messages)
+    await asyncio.gather(*summarizer._background_tasks)
+    return compacted
+
+
+def test_short_conversation_is_untouched(monkeypatch):
+    summarizer = make_summarizer(monkeypatch)
+    messages = conversation(10)
+
+    assert asyncio.run(compact_and_settle(summarizer, messages)) == messages
+    assert summarizer.calls == []
+
+
+def test_old_turns_are_replaced_by_the_summary(monkeypatch):
+    """The first long request is sent as is while the summary is built in the background"""
+    summarizer = make_summarizer(monkeypatch)
+
+    async def main():
+        first = await compact_and_settle(summarizer, conversation(12))
+        second = await compact_and_settle(summarizer, conversation(14))
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert first == conversation(12)
+    assert summarizer.calls == [(None, [f"m{i}" for i in range(8)])]
+    assert [message["content"] for message in second] == [
+        "You are AIMO.", "Summary of the earlier conversation with the user: summary of m7",
+        "m8", "m9", "m10", "m11", "m12", "m13", "now"]
+
+
+def test_summary_is_refreshed_incrementally(monkeypatch):
+    """A refresh only summarizes the turns that aged out since the previous summary"""
+    summarizer = make_summarizer(monkeypatch)
+
+    async def main():
+        await compact_and_settle(summarizer, conversation(12))
+        await compact_and_settle(summarizer, conversation(14))  # 2 new aged-out messages: not due yet
+        return await compact_and_settle(summarizer, conversation(16))
+
+    compacted = asyncio.run(main())
+
+    assert summarizer.calls[1] == ("summary of m7", ["m8", "m9", "m10", "m11"])
+    assert compacted[1]["content"].endswith("summary of m7")
+
+
+def test_edited_conversation_ignores_the_summary(monkeypatch):
+    """A summary never covers messages the client changed since"""
+    summarizer = make_summarizer(monkeypatch)
+    edited = conversation(14)
+    edited[8]["content"] = "edited"
+
+    async def main():
+        await compact_and_settle(summarizer, conversation(12))
+        return await summarizer.compact(edited)
+
+    assert asyncio.run(main()) == edited
+
+
+def test_summaries_are_shared_through_redis(monkeypatch):
+    """Another worker finds the summary in Redis"""
+    redis_client = FakeRedis()
+    first_worker = make_summarizer(monkeypatch, redis_client)
+    second_worker = make_summarizer(monkeypatch, redis_client)
+
+    async def main():
+        await compact_and_settle(first_worker, conversation(12))
+        return await second_worker.compact(conversation(13))
+
+    compacted = asyncio.run(main())
+
+    assert compacted[1]["content"].endswith("summary of m7")
+    assert not any(key.endswith(":lock") for key in redis_client.data)
+
+
+def test_expired_refresh_lock_of_another_worker_is_kept(monkeypatch):
+    """A refresh that outlived its lock does not release the lock another worker took over"""
+    redis_client = FakeRedis()
+    summarizer = make_summarizer(monkeypatch, redis_client)
+    summarize = summarizer.summarize
+
+    async def slow_summarize(previous_summary, new_messages):
+        # The lock expires meanwhile and another worker takes it
+        for key in [key for key in redis_client.data if key.endswith(":lock")]:
+            redis_client.data[key] = "other worker"
+        return await summarize(previous_summary, new_messages)
+
+    summarizer.summarize = slow_summarize
+    asyncio.run(compact_and_settle(summarizer, conversation(12)))
+
+    assert [value for key, value in redis_client.data.items() if key.endswith(":lock")] == ["other worker"]
+
+
+def test_summaries_are_kept_per_user(monkeypatch):
+    """Conversations of different users with the same opening do not share a summary"""
+    summarizer = make_summarizer(monkeypatch)
+
+    async def main():
+        await compact_and_settle(summarizer, conversation(12))
+        return await summarizer.compact(conversation(14), user="someone-else")
+
+    assert asyncio.run(main()) == conversation(14)
+
+
+def test_summary_of_another_conversation_with_the_same_opening_is_ignored(monkeypatch):
+    """A summary only applies when every message it covers matches, not only the last one"""
+    summarizer = make_summarizer(monkeypatch)
+    other = conversation(14)
+    other[4]["content"] = "a different turn"
+
+    async def main():
+        await compact_and_settle(summarizer, conversation(12))
+        return await summarizer.compact(other)
+
+    assert asyncio.run(main()) == other
+
+
+def test_summaries_go_through_the_provider_router(monkeypatch):
+    summarizer = ConversationSummarizer(use_redis=False)
+    mock = MockProvider(reply="The user likes tea.")
+
+    async def main():
+        router = ProviderRouter([Provider("mock", await mock.start(), "test-key")])
+        monkeypatch.setattr("app.ai.conversation_summary.get_provider_router", lambda: router)
+        try:
+            return await summarizer.summarize(None, [{"role": "user", "content": "I like tea"}]), router.stats()
+        finally:
+            await close_http_session()
+            await mock.stop()
+
+    summary, stats = asyncio.run(main())
+    assert summary == "The user likes tea."
+    assert stats["providers"]["mock"]["requests"] == 1
@@ -0,0 +1,107 @@
+import numpy
+import pytest
+import torch
+from transformers import BertConfig, BertForSequenceClassification
+
+from app.ai.emotion_backends import build_backend
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    """A small randomly initialized BERT classifier, enough to compare backends"""
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=100, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64, num_labels=5)
+    return BertForSequenceClassification(config).eval()
+
+
+@pytest.fixture
+def inputs():
+    """A padded batch with a different shape than the one used for tracing and export"""
+    input_ids = torch.randint(5, 100, (3, 24))
+    attention_mask = torch.ones_like(input_ids)
+    attention_mask[1, 10:] = 0
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+@pytest.mark.parametrize("name", ["torchscript", "int8"])
+def test_backend_matches_eager(tiny_model, inputs, tmp_path, name):
+    """Optimized backends reproduce the fp32 logits"""
+    reference = build_backend("eager", tiny_model, "cpu", tmp_path)(inputs)
+    logits = build_backend(name, tiny_model, "cpu", tmp_path)(inputs)
+
+    assert logits.shape == reference.shape
+    assert numpy.allclose(logits, reference, atol=0.05 if name == "int8" else 1e-4)
+
+
+def test_onnx_backend_matches_eager(tiny_model, inputs, tmp_path):
+    """The ONNX export runs with dynamic batch and sequence sizes"""
+    pytest.importorskip("onnxruntime")
+    reference = build_backend("eager", tiny_model, "cpu", tmp_path)(inputs)
+    logits = build_backend("onnx", tiny_model, "cpu", tmp_path)(inputs)
+
+    assert len(list((tmp_path / "onnx").glob("model-*.onnx"))) == 1
+    assert numpy.allclose(logits, reference, atol=1e-4)
+
+
+def test_onnx_export_is_redone_for_new_weights(inputs, tmp_path):
+    """An export of older weights in the model directory is not reused"""
+    pytest.importorskip("onnxruntime")
+    torch.manual_seed(1)
+    config = BertConfig(vocab_size=100, hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+                        intermediate_size=64, num_labels=5)
+    model = BertForSequenceClassification(config).eval()
+    old_backend = build_backend("onnx", model, "cpu", tmp_path)
+    with torch.no_grad():
+        model.classifier.bias.add_(1.0)  # The weights change in place, as after a new fine-tune
+    new_backend = build_backend("onnx", model, "cpu", tmp_path)
+
+    assert new_backend.onnx_file != old_backend.onnx_file
+    assert numpy.allclose(new_backend(inputs), build_backend("eager", model, "cpu", tmp_path)(inputs), atol=1e-4)
+
+
+def test_onnx_export_is_keyed_by_the_given_fingerprint(tiny_model, tmp_path):
+    """The fingerprint of the model files names the export"""
+    pytest.importorskip("onnxruntime")
+    backend = build_backend("onnx", tiny_model, "cpu", tmp_path, fingerprint="abc123")
+
+    assert backend.onnx_file == tmp_path / "onnx" / "model-abc123.onnx"
+
+
+def test_onnx_session_is_reopened_after_fork(tiny_model, inputs, tmp_path):
+    """A forked worker does not reuse the ONNX Runtime session (and thread pools) of its parent"""
+    pytest.importorskip("onnxruntime")
+    backend = build_backend("onnx", tiny_model, "cpu", tmp_path)
+    parent_session = backend.session
+    backend._session_pid = -1  # As seen from a forked child
+
+    assert backend.session is not parent_session
+    assert backend(inputs).shape[0] == inputs["input_ids"].shape[0]
+
+
+def test_unknown_backend(tiny_model, tmp_path):
+    """An unknown backend name is rejected"""
+    with pytest.raises(ValueError):
+        build_backend("tpu", tiny_model, "cpu", tmp_path)
+
+
+def test_embed_batch_ignores_padding(tiny_model, inputs):
+    """Sentence embeddings are unit length and mean-pool only the real tokens"""
+    from app.ai.emotion_model import EmotionModel
+
+    class StandIn:
+        model = tiny_model
+
+        @staticmethod
+        def encode(texts, device):
+            rows = [int(text) for text in texts]
+            return {key: value[rows] for key, value in inputs.items()}
+
+    embeddings = EmotionModel.embed_batch(StandIn(), ["0", "1", "2"])
+    assert embeddings.shape == (3, 32)
+    assert numpy.allclose(numpy.linalg.norm(embeddings, axis=1), 1.0, atol=1e-5)
+
+    # The second text has 10 real tokens, embedding it without padding gives the same vector
+    unpadded = {key: value[1:2, :10] for key, value in inputs.items()}
+    StandIn.encode = staticmethod(lambda texts, device: unpadded)
+    assert numpy.allclose(EmotionModel.embed_batch(StandIn(), ["1"])[0], embeddings[1], atol=1e-5)
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pytest
+
+from app.ai.emotion_batcher import EmotionBatcher
+from app.ai.emotion_cache import EmotionCache
+from app.exceptions.deadline_exceptions import DeadlineException
+from app.exceptions.emotion_exceptions import EmotionException
+from app.utils.deadline import reset_deadline, set_deadline
+
+
+class FakeEmotionModel:
+    """Deterministic stand-in for EmotionModel: label i fires when the text contains str(i)"""
+
+    def __init__(self):
+        self.emotion_labels = ["zero", "one", "two"]
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def predict_proba_batch(self, user_inputs, batch_size=None):
+        with self.lock:
+            self.batch_sizes.append(len(user_inputs))
+        return numpy.array([[0.9 if str(i) in text else 0.1 for i in range(3)] for text in user_inputs],
+                           dtype=numpy.float32)
+
+    def select_labels_batch(self, probabilities, threshold=0.5):
+        return [[self.emotion_labels[i] for i, p in enumerate(row) if p > numpy.float32(threshold)]
+                for row in probabilities]
+
+    def embed_batch(self, user_inputs, batch_size=None):
+        embeddings = numpy.array([[1.0 if str(i) in text else 0.0 for i in range(3)] + [1.0] for text in user_inputs],
+                                 dtype=numpy.float32)
+        return embeddings / numpy.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_predict_returns_own_labels():
+    """Each caller receives the labels of its own text"""
+    batcher = EmotionBatcher(FakeEmotionModel(), max_batch_size=8, max_wait_ms=1)
+
+    assert batcher.predict("0") == ["zero"]
+    assert batcher.predict("12") == ["one", "two"]
+    assert batcher.predict("nothing") == []
+
+
+def test_concurrent_calls_are_batched():
+    """Concurrent calls inside the window are served by fewer forward passes"""
+    model = FakeEmotionModel()
+    batcher = EmotionBatcher(model, max_batch_size=16, max_wait_ms=50)
+    texts = [str(i % 3) for i in range(32)]
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(batcher.predict, texts))
+
+    assert results == [[model.emotion_labels[i % 3]] for i in range(32)]
+    assert max(model.batch_sizes) > 1
+    assert max(model.batch_sizes) <= 16
+
+    stats = batcher.stats()
+    assert stats["items"] == 32
+    assert stats["batches"] == len(model.batch_sizes)
+    assert stats["queue_depth"] == 0
+
+
+def test_inference_errors_reach_every_caller():
+    """A failing forward pass is reported to the callers instead of killing the worker"""
+    model = FakeEmotionModel()
+    model.predict_proba_batch = lambda texts, batch_size=None: (_ for _ in ()).throw(RuntimeError("boom"))
+    batcher = EmotionBatcher(model, max_batch_size=4, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        batcher.predict("0")
+
+
+def test_predict_async_does_not_block_event_loop():
+    """Other coroutines keep running while inference happens on the batcher thread"""
+    model = FakeEmotionModel()
+    release = threading.Event()
+    original = model.predict_proba_batch
+
+    def slow_predict(texts, batch_size=None):
+        release.wait(timeout=5)
+        return original(texts)
+
+    model.predict_proba_batch = slow_predict
+    batcher = EmotionBatcher(model, max_batch_size=4, max_wait_ms=1)
+
+    async def main():
+        prediction = asyncio.create_task(batcher.predict_async("1"))
+        # The event loop is still free to serve other work
+        await asyncio.sleep(0.01)
+        assert not prediction.done()
+        release.set()
+        return await prediction
+
+    assert asyncio.run(main()) == ["one"]
+
+
+def test_queue_cap_rejects_excess_work():
+    """Predictions beyond the queue cap are rejected with an EmotionException"""
+    model = FakeEmotionModel()
+    release = threading.Event()
+    original = model.predict_proba_batch
+
+    def blocked_predict(texts, batch_size=None):
+        release.wait(timeout=5)
+        return original(texts)
+
+    model.predict_proba_batch = blocked_predict
+    batcher = EmotionBatcher(model, max_batch_size=1, max_wait_ms=0, max_queued=2)
+
+    first = batcher.submit("0")
+    # Wait until the worker holds the first request, so the queue itself is empty
+    while batcher.stats()["queue_depth"]:
+        pass
+    queued = [batcher.submit("1"), batcher.submit("2")]
+    with pytest.raises(EmotionException):
+        batcher.submit("0")
+    assert batcher.stats()["rejected"] == 1
+
+    release.set()
+    assert first.result(timeout=5) == ["zero"]
+    assert [future.result(timeout=5) for future in queued] == [["one"], ["two"]]
+
+
+def test_bulk_predictions_keep_input_order():
+    """Bulk jobs share the queue with single calls and return labels in input order"""
+    batcher = EmotionBatcher(FakeEmotionModel(), max_batch_size=4, max_wait_ms=1)
+    texts = ["2", "0", "", "01", "1"]
+
+    assert batcher.submit_many(texts).result(timeout=5) == [["two"], ["zero"], [], ["zero", "one"], ["one"]]
+    assert batcher.submit_many([]).result(timeout=5) == []
+
+
+def test_cached_predictions_skip_inference():
+    """Repeated inputs are answered from the cache without another forward pass"""
+    model = FakeEmotionModel()
+    batcher = EmotionBatcher(model, max_batch_size=4, max_wait_ms=1, cache=EmotionCache("v1", use_redis=False))
+
+    async def main():
+        first = await batcher.predict_async("1")
+        second = await batcher.predict_async("1")
+        bulk = await batcher.predict_many_async(["1", "2"])
+        return first, second, bulk
+
+    assert asyncio.run(main()) == (["one"], ["one"], [["one"], ["two"]])
+    # "1" ran once, "2" once
+    assert model.batch_sizes == [1, 1]
+
+
+def test_embeddings_share_the_queue_with_predictions():
+    """Embedding and prediction requests collected into one batch each get their own results"""
+    batcher = EmotionBatcher(FakeEmotionModel(), max_batch_size=8, max_wait_ms=20)
+
+    async def main():
+        return await asyncio.gather(batcher.embed_async(["0", "12"]), batcher.predict_async("1"))
+
+    embeddings, labels = asyncio.run(main())
+    assert embeddings.shape == (2, 4)
+    assert numpy.allclose(embeddings[0], numpy.array([1, 0, 0, 1]) / numpy.sqrt(2))
+    assert labels == ["one"]
+
+
+
+def test_expired_predictions_are_skipped():
+    """A prediction whose request deadline passed while it was queued is not run"""
+    model = FakeEmotionModel()
+    release = threading.Event()
+    original = model.predict_proba_batch
+
+    def blocked_predict(texts, batch_size=None):
+        release.wait(timeout=5)
+        return original(texts)
+
+    model.predict_proba_batch = blocked_predict
+    batcher = EmotionBatcher(model, max_batch_size=1, max_wait_ms=0)
+
+    first = batcher.submit("0")
+    while batcher.stats()["queue_depth"]:
+        pass
+    token = set_deadline(0.01)
+    try:
+        expiring = batcher.submit("1")
+    finally:
+        reset_deadline(token)
+    time.sleep(0.02)
+    release.set()
+
+    assert first.result(timeout=5) == ["zero"]
+    with pytest.raises(DeadlineException):
+        expiring.result(timeout=5)
+    assert batcher.stats()["expired"] == 1
+    assert model.batch_sizes == [1]
@@ -0,0 +1,101 @@
+import asyncio
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.ai.emotion_cache import EmotionCache
+
+
+class FakePipeline:
+    """Collects pipelined SET commands of the fake Redis"""
+
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value))
+
+    async def execute(self):
+        self.store.update(self.commands)
+
+
+class FakeRedis:
+    """In-memory stand-in for the asyncio Redis client"""
+
+    def __init__(self, fail=False):
+        self.store = {}
+        self.fail = fail
+
+    async def mget(self, keys):
+        if self.fail:
+            raise RedisConnectionError("redis is down")
+        return [self.store.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.store)
+
+
+def test_local_tier_hits():
+    """A stored prediction is served from the in-process tier"""
+    cache = EmotionCache("v1", use_redis=False)
+
+    async def main():
+        assert await cache.get_many(["hi"], 0.5) == [None]
+        cache.set_many(["hi"], 0.5, [["joy"]])
+        return await cache.get_many(["hi", "ok"], 0.5)
+
+    assert asyncio.run(main()) == [["joy"], None]
+    assert cache.stats()["local_hits"] == 1
+
+
+def test_key_depends_on_text_threshold_and_version():
+    """Normalized text, threshold and model version all take part in the key"""
+    cased = EmotionCache("v1", use_redis=False)
+    uncased = EmotionCache("v1", lowercase=True, use_redis=False)
+
+    assert cased.key("hi  there ", 0.5) == cased.key("hi there", 0.5)
+    assert cased.key("Hi", 0.5) != cased.key("hi", 0.5)
+    assert uncased.key("Hi", 0.5) == uncased.key("hi", 0.5)
+    assert cased.key("hi", 0.5) != cased.key("hi", 0.6)
+    assert cased.key("hi", 0.5) != EmotionCache("v2", use_redis=False).key("hi", 0.5)
+
+
+def test_redis_tier_is_shared_between_workers():
+    """A prediction stored by one worker is found in Redis by another one"""
+    redis_client = FakeRedis()
+    first = EmotionCache("v1", redis_client=redis_client, use_redis=True)
+    second = EmotionCache("v1", redis_client=redis_client, use_redis=True)
+
+    async def main():
+        first.set_many(["i'm tired"], 0.5, [["sadness"]])
+        await asyncio.gather(*first._background_tasks)
+        return await second.get_many(["i'm tired"], 0.5)
+
+    assert asyncio.run(main()) == [["sadness"]]
+    assert second.stats()["redis_hits"] == 1
+
+
+def test_redis_errors_degrade_to_misses():
+    """An unavailable Redis tier only costs cache misses"""
+    cache = EmotionCache("v1", redis_client=FakeRedis(fail=True), use_redis=True)
+
+    assert asyncio.run(cache.get_many(["lol"], 0.5)) == [None]
+    assert cache.stats()["redis_errors"] == 1
+
+
+def test_long_texts_are_not_cached():
+    """Texts above the length limit bypass the cache"""
+    cache = EmotionCache("v1", max_text_length=5, use_redis=False)
+
+    async def main():
+        cache.set_many(["a long sentence"], 0.5, [["joy"]])
+        return await cache.get_many(["a long sentence"], 0.5)
+
+    assert asyncio.run(main()) == [None]
+    assert cache.stats()["skipped"] == 1
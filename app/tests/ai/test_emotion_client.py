@@ -0,0 +1,140 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.ai.emotion_batcher import EmotionBatcher
+from app.ai.emotion_client import RemoteEmotionClient, encode_frame, read_frame
+from app.ai.emotion_server import EmotionInferenceServer, bind_socket
+from app.exceptions.emotion_exceptions import EmotionException
+from app.tests.ai.test_emotion_batcher import FakeEmotionModel
+
+
+def run_with_server(socket_path, batcher, scenario):
+    """Serve the batcher on a Unix socket while the scenario runs"""
+    async def main():
+        serving = asyncio.create_task(EmotionInferenceServer(batcher).serve(bind_socket(str(socket_path))))
+        try:
+            return await scenario()
+        finally:
+            serving.cancel()
+
+    return asyncio.run(main())
+
+
+def test_frame_roundtrip():
+    """Frames carry their length, so several can be read back from one stream"""
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame({"id": 1, "texts": ["hé"]}) + encode_frame({"id": 2}))
+        return await read_frame(reader), await read_frame(reader)
+
+    assert asyncio.run(main()) == ({"id": 1, "texts": ["hé"]}, {"id": 2})
+
+
+def test_remote_predictions(tmp_path):
+    """Concurrent requests share the connections and each gets its own labels"""
+    socket_path = tmp_path / "emotion.sock"
+    client = RemoteEmotionClient(str(socket_path), timeout=5, connections=2)
+
+    async def scenario():
+        single = await asyncio.gather(*(client.predict_async(str(i % 3)) for i in range(20)))
+        many = await client.predict_many_async(["0", "12", "nothing"])
+        return single, many
+
+    single, many = run_with_server(socket_path, EmotionBatcher(FakeEmotionModel(), max_wait_ms=1), scenario)
+
+    assert single == [[["zero"], ["one"], ["two"]][i % 3] for i in range(20)]
+    assert many == [["zero"], ["one", "two"], []]
+    assert client.stats()["requests"] == 21
+    assert client.stats()["reconnects"] == 2
+
+
+def test_remote_embeddings(tmp_path):
+    """Sentence embeddings are computed by the inference server"""
+    socket_path = tmp_path / "emotion.sock"
+    client = RemoteEmotionClient(str(socket_path), timeout=5)
+    model = FakeEmotionModel()
+
+    async def scenario():
+        return await client.embed_async(["0", "nothing"])
+
+    embeddings = run_with_server(socket_path, EmotionBatcher(model, max_wait_ms=1), scenario)
+
+    assert embeddings.dtype == "float32"
+    assert embeddings.tolist() == model.embed_batch(["0", "nothing"]).tolist()
+
+
+def test_answers_are_written_one_at_a_time():
+    """Concurrent answers on one connection never drain the same writer at once"""
+    class SlowWriter:
+        def __init__(self):
+            self.frames = []
+            self.draining = 0
+            self.max_draining = 0
+
+        def is_closing(self):
+            return False
+
+        def write(self, data):
+            self.frames.append(data)
+
+        async def drain(self):
+            self.draining += 1
+            self.max_draining = max(self.max_draining, self.draining)
+            await asyncio.sleep(0.01)
+            self.draining -= 1
+
+    writer = SlowWriter()
+    server = EmotionInferenceServer(EmotionBatcher(FakeEmotionModel(), max_wait_ms=1))
+
+    async def main():
+        write_lock = asyncio.Lock()
+        await asyncio.gather(*(server._answer({"id": i, "texts": [str(i % 3)]}, writer, write_lock)
+                               for i in range(5)))
+
+    asyncio.run(main())
+    assert len(writer.frames) == 5
+    assert writer.max_draining == 1
+
+
+def test_server_errors_are_raised(tmp_path):
+    """An overloaded inference server surfaces as the same 503 as a local full queue"""
+    socket_path = tmp_path / "emotion.sock"
+    client = RemoteEmotionClient(str(socket_path), timeout=5)
+
+    class FailingBatcher:
+        async def predict_many_async(self, user_inputs, threshold=0.5):
+            raise EmotionException()
+
+    async def scenario():
+        with pytest.raises(EmotionException) as e:
+            await client.predict_async("1")
+        return e.value.status_code
+
+    assert run_with_server(socket_path, FailingBatcher(), scenario) == 503
+    assert client.stats()["errors"] == 1
+
+
+def test_server_unavailable(tmp_path):
+    """Without an inference server the client fails fast with a 503"""
+    client = RemoteEmotionClient(str(tmp_path / "missing.sock"), timeout=1)
+
+    with pytest.raises(EmotionException) as e:
+        asyncio.run(client.predict_async("1"))
+    assert e.value.status_code == 503
+
+
+def test_remote_mode_keeps_torch_out_of_web_workers():
+    """With remote inference the application starts without importing torch or transformers"""
+    env = dict(os.environ, TESTING="True", EMOTION_INFERENCE_MODE="remote")
+    code = ("import sys, app.main; "
+            "from app.api.routes import emo; "
+            "assert type(emo.emotion_batcher).__name__ == 'RemoteEmotionClient'; "
+            "print('torch' in sys.modules, 'transformers' in sys.modules)")
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["False", "False"]
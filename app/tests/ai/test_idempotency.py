@@ -0,0 +1,243 @@
+import asyncio
+
+import pytest
+
+from app.ai.idempotency import IdempotencyStore, InFlightGeneration
+from app.exceptions.idempotency_exceptions import IdempotencyException
+from app.utils.sse_utils import encode_data_frame
+
+FRAMES = [
+    encode_data_frame(b'{"choices":[{"delta":{"content":"Hello"}}]}'),
+    encode_data_frame(b'{"choices":[{"delta":{"content":" there"}}]}'),
+    encode_data_frame(b"[DONE]"),
+]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+def counting_stream(calls: list, release: asyncio.Event = None):
+    def generate():
+        async def stream():
+            calls.append(1)
+            for frame in FRAMES:
+                if release is not None:
+                    await release.wait()
+                yield frame
+        return stream()
+    return generate
+
+
+async def collect(outcome):
+    return [frame async for frame in outcome.follow()]
+
+
+def test_retries_attach_to_the_running_stream():
+    store = IdempotencyStore(use_redis=False)
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+        key = store.key("user", "retry-1")
+        first = await store.start(key, "fp", counting_stream(calls, release))
+        first_frames = asyncio.create_task(collect(first))
+        await asyncio.sleep(0)
+        # The retry arrives while the first request is still generating
+        second = await store.start(key, "fp", counting_stream(calls))
+        release.set()
+        return await first_frames, await collect(second), await store.start(key, "fp", counting_stream(calls))
+
+    first, second, replayed = asyncio.run(run())
+    assert len(calls) == 1
+    assert first == second == FRAMES
+    assert replayed["content"] == "Hello there"
+    assert store.stats()["attached"] == 1 and store.stats()["replayed"] == 1
+
+
+def test_result_is_shared_between_workers():
+    redis_client = FakeRedis()
+    worker_a = IdempotencyStore(redis_client=redis_client)
+    worker_b = IdempotencyStore(redis_client=redis_client)
+    worker_b.poll_interval = 0.01
+    calls = []
+
+    async def completion():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "Hi", {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+
+    async def run():
+        key = worker_a.key("user", "retry-2")
+        running = await worker_a.start(key, "fp", completion)
+        # Worker b waits for the generation of worker a instead of starting its own
+        stored = await worker_b.start(key, "fp", completion)
+        return await running.wait(), stored
+
+    result, stored = asyncio.run(run())
+    assert len(calls) == 1
+    assert result == ("Hi", {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2})
+    assert stored["content"] == "Hi"
+
+
+def test_key_reused_for_a_different_request_is_rejected():
+    store = IdempotencyStore(use_redis=False)
+
+    async def run():
+        key = store.key("user", "retry-3")
+        await collect(await store.start(key, "fp", counting_stream([])))
+        await store.start(key, "other", counting_stream([]))
+
+    with pytest.raises(IdempotencyException) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 422
+
+
+def test_failed_generation_releases_the_key():
+    redis_client = FakeRedis()
+    store = IdempotencyStore(redis_client=redis_client)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise IdempotencyException("upstream down", 502)
+
+    async def run():
+        key = store.key("user", "retry-4")
+        with pytest.raises(IdempotencyException):
+            await (await store.start(key, "fp", failing)).wait()
+        assert key not in redis_client.data
+        # The retry runs the generation again
+        with pytest.raises(IdempotencyException):
+            await (await store.start(key, "fp", failing)).wait()
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_generation_in_another_worker_times_out():
+    redis_client = FakeRedis()
+    store = IdempotencyStore(redis_client=redis_client)
+    store.wait_timeout, store.poll_interval = 0.05, 0.01
+    key = store.key("user", "retry-5")
+    redis_client.data[key] = '{"fingerprint": "fp"}'
+
+    with pytest.raises(IdempotencyException) as error:
+        asyncio.run(store.start(key, "fp", counting_stream([])))
+    assert error.value.status_code == 409
+
+
+def test_keys_are_scoped_per_user():
+    store = IdempotencyStore(use_redis=False)
+    assert store.key("alice", "k") != store.key("bob", "k")
+    assert store.fingerprint({"a": 1, "b": 2}) == store.fingerprint({"b": 2, "a": 1})
+
+
+def test_follower_sees_the_error_of_a_failed_stream():
+    async def run():
+        flight = InFlightGeneration("fp")
+        follower = asyncio.create_task(collect(flight))
+        flight.publish(FRAMES[0])
+        await asyncio.sleep(0)
+        flight.finish(error=IdempotencyException("upstream down", 502))
+        return await asyncio.gather(follower, return_exceptions=True)
+
+    (outcome,) = asyncio.run(run())
+    assert isinstance(outcome, IdempotencyException)
+
+
+def test_stream_with_an_error_payload_is_not_replayed():
+    redis_client = FakeRedis()
+    store = IdempotencyStore(redis_client=redis_client)
+    calls = []
+
+    def generate():
+        async def stream():
+            calls.append(1)
+            yield encode_data_frame(b'{"error": {"message": "upstream overloaded"}}')
+            yield encode_data_frame(b"[DONE]")
+        return stream()
+
+    async def run():
+        key = store.key("user", "retry-6")
+        with pytest.raises(IdempotencyException) as error:
+            await collect(await store.start(key, "fp", generate))
+        assert error.value.status_code == 502
+        assert key not in redis_client.data and store.local.get(key) is None
+        # The retry reaches the LLM API again instead of replaying an empty completion
+        retried = await store.start(key, "fp", counting_stream(calls))
+        return await collect(retried)
+
+    assert asyncio.run(run()) == FRAMES
+    assert len(calls) == 2
+
+
+def upstream_stream(calls: list, closed: asyncio.Event):
+    """A slow upstream stream recording when it is closed before its end"""
+    def generate():
+        async def stream():
+            calls.append(1)
+            try:
+                for frame in FRAMES:
+                    yield frame
+                    await asyncio.sleep(0.05)
+            finally:
+                closed.set()
+        return stream()
+    return generate
+
+
+def test_abandoned_stream_is_closed_upstream():
+    redis_client = FakeRedis()
+    store = IdempotencyStore(redis_client=redis_client)
+    store.abandon_grace = 0.01
+    calls = []
+
+    async def run():
+        closed = asyncio.Event()
+        key = store.key("user", "retry-7")
+        follower = asyncio.create_task(collect(await store.start(key, "fp", upstream_stream(calls, closed))))
+        await asyncio.sleep(0.01)
+        follower.cancel()  # The client disconnects
+        await asyncio.wait_for(closed.wait(), 1)
+        await asyncio.sleep(0)
+        assert key not in redis_client.data and store.stats()["in_flight"] == 0
+        # A later retry starts the generation again
+        return await collect(await store.start(key, "fp", counting_stream(calls)))
+
+    assert asyncio.run(run()) == FRAMES
+    assert len(calls) == 2
+    assert store.stats()["abandoned"] == 1
+
+
+def test_retry_within_the_grace_period_keeps_the_stream():
+    store = IdempotencyStore(use_redis=False)
+    store.abandon_grace = 1.0
+    calls = []
+
+    async def run():
+        closed = asyncio.Event()
+        key = store.key("user", "retry-8")
+        follower = asyncio.create_task(collect(await store.start(key, "fp", upstream_stream(calls, closed))))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        await asyncio.sleep(0.01)
+        # The retry attaches to the generation that is still running
+        return await collect(await store.start(key, "fp", upstream_stream(calls, closed)))
+
+    assert asyncio.run(run()) == FRAMES
+    assert len(calls) == 1
+    assert store.stats()["abandoned"] == 0
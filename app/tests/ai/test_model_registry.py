@@ -0,0 +1,19 @@
+from app.ai.model_registry import get_emotion_batcher, get_emotion_model
+
+
+def test_emotion_model_is_shared():
+    """Every consumer in the process gets the same loaded model"""
+    from app.api.routes import chat, emo
+
+    model = get_emotion_model()
+    assert get_emotion_model() is model
+    assert get_emotion_batcher().emotion_model is model
+    assert emo.emotion_batcher is get_emotion_batcher()
+    assert chat.aimo.emotion_model is model
+
+
+def test_new_aimo_instances_reuse_the_model():
+    """Building another AIMO does not load the weights again"""
+    from app.ai.aimo import AIMO
+
+    assert AIMO().emotion_batcher is get_emotion_batcher()
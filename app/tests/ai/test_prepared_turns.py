@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+
+from app.ai.prepared_turns import PreparedTurns
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        return True
+
+
+def counting_predict(calls: list, emotions=("joy",), delay: float = 0.0):
+    async def predict():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return list(emotions) if emotions is not None else None
+    return predict
+
+
+def test_prepared_emotions_are_reused():
+    prepared = PreparedTurns(use_redis=False)
+    calls = []
+
+    async def run():
+        await prepared.prepare_emotions("hello", counting_predict(calls))
+        return await prepared.emotions("hello"), await prepared.emotions("something else")
+
+    assert asyncio.run(run()) == (["joy"], None)
+    assert len(calls) == 1
+    assert prepared.stats()["emotion_hits"] == 1
+
+
+def test_completion_waits_for_a_running_preparation():
+    prepared = PreparedTurns(use_redis=False)
+    calls = []
+
+    async def run():
+        prepared.prepare_emotions("hello", counting_predict(calls, delay=0.05))
+        # A second prepare call of the same draft joins the running inference
+        prepared.prepare_emotions("hello", counting_predict(calls, delay=0.05))
+        return await prepared.emotions("hello")
+
+    assert asyncio.run(run()) == ["joy"]
+    assert len(calls) == 1
+    assert prepared.stats()["pending_hits"] == 1
+
+
+def test_prepared_emotions_are_shared_between_workers():
+    redis_client = FakeRedis()
+    worker_a = PreparedTurns(redis_client=redis_client)
+    worker_b = PreparedTurns(redis_client=redis_client)
+
+    async def run():
+        await worker_a.prepare_emotions("hello", counting_predict([], emotions=("sadness",)))
+        await asyncio.gather(*worker_a._background_tasks)
+        return await worker_b.emotions("hello")
+
+    assert asyncio.run(run()) == ["sadness"]
+
+
+def test_skipped_inference_is_not_kept():
+    prepared = PreparedTurns(use_redis=False)
+
+    async def run():
+        await prepared.prepare_emotions("hello", counting_predict([], emotions=None))
+        return await prepared.emotions("hello")
+
+    assert asyncio.run(run()) is None
+
+
+def test_keys():
+    assert PreparedTurns.message_hash("hello") == hashlib.sha256(b"hello").hexdigest()
+    history = [{"role": "user", "content": "hi"}]
+    assert PreparedTurns.history_key("alice", None, history, "hello", 1) != \
+        PreparedTurns.history_key("bob", None, history, "hello", 1)
+    assert PreparedTurns.history_key("alice", None, history, "hello", 1) != \
+        PreparedTurns.history_key("alice", None, history, "hello", 2)
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from app.ai.aimo import AIMO
+from app.ai.mock_provider import MockProvider
+from app.ai.providers import Provider, ProviderRouter
+from app.ai.response_cache import collect_completion
+from app.core.config import settings
+from app.core.http_client import close_http_session
+from app.exceptions.aimo_exceptions import AIMOException
+from app.models.chat import Message
+
+
+def run_with_providers(mock_providers, scenario, hedging=False):
+    """Run a scenario against an AIMO routed over local mock providers"""
+
+    async def main():
+        aimo = AIMO()
+        urls = [await mock.start() for mock in mock_providers]
+        aimo.router = ProviderRouter([Provider(f"mock-{i}", url, "test-key") for i, url in enumerate(urls)],
+                                     hedging=hedging)
+        try:
+            return await scenario(aimo)
+        finally:
+            await close_http_session()
+            for mock in mock_providers:
+                await mock.stop()
+
+    return asyncio.run(main())
+
+
+async def stream_reply(aimo):
+    frames = [frame async for frame in aimo.get_response_stream([Message(role="user", content="hi")])]
+    return collect_completion(frames)[0]
+
+
+def test_failover_to_the_next_provider():
+    failing, healthy = MockProvider(status=503), MockProvider(reply="from the fallback")
+
+    async def scenario(aimo):
+        content, usage = await aimo.get_completion([Message(role="user", content="hi")])
+        return content, usage, aimo.router.stats()
+
+    content, usage, stats = run_with_providers([failing, healthy], scenario)
+    assert content == "from the fallback"
+    assert usage["total_tokens"] == 13
+    assert failing.requests == 1 and healthy.requests == 1
+    assert stats["failovers"] == 1
+    assert stats["providers"]["mock-0"]["errors"] == 1
+
+
+def test_failing_provider_is_routed_around():
+    failing, healthy = MockProvider(status=500), MockProvider()
+
+    async def scenario(aimo):
+        return [await stream_reply(aimo) for _ in range(3)]
+
+    replies = run_with_providers([failing, healthy], scenario)
+    assert replies == ["Hello from the mock provider"] * 3
+    # After its first error the failing provider ranks behind the healthy one
+    assert failing.requests == 1 and healthy.requests == 3
+
+
+def test_all_providers_failing_raises():
+    async def scenario(aimo):
+        await aimo.get_completion([Message(role="user", content="hi")])
+
+    with pytest.raises(AIMOException):
+        run_with_providers([MockProvider(status=500), MockProvider(status=502)], scenario)
+
+
+def test_slow_stream_is_hedged(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY", 0.05)
+    monkeypatch.setattr(settings, "LLM_CONNECT_TIMEOUT", 0.05)
+    slow, fast = MockProvider(reply="slow", first_token_delay=2.0), MockProvider(reply="fast")
+
+    async def scenario(aimo):
+        return await asyncio.wait_for(stream_reply(aimo), 1.5), aimo.router.stats()
+
+    reply, stats = run_with_providers([slow, fast], scenario, hedging=True)
+    assert reply == "fast"
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_ewma_ranking():
+    slow, fast = Provider("slow", "http://slow", "key"), Provider("fast", "http://fast", "key")
+    router = ProviderRouter([slow, fast])
+    slow.record(0.8, failed=False)
+    fast.record(0.2, failed=False)
+    assert router.ranked() == [fast, slow]
+
+    # Errors outweigh the latency advantage
+    for _ in range(3):
+        fast.record(None, failed=True)
+    assert router.ranked() == [slow, fast]
+
+
+def test_hedge_delay_is_the_latency_percentile(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY", 0.0)
+    router = ProviderRouter([Provider("only", "http://only", "key")])
+    router._first_token_latencies.extend(i / 100 for i in range(1, 101))
+    assert router.hedge_delay() == pytest.approx(0.95)
+
+
+def test_idle_provider_is_warmed_up(monkeypatch):
+    provider = Provider("idle", "http://idle", "key")
+    router = ProviderRouter([provider])
+    warmed = []
+
+    async def warm_up(url, connections=None):
+        warmed.append(url)
+        return 1
+
+    monkeypatch.setattr("app.ai.providers.warm_up_http_session", warm_up)
+
+    async def run():
+        started = router.prewarm()
+        # A second request while the connection is being opened does not open another one
+        again = router.prewarm()
+        await asyncio.gather(*router._background_tasks)
+        return started, again
+
+    assert asyncio.run(run()) == (True, False)
+    assert warmed == ["http://idle"]
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from app.ai.response_cache import ResponseCache, collect_completion, replay_chunks
+from app.core.config import settings
+from app.utils.sse_utils import encode_data_frame
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def request_data(content="Hello  there", temperature=0.0):
+    return {
+        "messages": [{"role": "system", "content": "prompt"}, {"role": "user", "content": content}],
+        "model": "deepseek/deepseek-chat",
+        "max_tokens": 100,
+        "temperature": temperature,
+        "top_p": 0.9,
+        "stream": True,
+    }
+
+
+def test_cacheable(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_RESPONSE_CACHE_ENABLED", True)
+    assert ResponseCache.cacheable(0.0)
+    assert not ResponseCache.cacheable(0.7)
+    assert ResponseCache.cacheable(0.7, force=True)
+    monkeypatch.setattr(settings, "CHAT_RESPONSE_CACHE_ENABLED", False)
+    assert not ResponseCache.cacheable(0.0, force=True)
+
+
+def test_key_covers_prompt_version_messages_and_params():
+    cache = ResponseCache(use_redis=False)
+    key = cache.key(request_data(), prompt_version=3)
+
+    # Whitespace is normalized and the stream flag is not part of the key
+    assert cache.key({**request_data(" Hello there "), "stream": False}, 3) == key
+    assert cache.key(request_data(), 4) != key
+    assert cache.key(request_data("Hello"), 3) != key
+    assert cache.key({**request_data(), "max_tokens": 50}, 3) != key
+
+
+def test_redis_tier_is_shared():
+    redis_client = FakeRedis()
+    writer = ResponseCache(redis_client=redis_client, use_redis=True)
+    reader = ResponseCache(redis_client=redis_client, use_redis=True)
+    usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+
+    async def run():
+        writer.set("k", "cached reply", usage)
+        await asyncio.gather(*writer._background_tasks)
+        return await reader.get("k"), await reader.get("missing")
+
+    hit, miss = asyncio.run(run())
+    assert hit == {"content": "cached reply", "usage": usage}
+    assert miss is None
+    assert reader.stats()["redis_hits"] == 1
+    assert reader.stats()["tokens_saved"] == 15
+
+
+def test_replay_round_trip():
+    content = "A reply that is longer than one replay chunk, with ünïcode 🌙."
+    usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    chunks = list(replay_chunks(content, usage, "aimo-chat"))
+
+    assert chunks[0]["choices"][0]["delta"]["role"] == "assistant"
+    frames = [encode_data_frame(json.dumps(chunk).encode()) for chunk in chunks]
+    assert collect_completion(frames) == (content, usage)
+    assert collect_completion([{"data": json.dumps(chunk)} for chunk in chunks]) == (content, usage)
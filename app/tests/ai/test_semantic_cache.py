@@ -0,0 +1,51 @@
+import numpy
+
+from app.ai.semantic_cache import SemanticCache
+
+
+def unit(*values):
+    vector = numpy.array(values, dtype=numpy.float32)
+    return vector / numpy.linalg.norm(vector)
+
+
+def test_similar_message_hits():
+    cache = SemanticCache(threshold=0.9, max_entries=8, ttl=60)
+    cache.add(unit(1, 0, 0), "v1", "Hey! 🌙", {"total_tokens": 20})
+
+    hit = cache.lookup(unit(1, 0.1, 0), "v1")
+    assert hit["content"] == "Hey! 🌙"
+    assert hit["similarity"] > 0.99
+    assert cache.lookup(unit(0, 1, 0), "v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.stats()["tokens_saved"] == 20
+
+
+def test_scopes_are_isolated():
+    cache = SemanticCache(threshold=0.9, max_entries=8, ttl=60)
+    cache.add(unit(1, 0, 0), ("prompt-v1", 500), "old prompt reply")
+
+    assert cache.lookup(unit(1, 0, 0), ("prompt-v2", 500)) is None
+    cache.add(unit(1, 0, 0), ("prompt-v2", 500), "new prompt reply")
+    assert cache.lookup(unit(1, 0, 0), ("prompt-v2", 500))["content"] == "new prompt reply"
+    assert cache.lookup(unit(1, 0, 0), ("prompt-v1", 500))["content"] == "old prompt reply"
+
+
+def test_least_recently_used_entry_is_replaced():
+    cache = SemanticCache(threshold=0.99, max_entries=2, ttl=60)
+    cache.add(unit(1, 0, 0), "v1", "a")
+    cache.add(unit(0, 1, 0), "v1", "b")
+    cache.lookup(unit(1, 0, 0), "v1")  # "a" is now more recent than "b"
+    cache.add(unit(0, 0, 1), "v1", "c")
+
+    assert cache.lookup(unit(0, 1, 0), "v1") is None
+    assert cache.lookup(unit(1, 0, 0), "v1")["content"] == "a"
+    assert cache.lookup(unit(0, 0, 1), "v1")["content"] == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_not_served():
+    cache = SemanticCache(threshold=0.9, max_entries=2, ttl=0)
+    cache.add(unit(1, 0, 0), "v1", "a")
+
+    assert cache.lookup(unit(1, 0, 0), "v1") is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,70 @@
+import json
+import time
+
+from app.ai.stream_coalescer import DeltaCoalescer
+
+
+def delta(content, role=None):
+    body = {"content": content, **({"role": role} if role else {})}
+    return json.dumps({"id": "chatcmpl-1", "object": "chat.completion.chunk", "model": "m",
+                       "choices": [{"index": 0, "delta": body, "finish_reason": None}]}).encode("utf-8")
+
+
+FINISH = json.dumps({"id": "chatcmpl-1", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}).encode()
+USAGE = json.dumps({"id": "chatcmpl-1", "choices": [], "usage": {"total_tokens": 3}}).encode()
+
+
+def contents(payloads):
+    return [json.loads(payload)["choices"][0]["delta"].get("content") for payload in payloads]
+
+
+def test_deltas_are_merged_until_a_finish_chunk():
+    coalescer = DeltaCoalescer(window=10.0, max_bytes=1000)
+    sent = coalescer.add(delta("He", role="assistant"))
+    for text in ("l", "lo", " wor", "ld"):
+        sent += coalescer.add(delta(text))
+    assert contents(sent) == ["He"]  # The first token is sent right away
+
+    sent += coalescer.add(FINISH) + coalescer.add(USAGE)
+    assert contents(sent[:2]) == ["He", "llo world"]
+    assert sent[2:] == [FINISH, USAGE]
+    merged = json.loads(sent[1])
+    assert merged["id"] == "chatcmpl-1" and merged["object"] == "chat.completion.chunk"
+    assert coalescer.merged == 3
+
+
+def test_byte_threshold_flushes():
+    coalescer = DeltaCoalescer(window=10.0, max_bytes=4)
+    sent = coalescer.add(delta("a"))
+    sent += coalescer.add(delta("bc")) + coalescer.add(delta("de")) + coalescer.add(delta("f"))
+    assert contents(sent) == ["a", "bcde"]
+    assert contents(coalescer.flush()) == ["f"]
+
+
+def test_window_ends_the_group():
+    coalescer = DeltaCoalescer(window=0.01, max_bytes=1000)
+    coalescer.add(delta("a"))
+    assert coalescer.add(delta("b")) == []
+    assert 0.0 < coalescer.due() <= 0.01
+    time.sleep(0.02)
+    assert contents(coalescer.add(delta("c"))) == ["bc"]
+    assert coalescer.due() is None
+
+
+def test_other_payloads_pass_unchanged():
+    coalescer = DeltaCoalescer(window=10.0, max_bytes=1000)
+    tool_call = json.dumps({"choices": [{"index": 0, "delta": {"tool_calls": []}, "finish_reason": None}]}).encode()
+    error = b'{"error": {"message": "overloaded"}}'
+    assert coalescer.add(b"not json") == [b"not json"]
+    assert coalescer.add(tool_call) == [tool_call]
+    assert coalescer.add(error) == [error]
+
+
+def test_empty_role_chunk_does_not_delay_the_first_token():
+    coalescer = DeltaCoalescer(window=10.0, max_bytes=1000)
+    opening = delta("", role="assistant")
+    assert coalescer.add(opening) == [opening]
+    first_token = delta("Hello")
+    assert coalescer.add(first_token) == [first_token]
+    assert coalescer.add(delta(" there")) == []
+    assert coalescer.due() is not None
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.ai.providers import Provider, ProviderRouter
+from app.ai.upstream_limiter import AdaptiveLimiter, CircuitBreaker
+from app.core.config import settings
+from app.exceptions.aimo_exceptions import AIMOException, UpstreamException
+
+
+def test_requests_beyond_the_limit_wait_for_a_slot(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_LIMITER_QUEUE_TIMEOUT", 1.0)
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=4)
+
+    async def run():
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiting.done() and limiter.stats()["queued"] == 1
+        limiter.release()
+        await asyncio.wait_for(waiting, 1)
+        return limiter.in_flight
+
+    assert asyncio.run(run()) == 1
+
+
+def test_full_queue_fails_fast(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_LIMITER_QUEUE_TIMEOUT", 0.02)
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=4)
+
+    async def run():
+        await limiter.acquire()
+        await limiter.acquire()
+
+    with pytest.raises(AIMOException) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 503
+    assert limiter.stats()["rejected"] == 1 and limiter.stats()["queued"] == 0
+
+
+def test_aimd_limit():
+    limiter = AdaptiveLimiter(initial=10, min_limit=2, max_limit=20)
+    limiter.in_flight = 10
+    for _ in range(10):
+        limiter.on_success(0.1)
+    # About one more slot after a full limit of successes
+    assert 10.9 < limiter.limit < 11.1
+
+    limiter.on_overload()
+    assert limiter.limit == pytest.approx(11.0 * 0.8, abs=0.1)
+    # A burst of failures is one overload signal
+    limiter.on_overload()
+    assert limiter.decreases == 1
+
+    # A first token far slower than the baseline decreases the limit as well
+    limiter._last_decrease = 0.0
+    limiter.on_success(1.0)
+    assert limiter.decreases == 2
+
+
+def test_breaker_opens_and_probes(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BREAKER_MIN_REQUESTS", 4)
+    monkeypatch.setattr(settings, "LLM_BREAKER_OPEN_SECONDS", 0.0)
+    breaker = CircuitBreaker()
+    for success in (True, False, False, True):
+        assert breaker.start_request()
+        breaker.record(success)
+    assert breaker.state == "open"
+
+    # Half-open: a single probe passes
+    assert breaker.start_request()
+    assert not breaker.start_request()
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+
+def test_open_breakers_fail_fast(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BREAKER_MIN_REQUESTS", 2)
+    calls = []
+
+    async def attempt(provider):
+        calls.append(provider.name)
+        raise UpstreamException("API Error: 503", 503)
+
+    async def run():
+        router = ProviderRouter([Provider("only", "http://only", "key")])
+        for _ in range(2):
+            with pytest.raises(UpstreamException):
+                await router.first_response(attempt)
+        with pytest.raises(AIMOException) as error:
+            await router.first_response(attempt)
+        return router.stats(), error.value
+
+    stats, error = asyncio.run(run())
+    assert error.status_code == 503
+    assert len(calls) == 2
+    assert stats["rejected"] == 1
+    assert stats["providers"]["only"]["breaker"]["state"] == "open"
+    assert stats["providers"]["only"]["limiter"]["in_flight"] == 0
@@ -0,0 +1,93 @@
+import asyncio
+
+from redis.exceptions import ConnectionError
+
+from app.ai.usage_meter import UsageMeter, parse_usage
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def hincrby(self, key, field, value):
+        self.commands.append(("hincrby", key, field, value))
+
+    def expire(self, key, ttl):
+        self.commands.append(("expire", key, ttl))
+
+    async def execute(self):
+        if self.redis_client.fail:
+            raise ConnectionError("down")
+        self.redis_client.executed.append(self.commands)
+        for command in self.commands:
+            if command[0] == "hincrby":
+                _, key, field, value = command
+                hash_ = self.redis_client.hashes.setdefault(key, {})
+                hash_[field] = hash_.get(field, 0) + value
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.executed = []
+        self.fail = False
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def test_parse_usage():
+    assert parse_usage({"prompt_tokens": 10, "completion_tokens": 5}) == \
+        {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    assert parse_usage(None) is None
+    assert parse_usage({"prompt_tokens": "many"}) is None
+
+
+def test_usage_is_flushed_per_user_in_one_batch():
+    redis_client = FakeRedis()
+    meter = UsageMeter(redis_client=redis_client)
+    for _ in range(3):
+        meter.record("wallet-a", parse_usage({"prompt_tokens": 10, "completion_tokens": 5}))
+    meter.record("wallet-b", parse_usage({"prompt_tokens": 1, "completion_tokens": 1}))
+    meter.record("wallet-b", None)
+
+    assert asyncio.run(meter.flush()) == 2
+    assert len(redis_client.executed) == 1
+    totals = {key.rsplit(":", 1)[-1]: value for key, value in redis_client.hashes.items()}
+    assert totals["wallet-a"] == {"requests": 3, "prompt_tokens": 30, "completion_tokens": 15, "total_tokens": 45}
+    assert totals["wallet-b"]["total_tokens"] == 2
+    assert meter.stats()["total_tokens"] == 47
+    assert meter.stats()["pending_users"] == 0
+    # Nothing new, nothing written
+    assert asyncio.run(meter.flush()) == 0
+
+
+def test_failed_flush_keeps_the_counters():
+    redis_client = FakeRedis()
+    meter = UsageMeter(redis_client=redis_client)
+    meter.record("wallet-a", parse_usage({"prompt_tokens": 10, "completion_tokens": 5}))
+
+    redis_client.fail = True
+    assert asyncio.run(meter.flush()) == 0
+    meter.record("wallet-a", parse_usage({"prompt_tokens": 10, "completion_tokens": 5}))
+    redis_client.fail = False
+    assert asyncio.run(meter.flush()) == 1
+
+    (counts,) = redis_client.hashes.values()
+    assert counts["requests"] == 2 and counts["total_tokens"] == 30
+    assert meter.stats()["flush_errors"] == 1
+
+
+def test_without_redis_only_worker_totals_are_kept():
+    meter = UsageMeter(use_redis=False)
+    meter.record("wallet-a", parse_usage({"prompt_tokens": 10, "completion_tokens": 5}))
+
+    assert meter.stats()["total_tokens"] == 15
+    assert meter.stats()["pending_users"] == 0
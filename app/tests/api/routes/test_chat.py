@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 
@@ -143,4 +144,122 @@ def test_sse_chat(client: TestClient, get_access_token) -> None:
     
     # Validation
     assert event_count > 0, "No events received"
-    assert received_done, "Did not receive completion marker"
\ No newline at end of file
+    assert received_done, "Did not receive completion marker"
+
+# Test chat statistics endpoint
+def test_chat_stats(client: TestClient, get_access_token) -> None:
+    response = client.get(
+        url=f"{settings.BASE_URL}/chat/stats",
+        headers={"Content-Type": "application/json",
+                 "Authorization": f"Bearer {get_access_token}"},
+    )
+    assert response.status_code == 200
+    assert {"started", "completed", "aborted", "tokens_saved_estimate"} <= response.json()["streams"].keys()
+    assert "overlap_saved_avg_ms" in response.json()["stages"]
+
+# Test server-side conversations, the client only sends the new turn
+def test_conversation_mode(client: TestClient, get_access_token, monkeypatch) -> None:
+    from app.api.routes import chat
+    received = []
+
+    async def fake_stream(messages, temperature, max_new_tokens, **kwargs):
+        received.append([message.content for message in messages])
+        yield b'data: {"choices":[{"delta":{"content":"Hello"}}]}\n\n'
+        yield b'data: {"choices":[{"delta":{"content":" there"}}]}\n\n'
+        yield b"data: [DONE]\n\n"
+
+    monkeypatch.setattr(chat.aimo, "get_response_stream", fake_stream)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {get_access_token}"}
+    for text in ("first", "second"):
+        response = client.post(
+            url=f"{settings.BASE_URL}/chat/completions",
+            json={"messages": [{"role": "user", "content": text}], "stream": True, "conversation_id": "conv-1"},
+            headers=headers,
+        )
+        assert response.status_code == 200
+        response.read()
+
+    assert received == [["first"], ["first", "Hello there", "second"]]
+
+    response = client.post(
+        url=f"{settings.BASE_URL}/chat/completions",
+        json={"messages": [{"role": "user", "content": "hi"}], "conversation_id": "not a valid id!"},
+        headers=headers,
+    )
+    assert response.status_code == 422
+
+
+def test_idempotency_key_deduplicates_retries(client: TestClient, get_access_token, monkeypatch) -> None:
+    from app.api.routes import chat
+    from app.ai.response_cache import collect_completion
+    calls = []
+
+    async def fake_stream(messages, temperature, max_new_tokens, **kwargs):
+        calls.append(1)
+        yield b'data: {"choices":[{"delta":{"content":"Hello"}}]}\n\n'
+        yield b'data: {"choices":[{"delta":{"content":" there"}}]}\n\n'
+        yield b"data: [DONE]\n\n"
+
+    monkeypatch.setattr(chat.aimo, "get_response_stream", fake_stream)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {get_access_token}",
+               settings.CHAT_IDEMPOTENCY_HEADER: "retry-route-1"}
+    body = {"messages": [{"role": "user", "content": "hi"}], "stream": True}
+    replies = []
+    for _ in range(2):
+        response = client.post(url=f"{settings.BASE_URL}/chat/completions", json=body, headers=headers)
+        assert response.status_code == 200
+        replies.append(collect_completion([response.read()])[0])
+
+    assert len(calls) == 1
+    assert replies == ["Hello there", "Hello there"]
+
+    # The same key with a different request is rejected
+    response = client.post(url=f"{settings.BASE_URL}/chat/completions",
+                           json={**body, "messages": [{"role": "user", "content": "bye"}]}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_exhausted_deadline_is_rejected(client: TestClient, get_access_token) -> None:
+    response = client.post(
+        url=f"{settings.BASE_URL}/chat/completions",
+        json={"messages": [{"role": "user", "content": "hi"}]},
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {get_access_token}",
+                 settings.REQUEST_DEADLINE_HEADER: "0.000001"},
+    )
+    assert response.status_code == 504
+
+
+def test_prepare_draft_turn(client: TestClient, get_access_token, monkeypatch) -> None:
+    from app.api.routes import chat
+
+    async def predict_async(user_input, threshold=0.5):
+        return ["curiosity"]
+
+    monkeypatch.setattr(chat.aimo.emotion_batcher, "predict_async", predict_async)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {get_access_token}"}
+    message_hash = hashlib.sha256("what is a prepared turn?".encode("utf-8")).hexdigest()
+    response = client.post(
+        url=f"{settings.BASE_URL}/chat/prepare",
+        json={"messages": [{"role": "user", "content": "what is a prepared turn?"}], "message_hash": message_hash},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["message_hash"] == message_hash
+    assert response.json()["emotions"] == ["curiosity"]
+
+    response = client.post(
+        url=f"{settings.BASE_URL}/chat/prepare",
+        json={"messages": [{"role": "user", "content": "edited draft"}], "message_hash": message_hash},
+        headers=headers,
+    )
+    assert response.status_code == 422
+
+
+# Test browser preflight of the chat endpoint
+def test_preflight_allows_the_chat_headers(client: TestClient) -> None:
+    response = client.options(f"{settings.BASE_URL}/chat/completions")
+
+    assert response.status_code == 200
+    allowed = [header.strip() for header in response.headers["access-control-allow-headers"].split(",")]
+    assert settings.REQUEST_DEADLINE_HEADER in allowed
+    assert settings.CHAT_RESPONSE_CACHE_HEADER in allowed
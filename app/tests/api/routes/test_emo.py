@@ -21,4 +21,56 @@ def test_analyze_emotion(client: TestClient, get_access_token):
     assert "emotions" in result
     assert isinstance(result["emotions"], list)
     # Verify that it contains expected emotion for happy message
-    assert any(emotion in ["happiness", "joy"] for emotion in result["emotions"])
\ No newline at end of file
+    assert any(emotion in ["happiness", "joy"] for emotion in result["emotions"])
+
+# Test emotion statistics endpoint
+def test_emotion_stats(client: TestClient, get_access_token):
+    """Test that batching statistics are reported"""
+    response = client.get(
+        url=f"{settings.BASE_URL}/emotion/stats",
+        headers={"Content-Type": "application/json",
+                 "Authorization": f"Bearer {get_access_token}"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert "batcher" in result
+    assert {"queue_depth", "batches", "avg_batch_size"} <= result["batcher"].keys()
+    assert result["pid"] > 0
+    assert "memory" in result
+
+
+# Test batch emotion analysis endpoint
+def test_analyze_emotion_batch(client: TestClient, get_access_token):
+    """Test that every message gets its own result, in request order"""
+    messages = ["I am feeling very happy today!", "hi", "I am so angry at you, what is wrong with the world"]
+    response = client.post(
+        url=f"{settings.BASE_URL}/emotion/analyze-batch",
+        json={"messages": messages},
+        headers={"Content-Type": "application/json",
+                 "Authorization": f"Bearer {get_access_token}"},
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == len(messages)
+    assert all(isinstance(result["emotions"], list) for result in results)
+
+    # The batch result matches the single-message endpoint
+    single = client.post(
+        url=f"{settings.BASE_URL}/emotion/analyze",
+        json={"message": messages[0]},
+        headers={"Content-Type": "application/json",
+                 "Authorization": f"Bearer {get_access_token}"},
+    )
+    assert single.json()["emotions"] == results[0]["emotions"]
+
+
+# Test batch emotion analysis with an empty message
+def test_analyze_emotion_batch_rejects_empty_message(client: TestClient, get_access_token):
+    """Test that empty messages are rejected"""
+    response = client.post(
+        url=f"{settings.BASE_URL}/emotion/analyze-batch",
+        json={"messages": ["hello", "   "]},
+        headers={"Content-Type": "application/json",
+                 "Authorization": f"Bearer {get_access_token}"},
+    )
+    assert response.status_code == 422
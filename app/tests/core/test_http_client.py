@@ -0,0 +1,79 @@
+import asyncio
+
+from aiohttp import web
+
+from app.core.http_client import close_http_session, get_http_session, warm_up_http_session
+
+
+async def start_upstream():
+    """Local stand-in for the LLM API that counts the connections it accepts"""
+    peers = set()
+
+    async def handler(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions", peers
+
+
+def test_session_is_shared_and_closed():
+    """Every caller on the loop gets the same session until it is closed"""
+    async def main():
+        session = get_http_session()
+        assert get_http_session() is session
+        await close_http_session()
+        assert session.closed
+        reopened = get_http_session()
+        assert reopened is not session
+        await close_http_session()
+
+    asyncio.run(main())
+
+
+def test_session_belongs_to_its_loop():
+    """A new event loop gets its own session"""
+    async def main():
+        return get_http_session()
+
+    first = asyncio.run(main())
+    second = asyncio.run(main())
+    assert first is not second
+    asyncio.run(close_http_session())
+
+
+def test_warm_up_connections_are_reused():
+    """Requests after the warm-up reuse the pooled keep-alive connections"""
+    async def main():
+        runner, url, peers = await start_upstream()
+        try:
+            assert await warm_up_http_session(url, connections=2) == 2
+            warmed_up = set(peers)
+            for _ in range(5):
+                async with get_http_session().post(url, json={}) as response:
+                    assert await response.text() == "ok"
+            return warmed_up, peers
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    warmed_up, peers = asyncio.run(main())
+    assert len(warmed_up) == 2
+    assert peers == warmed_up
+
+
+def test_warm_up_failures_are_tolerated():
+    """An unreachable upstream does not fail the startup"""
+    async def main():
+        try:
+            return await warm_up_http_session("http://127.0.0.1:9/", connections=1)
+        finally:
+            await close_http_session()
+
+    assert asyncio.run(main()) == 0
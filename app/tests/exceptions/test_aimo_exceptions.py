@@ -1,5 +1,5 @@
 import pytest
-from app.exceptions.aimo_exceptions import AIMOException
+from app.exceptions.aimo_exceptions import AIMOException, UpstreamException
 from app.exceptions.server_exceptions import ServerException
 
 def test_aimo_exception_default_init():
@@ -18,3 +18,17 @@ def test_aimo_exception_custom_message():
     assert exc.message == custom_message
     assert exc.status_code == 500
     assert isinstance(exc, ServerException)
+
+def test_aimo_exception_custom_status_code():
+    """Test AIMOException initialization with a custom status code"""
+    exc = AIMOException("The LLM API is temporarily unavailable, please retry later", 503)
+    
+    assert exc.status_code == 503
+
+def test_upstream_exception_overloaded():
+    """Test which upstream failures signal an overloaded endpoint"""
+    assert UpstreamException().overloaded
+    assert UpstreamException("API Error: 429", 429).overloaded
+    assert UpstreamException("API Error: 503", 503).overloaded
+    assert not UpstreamException("API Error: 400", 400).overloaded
+    assert isinstance(UpstreamException(), AIMOException)
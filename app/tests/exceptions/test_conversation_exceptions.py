@@ -0,0 +1,20 @@
+import pytest
+from app.exceptions.conversation_exceptions import ConversationException
+from app.exceptions.server_exceptions import ServerException
+
+def test_conversation_exception_default_init():
+    """Test ConversationException initialization with default parameters"""
+    exc = ConversationException()
+    
+    assert exc.message == "Conversation history is unavailable"
+    assert exc.status_code == 503
+    assert isinstance(exc, ServerException)
+
+def test_conversation_exception_custom_init():
+    """Test ConversationException initialization with custom parameters"""
+    message = "Conversations require a user token"
+    exc = ConversationException(message, 401)
+    
+    assert exc.message == message
+    assert exc.status_code == 401
+    assert isinstance(exc, ServerException)
@@ -0,0 +1,20 @@
+import pytest
+from app.exceptions.deadline_exceptions import DeadlineException
+from app.exceptions.server_exceptions import ServerException
+
+def test_deadline_exception_default_init():
+    """Test DeadlineException initialization with default parameters"""
+    exc = DeadlineException()
+    
+    assert exc.message == "Request deadline exceeded"
+    assert exc.status_code == 504
+    assert isinstance(exc, ServerException)
+
+def test_deadline_exception_custom_init():
+    """Test DeadlineException initialization with custom parameters"""
+    message = "Request deadline exceeded while waiting for the LLM API"
+    exc = DeadlineException(message)
+    
+    assert exc.message == message
+    assert exc.status_code == 504
+    assert isinstance(exc, ServerException)
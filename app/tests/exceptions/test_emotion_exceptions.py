@@ -0,0 +1,20 @@
+import pytest
+from app.exceptions.emotion_exceptions import EmotionException
+from app.exceptions.server_exceptions import ServerException
+
+def test_emotion_exception_default_init():
+    """Test EmotionException initialization with default parameters"""
+    exc = EmotionException()
+    
+    assert exc.message == "Emotion inference is overloaded"
+    assert exc.status_code == 503
+    assert isinstance(exc, ServerException)
+
+def test_emotion_exception_custom_init():
+    """Test EmotionException initialization with custom parameters"""
+    message = "Emotion inference failed"
+    exc = EmotionException(message, 500)
+    
+    assert exc.message == message
+    assert exc.status_code == 500
+    assert isinstance(exc, ServerException)
@@ -0,0 +1,20 @@
+import pytest
+from app.exceptions.idempotency_exceptions import IdempotencyException
+from app.exceptions.server_exceptions import ServerException
+
+def test_idempotency_exception_default_init():
+    """Test IdempotencyException initialization with default parameters"""
+    exc = IdempotencyException()
+    
+    assert exc.message == "A request with this Idempotency-Key is still in progress"
+    assert exc.status_code == 409
+    assert isinstance(exc, ServerException)
+
+def test_idempotency_exception_custom_init():
+    """Test IdempotencyException initialization with custom parameters"""
+    message = "The Idempotency-Key was used for a different request"
+    exc = IdempotencyException(message, 422)
+    
+    assert exc.message == message
+    assert exc.status_code == 422
+    assert isinstance(exc, ServerException)
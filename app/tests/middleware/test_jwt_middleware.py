@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+from app.middleware.jwt_middleware import JWTMiddleware
+
+
+class FakeSession:
+    def __init__(self, dialect: str):
+        self.dialect = dialect
+        self.statements = []
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=SimpleNamespace(name=self.dialect))
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+
+def test_account_lookups_get_a_statement_timeout():
+    """On PostgreSQL a lookup past the deadline is cancelled by the database, freeing its thread"""
+    session = FakeSession("postgresql")
+    JWTMiddleware._limit_statements(session, 1.5)
+
+    assert session.statements == ["SET LOCAL statement_timeout = 1500"]
+
+
+def test_statement_timeout_is_skipped_without_deadline_or_postgresql():
+    for dialect, timeout in (("postgresql", None), ("sqlite", 1.5)):
+        session = FakeSession(dialect)
+        JWTMiddleware._limit_statements(session, timeout)
+        assert session.statements == []
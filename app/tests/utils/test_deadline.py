@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.exceptions.deadline_exceptions import DeadlineException
+from app.utils.deadline import (bounded_timeout, check_deadline, remaining, request_budget, reset_deadline,
+                                set_deadline, within_deadline)
+
+
+def test_request_budget(monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_DEFAULT", 60.0)
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_MAX", 120.0)
+    assert request_budget(None) == 60.0
+    assert request_budget("2.5") == 2.5
+    assert request_budget("3600") == 120.0
+    assert request_budget("soon") == 60.0
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_DEFAULT", None)
+    assert request_budget(None) is None
+
+
+def test_budget_of_the_current_request():
+    assert remaining() is None
+    assert bounded_timeout(5.0) == 5.0
+
+    token = set_deadline(10.0)
+    try:
+        assert 9.0 < remaining() <= 10.0
+        assert bounded_timeout(5.0) == 5.0
+        assert 7.0 < bounded_timeout(reserve=2.0) <= 8.0
+        check_deadline("the test")
+    finally:
+        reset_deadline(token)
+    assert remaining() is None
+
+
+def test_expired_deadline_fails_fast():
+    token = set_deadline(0.0)
+    try:
+        with pytest.raises(DeadlineException):
+            check_deadline("the test")
+    finally:
+        reset_deadline(token)
+
+
+def test_slow_stage_is_cancelled():
+    cancelled = []
+
+    async def slow_stage():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        token = set_deadline(0.05)
+        try:
+            await within_deadline(slow_stage(), "the slow stage")
+        finally:
+            reset_deadline(token)
+
+    with pytest.raises(DeadlineException) as error:
+        asyncio.run(run())
+    assert error.value.message == "Request deadline exceeded during the slow stage"
+    assert cancelled == [True]
@@ -0,0 +1,52 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.utils.memory_utils import child_pids, memory_report, parse_smaps, process_memory
+
+SMAPS_ROLLUP = """55d0c0a00000-7ffd2b9fe000 ---p 00000000 00:00 0                          [rollup]
+Rss:              204800 kB
+Pss:               71680 kB
+Shared_Clean:     184320 kB
+Shared_Dirty:       2048 kB
+Private_Clean:      1024 kB
+Private_Dirty:     17408 kB
+Swap:                  0 kB
+"""
+
+requires_proc = pytest.mark.skipif(not Path("/proc/self/smaps").exists(), reason="requires /proc")
+
+
+def test_parse_smaps():
+    """The kB counters are summed by name"""
+    counters = parse_smaps(SMAPS_ROLLUP + "Rss: 100 kB\n")
+
+    assert counters["Rss"] == 204900
+    assert counters["Private_Dirty"] == 17408
+    assert "55d0c0a00000-7ffd2b9fe000" not in counters
+
+
+def test_process_memory_from_rollup(monkeypatch, tmp_path):
+    """USS counts the private pages, shared counts the pages mapped by other processes"""
+    (tmp_path / "42").mkdir()
+    (tmp_path / "42" / "smaps_rollup").write_text(SMAPS_ROLLUP)
+    monkeypatch.setattr("app.utils.memory_utils._PROC", tmp_path)
+
+    assert process_memory(42) == {"rss_mb": 200.0, "pss_mb": 70.0, "uss_mb": 18.0, "shared_mb": 182.0}
+    assert process_memory(43) == {}
+
+
+@requires_proc
+def test_memory_report_of_forked_child():
+    """A forked child is reported as a worker of its parent"""
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)  # Stays a child (zombie) until it is reaped below
+    try:
+        assert pid in child_pids(os.getpid())
+        rows = memory_report(os.getpid())
+        assert rows[0]["role"] == "master"
+        assert rows[0]["uss_mb"] > 0
+    finally:
+        os.waitpid(pid, 0)
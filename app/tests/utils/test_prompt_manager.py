@@ -49,6 +49,15 @@ def mock_redis():
         list_store[key].append(value)
         return len(list_store[key])
     
+    def mock_incr(key):
+        data_store[key] = str(int(data_store.get(key) or 0) + 1)
+        return int(data_store[key])
+    
+    def mock_eval(script, numkeys, current_key, version_key, prompt_json):
+        # STORE_PROMPT_SCRIPT: take the next version and store the prompt in one step
+        data_store[current_key] = prompt_json
+        return mock_incr(version_key)
+    
     # Configure mock methods
     mock_redis.exists.side_effect = mock_exists
     mock_redis.get.side_effect = mock_get
@@ -56,6 +65,8 @@ def mock_redis():
     mock_redis.llen.side_effect = mock_llen
     mock_redis.lrange.side_effect = mock_lrange
     mock_redis.rpush.side_effect = mock_rpush
+    mock_redis.incr.side_effect = mock_incr
+    mock_redis.eval.side_effect = mock_eval
     
     return mock_redis
 
@@ -144,8 +155,8 @@ def test_update_prompt(prompt_manager, mock_redis):
     # Verify update was successful
     assert result is True
     
-    # Verify Redis set method was called
-    mock_redis.set.assert_called()
+    # Verify the prompt was stored together with its version
+    mock_redis.eval.assert_called()
 
 def test_get_history(prompt_manager, mock_redis):
     """Test retrieving the prompt history"""
@@ -194,8 +205,8 @@ def test_update_all_sections(prompt_manager, mock_redis):
     # Verify update was successful
     assert result is True
     
-    # Verify Redis set method was called
-    mock_redis.set.assert_called()
+    # Verify the prompt was stored together with its version
+    mock_redis.eval.assert_called()
     
     # Verify all sections were updated
     updated_prompt = prompt_manager.get_prompt()
@@ -271,7 +282,7 @@ def test_load_or_initialize_new_prompt(mock_redis):
     assert "overall_style" in manager.current_prompt
     
     # Verify that _save_current_prompt was called to save the default prompt to Redis
-    mock_redis.set.assert_called_once()
+    mock_redis.eval.assert_called_once()
     
     # Clean up environment variable
     os.environ.pop("TESTING", None)
@@ -372,4 +383,78 @@ def test_load_or_initialize_none_value():
         mock_redis.get.assert_called()
         
         # Clean up environment variable
-        os.environ.pop("TESTING", None)
\ No newline at end of file
+        os.environ.pop("TESTING", None)
+
+def test_update_swaps_versioned_snapshot(prompt_manager, mock_redis):
+    """Test that an update installs a new immutable snapshot and announces its version"""
+    old_snapshot = prompt_manager.snapshot
+    
+    prompt_manager.update_prompt("rules", "New rules", "Test User", "Testing snapshot")
+    
+    snapshot = prompt_manager.snapshot
+    assert snapshot is not old_snapshot
+    assert snapshot.version > old_snapshot.version
+    assert snapshot.sections["rules"] == "New rules"
+    assert snapshot.compiled == prompt_manager.get_prompt()["complete_prompt"]
+    # The old snapshot is unchanged, requests still using it see a consistent prompt
+    assert old_snapshot.sections["rules"] != "New rules"
+    with pytest.raises(TypeError):
+        snapshot.sections["rules"] = "Changed in place"
+    mock_redis.publish.assert_called_with(prompt_manager.channel, str(snapshot.version))
+
+def test_reload_applies_update_of_other_worker(mock_redis):
+    """Test that a worker reloads the prompt updated by another worker sharing the Redis"""
+    os.environ["TESTING"] = "True"
+    worker_a = PromptManager(redis_client=mock_redis)
+    worker_b = PromptManager(redis_client=mock_redis)
+    
+    worker_a.update_prompt("guidelines", "Shared guidelines", "Test User", "Testing reload")
+    
+    assert worker_b.reload() is True
+    assert worker_b.snapshot.sections["guidelines"] == "Shared guidelines"
+    assert worker_b.snapshot.version == worker_a.snapshot.version
+    # Nothing new to apply
+    assert worker_b.reload() is False
+    
+    os.environ.pop("TESTING", None)
+
+
+def test_listener_reloads_on_announcement(mock_redis):
+    """Test that the listener reloads the prompt when an update is announced"""
+    os.environ["TESTING"] = "True"
+    worker_a = PromptManager(redis_client=mock_redis)
+    worker_b = PromptManager(redis_client=mock_redis)
+    pubsub = mock_redis.pubsub.return_value
+    
+    def announce_then_stop(timeout):
+        if pubsub.get_message.call_count == 1:
+            worker_a.update_prompt("rules", "Announced rules", "Test User", "Testing listener")
+            return {"type": "message", "data": str(worker_a.snapshot.version)}
+        worker_b._stop_listener.set()
+        return None
+    
+    pubsub.get_message.side_effect = announce_then_stop
+    worker_b._listen()
+    
+    pubsub.subscribe.assert_called_with(worker_b.channel)
+    assert worker_b.snapshot.sections["rules"] == "Announced rules"
+    pubsub.close.assert_called()
+    
+    os.environ.pop("TESTING", None)
+
+
+def test_concurrent_updates_agree_on_the_version(mock_redis):
+    """Test that the prompt stored under the highest version is the one every worker ends up with"""
+    os.environ["TESTING"] = "True"
+    worker_a = PromptManager(redis_client=mock_redis)
+    worker_b = PromptManager(redis_client=mock_redis)
+    
+    worker_a.update_prompt("rules", "Rules of A", "Test User", "Testing concurrency")
+    worker_b.update_prompt("rules", "Rules of B", "Test User", "Testing concurrency")
+    worker_a.reload()
+    
+    assert worker_a.snapshot.version == worker_b.snapshot.version
+    assert worker_a.snapshot.sections["rules"] == worker_b.snapshot.sections["rules"] == "Rules of B"
+    assert json.loads(mock_redis.get("current_prompt"))["rules"] == "Rules of B"
+    
+    os.environ.pop("TESTING", None)
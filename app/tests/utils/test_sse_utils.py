@@ -0,0 +1,54 @@
+import asyncio
+
+from app.utils.sse_utils import SSEFrameParser, encode_data_frame, iter_sse_payloads
+
+STREAM = (b': keep-alive\n\n'
+          b'data: {"choices":[{"delta":{"content":"Hel"}}]}\n\n'
+          b'event: message\r\nid: 2\r\ndata: {"choices":[{"delta":{"content":"lo"}}]}\r\n\r\n'
+          b'data: first line\ndata: second line\n\n'
+          b'data: [DONE]\n\n')
+PAYLOADS = [b'{"choices":[{"delta":{"content":"Hel"}}]}',
+            b'{"choices":[{"delta":{"content":"lo"}}]}',
+            b'first line\nsecond line',
+            b'[DONE]']
+
+
+def test_parse_whole_stream():
+    """Comments and non-data fields are skipped, CRLF and multi-line data are handled"""
+    assert SSEFrameParser().feed(STREAM) == PAYLOADS
+
+
+def test_parse_byte_by_byte():
+    """Chunks may split lines and events anywhere"""
+    parser = SSEFrameParser()
+    payloads = []
+    for i in range(len(STREAM)):
+        payloads.extend(parser.feed(STREAM[i:i + 1]))
+    assert payloads == PAYLOADS
+
+
+def test_close_flushes_unterminated_event():
+    """An event cut off before its blank line is still delivered at the end of the stream"""
+    parser = SSEFrameParser()
+    assert parser.feed(b'data: {"a": 1}') == []
+    assert parser.close() == [b'{"a": 1}']
+    assert parser.close() == []
+
+
+def test_encode_data_frame_roundtrip():
+    """Encoded frames parse back to the same payloads"""
+    frames = b"".join(encode_data_frame(payload) for payload in PAYLOADS)
+    assert SSEFrameParser().feed(frames) == PAYLOADS
+
+
+def test_iter_sse_payloads():
+    """Payloads are read from an aiohttp stream"""
+    class FakeContent:
+        async def iter_any(self):
+            for i in range(0, len(STREAM), 7):
+                yield STREAM[i:i + 7]
+
+    async def main():
+        return [payload async for payload in iter_sse_payloads(FakeContent())]
+
+    assert asyncio.run(main()) == PAYLOADS
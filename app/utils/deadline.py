@@ -0,0 +1,108 @@
+import asyncio
+import time
+from contextvars import ContextVar, Token
+from typing import Awaitable, Optional, TypeVar
+
+from app.core.config import settings
+from app.exceptions.deadline_exceptions import DeadlineException
+
+"""
+Description:
+    End-to-end request deadlines.
+
+    JWTMiddleware sets the deadline of every request, REQUEST_DEADLINE_DEFAULT seconds or the
+    (capped) time budget the client sent in the REQUEST_DEADLINE_HEADER header. It is kept in
+    a context variable, so it follows the request into the tasks it creates. Every stage of
+    the chat pipeline bounds its work by the remaining budget: the account lookups of the
+    middleware, emotion inference (skipped when the budget runs low, the reply is more useful
+    without emotion tags than not at all) and the upstream LLM request until its first token.
+    Between the stages, a request whose deadline already passed fails right away.
+"""
+
+T = TypeVar("T")
+
+# Monotonic time at which the current request must be answered, None without a deadline
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def request_budget(header_value: Optional[str]) -> Optional[float]:
+    """
+    Time budget of a request in seconds
+
+    :param header_value: Value of the deadline header, seconds as a number (None if not sent)
+    :return: The budget, capped at REQUEST_DEADLINE_MAX, None without a deadline
+    """
+    budget = settings.REQUEST_DEADLINE_DEFAULT
+    if header_value:
+        try:
+            budget = float(header_value)
+        except ValueError:
+            pass
+    if budget is None or budget <= 0:
+        return None
+    return min(budget, settings.REQUEST_DEADLINE_MAX)
+
+
+def set_deadline(budget: Optional[float]) -> Token:
+    """Start the deadline of the current request, returns the token to reset it with"""
+    return _deadline.set(time.monotonic() + budget if budget is not None else None)
+
+
+def reset_deadline(token: Token):
+    """Restore the deadline that was set before set_deadline"""
+    _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    """Monotonic time at which the current request must be answered, None without a deadline"""
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the deadline of the current request, None without a deadline"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def bounded_timeout(timeout: Optional[float] = None, reserve: float = 0.0) -> Optional[float]:
+    """
+    A timeout that ends before the deadline
+
+    :param timeout: The timeout of the stage on its own, None for none
+    :param reserve: Seconds of the budget kept for the stages after this one
+    :return: The smaller of the timeout and the remaining budget, None if neither is set
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    left -= reserve
+    return left if timeout is None else min(timeout, left)
+
+
+def check_deadline(stage: str):
+    """
+    Fail if the deadline of the current request has passed
+
+    :param stage: The stage about to start, for the error message
+    :raises DeadlineException: If no time is left
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineException(f"Request deadline exceeded before {stage}")
+
+
+async def within_deadline(awaitable: Awaitable[T], stage: str) -> T:
+    """
+    Await a stage, cancelling it when the deadline of the current request passes
+
+    :param awaitable: The stage
+    :param stage: Name of the stage, for the error message
+    :raises DeadlineException: If the deadline passed first
+    """
+    timeout = remaining()
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(timeout, 0.0))
+    except asyncio.TimeoutError:
+        raise DeadlineException(f"Request deadline exceeded during {stage}")
@@ -31,4 +31,11 @@ class JWTUtils:
         except jwt.ExpiredSignatureError:
             raise JWTException("Token expired")
         except jwt.InvalidTokenError:
-            raise JWTException("Invalid token")
\ No newline at end of file
+            raise JWTException("Invalid token")
+
+    @staticmethod
+    def get_subject(payload) -> str:
+        """Return the identity a decoded token was issued to (wallet address or invitation code)"""
+        if not payload:
+            return None
+        return payload.get("wallet_address") or payload.get("InvitationCode") or payload.get("sub")
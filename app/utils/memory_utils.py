@@ -0,0 +1,96 @@
+from pathlib import Path
+from typing import Dict, List, Union
+
+"""
+Description:
+    Memory accounting of the server processes, read from /proc (Linux only).
+
+    - rss:    resident memory, pages shared with other processes count in full
+    - pss:    proportional set size, shared pages are divided between the processes mapping them
+    - uss:    unique set size, pages only this process maps (what a new worker really costs)
+    - shared: resident pages also mapped by other processes (e.g. the preloaded model weights)
+"""
+
+_PROC = Path("/proc")
+
+
+def parse_smaps(text: str) -> Dict[str, int]:
+    """
+    Sum the kB counters of a /proc/<pid>/smaps_rollup (or smaps) file
+
+    :param text: Content of the file
+    :return: Counter name to kB, e.g. {"Rss": 1024, "Pss": 512, ...}
+    """
+    totals: Dict[str, int] = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0].endswith(":") and parts[2] == "kB":
+            name = parts[0][:-1]
+            totals[name] = totals.get(name, 0) + int(parts[1])
+    return totals
+
+
+def process_memory(pid: Union[int, str] = "self") -> Dict[str, float]:
+    """
+    Get the RSS, PSS, USS and shared memory of a process
+
+    :param pid: Process id (defaults to the current process)
+    :return: Memory in MB, empty if /proc is not available
+    """
+    counters = None
+    # smaps_rollup is cheap (Linux 4.14+), smaps has one entry per mapping but the same counters
+    for name in ("smaps_rollup", "smaps"):
+        try:
+            counters = parse_smaps((_PROC / str(pid) / name).read_text())
+            break
+        except OSError:
+            continue
+    if not counters:
+        return {}
+    uss = counters.get("Private_Clean", 0) + counters.get("Private_Dirty", 0)
+    shared = counters.get("Shared_Clean", 0) + counters.get("Shared_Dirty", 0)
+    return {
+        "rss_mb": round(counters.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(counters.get("Pss", 0) / 1024, 1),
+        "uss_mb": round(uss / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+    }
+
+
+def child_pids(pid: int) -> List[int]:
+    """
+    Get the direct children of a process (the workers of a gunicorn master)
+
+    :param pid: Parent process id
+    :return: Child process ids
+    """
+    children = set()
+    try:
+        for task in (_PROC / str(pid) / "task").iterdir():
+            children.update(int(child) for child in (task / "children").read_text().split())
+        return sorted(children)
+    except OSError:
+        pass
+    # Kernels without CONFIG_PROC_CHILDREN: scan every process for its parent id
+    for stat in _PROC.glob("[0-9]*/stat"):
+        try:
+            # The command name is in parentheses and may contain spaces, the ppid follows the state
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.add(int(stat.parent.name))
+    return sorted(children)
+
+
+def memory_report(master_pid: int) -> List[Dict[str, Union[int, float, str]]]:
+    """
+    Memory of a gunicorn master and each of its workers
+
+    :param master_pid: Process id of the gunicorn master
+    :return: One row per process (master first) with its pid, role and memory in MB
+    """
+    rows = [{"pid": master_pid, "role": "master", **process_memory(master_pid)}]
+    for pid in child_pids(master_pid):
+        rows.append({"pid": pid, "role": "worker", **process_memory(pid)})
+    return rows
@@ -1,11 +1,48 @@
 import json
+import logging
 import os
+import threading
 import redis
-from typing import Dict, List, Optional
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
 from datetime import datetime
 
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+
+PROMPT_SECTIONS = ("self_cognition", "guidelines", "rules", "overall_style")
+
+# Stores a prompt and takes its version number in one step, so the prompt stored under the
+# highest version is always the last one written, whatever the order of concurrent updates
+STORE_PROMPT_SCRIPT = """
+local version = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], ARGV[1])
+return version
+"""
+
+
+@dataclass(frozen=True)
+class PromptSnapshot:
+    """An immutable version of the system prompt, replaced as a whole on every update"""
+    version: int
+    sections: Mapping[str, str]
+    compiled: str  # The complete prompt sent to the LLM
+
+    @classmethod
+    def build(cls, version: int, prompt: Dict[str, str]) -> "PromptSnapshot":
+        return cls(version, MappingProxyType(dict(prompt)), "".join(prompt[section] for section in PROMPT_SECTIONS))
+
+
 class PromptManager:
-    """System prompt manager responsible for loading, saving, and managing system prompt history using Redis"""
+    """System prompt manager responsible for loading, saving, and managing system prompt history using Redis
+
+    The current prompt is held as an immutable PromptSnapshot. An update swaps in a new snapshot
+    with a single assignment, so a request reads either the old or the new prompt, never a mix.
+    Updates are announced on a Redis pub/sub channel, the listener thread of every other worker
+    then reloads the prompt from Redis.
+    """
     
     def __init__(self, redis_host: str = "localhost", redis_port: int = 6379, 
                  redis_db: int = 0, redis_password: str = None, prefix: str = "aimo:prompts:",
@@ -45,11 +82,19 @@ class PromptManager:
             self.redis_client.llen.return_value = 0
             self.redis_client.lrange.return_value = []
             self.redis_client.rpush.return_value = True
+            self.redis_client.eval.return_value = 1
         
         # Define Redis keys
         self.prefix = prefix
         self.current_key = f"{prefix}current"
         self.history_key = f"{prefix}history"
+        self.version_key = f"{prefix}version"
+        self.channel = f"{prefix}updates"
+
+        self.snapshot = PromptSnapshot.build(0, self._get_default_prompt())
+        self._snapshot_lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._stop_listener = threading.Event()
         
         # Keys compatible with testing
         self.test_current_key = "current_prompt"
@@ -68,19 +113,10 @@ class PromptManager:
         
         if exists_result:
             # Load the current prompt from Redis
-            prompt_json = self.redis_client.get(current_key)
-            if prompt_json:
-                try:
-                    self.current_prompt = json.loads(prompt_json)
-                except (json.JSONDecodeError, TypeError):
-                    # Use default prompt if parsing fails
-                    self.current_prompt = self._get_default_prompt()
-            else:
-                self.current_prompt = self._get_default_prompt()
+            prompt = self._read_current_prompt(current_key)
+            self._swap_snapshot(self._read_version(), prompt or self._get_default_prompt())
         else:
-            # Initialize default prompt
-            self.current_prompt = self._get_default_prompt()
-            # Save the initial prompt to Redis
+            # Initialize default prompt and save it to Redis
             self._save_current_prompt()
         
         # Load history
@@ -106,6 +142,104 @@ class PromptManager:
                 "Initial system prompt"
             )
     
+    @property
+    def current_prompt(self) -> Mapping[str, str]:
+        """The sections of the current prompt (read-only)"""
+        return self.snapshot.sections
+
+    def _read_current_prompt(self, current_key: str) -> Optional[Dict[str, str]]:
+        """Read the current prompt from Redis, None if it is missing or invalid"""
+        prompt_json = self.redis_client.get(current_key)
+        if not prompt_json:
+            return None
+        try:
+            prompt = json.loads(prompt_json)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        if not isinstance(prompt, dict) or not all(section in prompt for section in PROMPT_SECTIONS):
+            return None
+        return prompt
+
+    def _read_version(self) -> int:
+        """Read the version of the prompt stored in Redis"""
+        try:
+            return int(self.redis_client.get(self.version_key) or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def _swap_snapshot(self, version: int, prompt: Dict[str, str]) -> bool:
+        """Atomically replace the snapshot, unless it is already at this version or newer"""
+        with self._snapshot_lock:
+            if self.snapshot.version and version <= self.snapshot.version:
+                return False
+            self.snapshot = PromptSnapshot.build(version, prompt)
+            return True
+
+    def _publish(self, prompt: Dict[str, str], current_key: str):
+        """Store a new prompt version, install it in this worker and announce it to the other workers"""
+        stored = self.redis_client.eval(STORE_PROMPT_SCRIPT, 2, current_key, self.version_key,
+                                        json.dumps(prompt, ensure_ascii=False))
+        version = max(self.snapshot.version + 1, int(stored))
+        self._swap_snapshot(version, prompt)
+        try:
+            self.redis_client.publish(self.channel, str(version))
+        except (RedisError, OSError) as e:
+            # The other workers pick the update up when their listener reconnects
+            logging.warning(f"Failed to announce system prompt version {version}: {e}")
+
+    def reload(self) -> bool:
+        """Reload the current prompt from Redis if it changed
+
+        Returns:
+            Whether a newer prompt was installed
+        """
+        current_key = self.test_current_key if self.test_mode else self.current_key
+        version = self._read_version()
+        if version <= self.snapshot.version:
+            return False
+        prompt = self._read_current_prompt(current_key)
+        if prompt is None:
+            return False
+        installed = self._swap_snapshot(version, prompt)
+        if installed:
+            logging.info(f"Reloaded system prompt version {version}")
+        return installed
+
+    def start_listener(self):
+        """Start the thread applying the prompt updates made by other workers (once per process, after forking)"""
+        if self._listener is not None or not (self.test_mode is None or self.test_mode == "False"):
+            return
+        self._stop_listener.clear()
+        self._listener = threading.Thread(target=self._listen, name="prompt-listener", daemon=True)
+        self._listener.start()
+
+    def stop_listener(self):
+        """Stop the listener thread"""
+        self._stop_listener.set()
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+            self._listener = None
+
+    def _listen(self):
+        """Reload the prompt on every announced update, resubscribing after Redis errors"""
+        while not self._stop_listener.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Catch up with the updates announced while this worker was not subscribed
+                self.reload()
+                while not self._stop_listener.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self.reload()
+            except (RedisError, OSError) as e:
+                logging.warning(f"System prompt listener disconnected: {e}")
+                self._stop_listener.wait(settings.REDIS_RETRY_INTERVAL)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
     def _get_default_prompt(self) -> Dict[str, str]:
         """Return the default prompt configuration"""
         return {
@@ -232,13 +366,13 @@ OVERALL STYLE
 """
             }
     
-    def _save_current_prompt(self):
-        """Save the current prompt to Redis"""
-        prompt_json = json.dumps(self.current_prompt, ensure_ascii=False)
+    def _save_current_prompt(self, prompt: Optional[Dict[str, str]] = None):
+        """Save the current prompt (or a new one) to Redis and install it as the current snapshot"""
+        prompt = dict(self.current_prompt) if prompt is None else prompt
         
         # Use the correct key name - always execute regardless of test mode
         current_key = self.test_current_key if self.test_mode else self.current_key
-        self.redis_client.set(current_key, prompt_json)
+        self._publish(prompt, current_key)
     
     def _add_to_history(self, prompt: Dict[str, str], modified_by: str, purpose: str):
         """Add an entry to the history in Redis"""
@@ -267,20 +401,16 @@ OVERALL STYLE
         """
         result = {}
         
+        snapshot = self.snapshot
         if not section or section.lower() == "all":
-            result = self.current_prompt.copy()
+            result = dict(snapshot.sections)
             # Add complete prompt
-            result["complete_prompt"] = (
-                result["self_cognition"] +
-                result["guidelines"] +
-                result["rules"] +
-                result["overall_style"]
-            )
+            result["complete_prompt"] = snapshot.compiled
             return result
         
         section_key = section.lower().replace("-", "_").replace(" ", "_")
-        if section_key in self.current_prompt:
-            return {section_key: self.current_prompt[section_key]}
+        if section_key in snapshot.sections:
+            return {section_key: snapshot.sections[section_key]}
         
         raise ValueError(f"Invalid section: {section}")
     
@@ -325,8 +455,7 @@ OVERALL STYLE
         self._add_to_history(new_prompt, modified_by, purpose)
         
         # Update the current prompt
-        self.current_prompt = new_prompt
-        self._save_current_prompt()
+        self._save_current_prompt(new_prompt)
         
         return True
     
@@ -358,8 +487,7 @@ OVERALL STYLE
         self._add_to_history(new_prompt, modified_by, purpose)
         
         # Update the current prompt
-        self.current_prompt = new_prompt
-        self._save_current_prompt()
+        self._save_current_prompt(new_prompt)
         
         return True
     
@@ -405,4 +533,19 @@ OVERALL STYLE
             prompt_data["overall_style"]
         )
         
-        return prompt_data
\ No newline at end of file
+        return prompt_data
+
+
+_prompt_manager: Optional[PromptManager] = None
+_prompt_manager_lock = threading.Lock()
+
+
+def get_prompt_manager() -> PromptManager:
+    """Get the process-wide prompt manager, shared by the chat service and the system prompt API"""
+    global _prompt_manager
+    if _prompt_manager is None:
+        with _prompt_manager_lock:
+            if _prompt_manager is None:
+                _prompt_manager = PromptManager(redis_host=settings.REDIS_HOST or "localhost",
+                                                redis_port=settings.REDIS_PORT)
+    return _prompt_manager
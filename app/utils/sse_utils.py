@@ -0,0 +1,95 @@
+import json
+from typing import AsyncIterator, List, Union
+
+import aiohttp
+
+"""
+Description:
+    Incremental Server-Sent Events parsing for the upstream LLM stream. Payloads are kept as
+    bytes so they can be forwarded to the client without decoding or re-serializing them.
+"""
+
+DONE = b"[DONE]"
+
+
+class SSEFrameParser:
+    """
+    Incremental parser splitting an SSE byte stream into the data payloads of its events.
+
+    Chunks may end anywhere, also in the middle of a line. Lines may end in LF or CRLF,
+    comment lines (": keep-alive") and the event/id/retry fields are skipped, and the data
+    lines of one event are joined with a newline as the SSE specification requires.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        Parse the next chunk of the stream
+
+        :param chunk: Raw bytes as received from upstream
+        :return: The data payloads of the events completed by this chunk
+        """
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()  # Incomplete last line, completed by the next chunk
+        payloads = []
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                # A blank line dispatches the event
+                if self._data:
+                    payloads.append(self._data[0] if len(self._data) == 1 else b"\n".join(self._data))
+                    self._data = []
+            elif line.startswith(b"data:"):
+                value = line[5:]
+                self._data.append(value[1:] if value.startswith(b" ") else value)
+        return payloads
+
+    def close(self) -> List[bytes]:
+        """
+        End of stream, flush an event whose terminating blank line never arrived
+
+        :return: The remaining data payloads
+        """
+        payloads = self.feed(b"\n\n") if (self._buffer or self._data) else []
+        self._buffer = b""
+        return payloads
+
+
+def encode_data_frame(payload: bytes) -> bytes:
+    """Wrap a data payload into a complete SSE frame (one data line per payload line)"""
+    if b"\n" in payload:
+        return b"".join(b"data: " + line + b"\n" for line in payload.split(b"\n")) + b"\n"
+    return b"data: " + payload + b"\n\n"
+
+
+async def iter_sse_payloads(content: aiohttp.StreamReader) -> AsyncIterator[bytes]:
+    """
+    Iterate over the data payloads of an upstream SSE response body
+
+    :param content: The aiohttp response content
+    :return: Async iterator of data payloads, as bytes
+    """
+    parser = SSEFrameParser()
+    async for chunk in content.iter_any():
+        for payload in parser.feed(chunk):
+            yield payload
+    for payload in parser.close():
+        yield payload
+
+
+def delta_content(payload: Union[bytes, str]) -> str:
+    """
+    Text content of an OpenAI chat completion chunk
+
+    :param payload: The data payload of a stream event
+    :return: The delta content, empty for [DONE], errors and chunks without content
+    """
+    try:
+        chunk = json.loads(payload)
+        return chunk["choices"][0]["delta"].get("content") or ""
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return ""
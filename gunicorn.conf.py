@@ -0,0 +1,64 @@
+import gc
+import os
+import sys
+
+"""
+Description:
+    Gunicorn configuration of the production server (see the Dockerfile).
+
+    With preload_app the master imports the application, and with it the EmotionModule
+    weights, once before forking. The workers then map the same physical pages
+    copy-on-write instead of each loading a private copy. The model is only written during
+    loading, so the pages stay shared for the life of the workers. Check the per-worker
+    unique memory with `python -m app.scripts.memory_report`.
+
+    Environment variables:
+        WEB_CONCURRENCY:  Number of workers (default 4)
+        GUNICORN_BIND:    Bind address (default 0.0.0.0:8000)
+        GUNICORN_PRELOAD: auto (default), True or False. auto preloads unless a CUDA GPU is
+                          present, CUDA cannot be used in a process forked after it was initialized
+"""
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+pidfile = os.getenv("GUNICORN_PIDFILE", "/tmp/gunicorn.pid")
+
+
+def _preload() -> bool:
+    preload = os.getenv("GUNICORN_PRELOAD", "auto")
+    if preload != "auto":
+        return preload != "False"
+    if os.getenv("EMOTION_INFERENCE_MODE") == "remote":
+        # The model lives in the inference server, the web workers never import torch
+        return True
+    # Ask NVML instead of initializing CUDA in the master
+    os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+    import torch
+    return not torch.cuda.is_available()
+
+
+preload_app = _preload()
+
+
+def when_ready(server):
+    """The app is loaded in the master (with preload_app), the workers are about to be forked"""
+    if preload_app:
+        # Move everything loaded so far out of the garbage collector's generations, so collections
+        # in the workers do not write to (and thereby un-share) the pages of the preloaded objects
+        gc.freeze()
+
+    from app.utils.memory_utils import process_memory
+    server.log.info(f"Master ready (preload_app={preload_app}), memory: {process_memory()}")
+
+
+def post_fork(server, worker):
+    """Split the CPU cores between the workers instead of every worker using all of them"""
+    torch = sys.modules.get("torch")
+    if torch is not None and "OMP_NUM_THREADS" not in os.environ:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // server.cfg.workers))
+
+
+def post_worker_init(worker):
+    from app.utils.memory_utils import process_memory
+    worker.log.info(f"Worker {worker.pid} initialized, memory: {process_memory()}")